@@ -0,0 +1,833 @@
+"""A local emulator of the Azure endpoints used by the deployment, for the benchmarks.
+
+It serves, over plain HTTP and from a single port:
+
+- the Azure Resource Manager endpoints of `services/*`: resource groups, the listing of a
+  resource group, the provider resources (created by long-running operations of configurable
+  latency), their child resources, name availability checks and key listings,
+- the IoT Hub registry endpoints: devices, twins, twin queries, bulk device operations, the
+  registry statistics and the scheduled twin update jobs, which complete at once,
+- the Cosmos DB database account, database and container endpoints.
+
+Run the tool against it with `--arm-endpoint http://127.0.0.1:<port>`. The IoT Hubs and Cosmos
+DB accounts it creates point their host names back to the emulator itself. Everything is kept
+in memory and any token or key is accepted.
+"""
+import argparse
+import base64
+import collections
+import datetime
+import itertools
+import json
+import math
+import re
+import secrets
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DEFAULT_LRO_LATENCY = 2.0
+# The IoT Hub bulk registry operations take at most this many devices per request.
+MAX_BULK_DEVICES = 100
+DEFAULT_QUERY_PAGE_SIZE = 100
+# The device IDs of a `deviceId IN [...]` job query condition, the only condition evaluated.
+_CONDITION_DEVICE_ID = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+
+
+class Response:
+    def __init__(self, status: int, body: Any = None, headers: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+def _arm_error(status: int, code: str, message: str) -> Response:
+    return Response(status, {"error": {"code": code, "message": message}})
+
+
+def _registry_error(status: int, code: str, message: str) -> Response:
+    return Response(status, {"Message": f"ErrorCode:{code};{message}", "ExceptionMessage": ""})
+
+
+def _cosmos_error(status: int, code: str, message: str) -> Response:
+    return Response(status, {"code": code, "message": message})
+
+
+def _new_key() -> str:
+    return base64.b64encode(secrets.token_bytes(32)).decode("utf-8")
+
+
+def _new_etag() -> str:
+    return f'"{uuid.uuid4()}"'
+
+
+class _Resource:
+    def __init__(self, body: Dict[str, Any], ready_at: float):
+        self.body = body
+        self.ready_at = ready_at
+        self.keys = (_new_key(), _new_key())
+
+    def to_json(self) -> Dict[str, Any]:
+        body = dict(self.body)
+        body["properties"] = dict(body.get("properties") or {})
+        body["properties"]["provisioningState"] = "Succeeded" if time.time() >= self.ready_at else "Creating"
+        return body
+
+
+class EmulatorState:
+    """The in-memory contents of the emulated subscriptions, IoT Hubs and Cosmos DB accounts."""
+
+    def __init__(self, lro_latency: float):
+        self.lro_latency = lro_latency
+        self.lock = threading.Lock()
+        # Keyed by the lower case (subscription, resource group name).
+        self.resource_groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # Keyed by the lower case ARM resource ID.
+        self.resources: Dict[str, _Resource] = {}
+        # Operation ID to the time it completes at.
+        self.operations: Dict[str, float] = {}
+        # IoT Hub registry, shared by all the emulated hubs, keyed by device ID.
+        self.devices: Dict[str, Dict[str, Any]] = {}
+        self.twins: Dict[str, Dict[str, Any]] = {}
+        # Scheduled jobs, keyed by job ID.
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        # Cosmos DB, shared by all the emulated accounts: database ID to its container IDs.
+        self.databases: Dict[str, Dict[str, Any]] = {}
+        self.containers: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.request_counts: Dict[str, int] = collections.Counter()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def _read_body(self) -> Any:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";", 1)[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            data = b"".join(chunks)
+        else:
+            data = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not data:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        segments = [unquote(segment) for segment in url.path.split("/") if segment]
+        body = self._read_body()
+        emulator = self.server.emulator
+        if emulator.request_latency:
+            time.sleep(emulator.request_latency)
+        route, response = emulator.route(self.command, segments, parse_qs(url.query), self.headers, body)
+        with emulator.state.lock:
+            emulator.state.request_counts[route] += 1
+        data = b"" if response.body is None or self.command == "HEAD" else json.dumps(response.body).encode("utf-8")
+        self.send_response(response.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("x-ms-request-id", str(uuid.uuid4()))
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    do_GET = do_PUT = do_POST = do_PATCH = do_DELETE = do_HEAD = _handle
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    emulator: "Emulator"
+
+
+class Emulator:
+    """The emulator server, run in a background thread of the current process."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        lro_latency: float = DEFAULT_LRO_LATENCY,
+        request_latency: float = 0.0,
+    ):
+        self.state = EmulatorState(lro_latency)
+        self.request_latency = request_latency
+        self._server = _Server((host, port), _Handler)
+        self._server.emulator = self
+        self._thread: Optional[threading.Thread] = None
+        self._operation_ids = itertools.count(1)
+
+    @property
+    def netloc(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.netloc}"
+
+    def start(self) -> "Emulator":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def get_request_counts(self) -> Dict[str, int]:
+        with self.state.lock:
+            return dict(sorted(self.state.request_counts.items()))
+
+    def reset_request_counts(self):
+        with self.state.lock:
+            self.state.request_counts.clear()
+
+    def add_resource(
+        self,
+        azure_subscription_id: str,
+        resource_group_name: str,
+        resource_type: str,
+        name: str,
+        location: str = "North Europe",
+    ) -> Dict[str, Any]:
+        """Seed an already provisioned resource, with its resource group, e.g. an IoT Hub to onboard devices to."""
+        namespace, type_name = resource_type.split("/", 1)
+        with self.state.lock:
+            self._put_resource_group(azure_subscription_id, resource_group_name, {"location": location})
+            resource_id = (
+                f"/subscriptions/{azure_subscription_id}/resourceGroups/{resource_group_name}"
+                f"/providers/{namespace}/{type_name}/{name}"
+            )
+            resource = self._create_resource(resource_id, resource_type, name, {"location": location}, 0.0)
+            return resource.to_json()
+
+    def add_devices(self, device_ids: Iterable[str]):
+        """Seed devices registered before, e.g. by an earlier onboarding."""
+        with self.state.lock:
+            for device_id in device_ids:
+                self._put_device(device_id, {})
+
+    # Routing
+
+    def route(
+        self,
+        method: str,
+        segments: List[str],
+        query: Dict[str, List[str]],
+        headers: Any,
+        body: Any,
+    ) -> Tuple[str, Response]:
+        """Dispatch a request, returning the name of the route for the request counts and the response."""
+        lower = [segment.lower() for segment in segments]
+        head = lower[0] if lower else ""
+        if head == "subscriptions":
+            return self._route_arm(method, segments, lower, body)
+        if head == "operations" and len(lower) == 2:
+            return "arm GET operation", self._get_operation(segments[1])
+        if head == "providers":
+            return self._route_arm_global(method, segments, lower)
+        if head in ("devices", "twins", "statistics", "jobs"):
+            return self._route_registry(method, segments, lower, query, headers, body)
+        if head == "dbs" or (not lower and method == "GET"):
+            return self._route_cosmos(method, segments, lower, body)
+        return f"unknown {method}", _arm_error(404, "NotFound", f"No emulated endpoint for '/{'/'.join(segments)}'")
+
+    def _route_arm(self, method: str, segments: List[str], lower: List[str], body: Any) -> Tuple[str, Response]:
+        if len(lower) == 2:
+            return f"arm {method} subscription", _arm_error(404, "NotFound", "Subscription level listings are not emulated")
+        if lower[2] == "providers":
+            if lower[-1] == "checknameavailability" and method == "POST":
+                return "arm POST checkNameAvailability", self._check_name_availability(body)
+            return f"arm {method} provider", _arm_error(404, "NotFound", "Provider level listings are not emulated")
+        if lower[2] != "resourcegroups" or len(lower) < 4:
+            return f"arm {method} unknown", _arm_error(404, "NotFound", "Unknown management path")
+        azure_subscription_id, resource_group_name = segments[1], segments[3]
+        if len(lower) == 4:
+            return f"arm {method} resource group", self._resource_group(method, azure_subscription_id, resource_group_name, body)
+        with self.state.lock:
+            exists = (azure_subscription_id.lower(), resource_group_name.lower()) in self.state.resource_groups
+        if not exists:
+            return f"arm {method} resource", _arm_error(
+                404, "ResourceGroupNotFound", f"Resource group '{resource_group_name}' could not be found."
+            )
+        if len(lower) == 5 and lower[4] == "resources" and method == "GET":
+            return "arm GET resource group resources", self._list_resource_group(azure_subscription_id, resource_group_name)
+        if len(lower) < 8 or lower[4] != "providers":
+            return f"arm {method} unknown", _arm_error(404, "NotFound", "Unknown management path")
+        # Type and name pairs after the provider namespace, e.g. ['namespaces', 'ns', 'eventhubs', 'eh'].
+        rest = segments[6:]
+        resource_type = "/".join([segments[5]] + rest[0::2])
+        if len(rest) % 2 == 0:
+            return f"arm {method} {resource_type}", self._resource(method, segments, resource_type, body)
+        if method == "GET":
+            return f"arm GET {resource_type} list", self._list_children(segments)
+        # An action on a resource, e.g. 'Microsoft.Storage/storageAccounts/listKeys'.
+        return f"arm {method} {resource_type}", self._resource_action(segments)
+
+    def _route_arm_global(self, method: str, segments: List[str], lower: List[str]) -> Tuple[str, Response]:
+        # Cosmos DB checks the global uniqueness of the account names with a HEAD request.
+        if method == "HEAD" and len(lower) == 4 and lower[1:3] == ["microsoft.documentdb", "databaseaccountnames"]:
+            with self.state.lock:
+                exists = any(
+                    resource.body["type"].lower() == "microsoft.documentdb/databaseaccounts"
+                    and resource.body["name"].lower() == lower[3]
+                    for resource in self.state.resources.values()
+                )
+            return "arm HEAD databaseAccountNames", Response(200 if exists else 404)
+        return f"arm {method} unknown", _arm_error(404, "NotFound", "Unknown management path")
+
+    # Azure Resource Manager
+
+    def _put_resource_group(self, azure_subscription_id: str, resource_group_name: str, body: Any) -> Dict[str, Any]:
+        resource_group = {
+            "id": f"/subscriptions/{azure_subscription_id}/resourceGroups/{resource_group_name}",
+            "name": resource_group_name,
+            "type": "Microsoft.Resources/resourceGroups",
+            "location": (body or {}).get("location", "North Europe"),
+            "properties": {"provisioningState": "Succeeded"},
+        }
+        self.state.resource_groups[(azure_subscription_id.lower(), resource_group_name.lower())] = resource_group
+        return resource_group
+
+    def _resource_group(self, method: str, azure_subscription_id: str, resource_group_name: str, body: Any) -> Response:
+        key = (azure_subscription_id.lower(), resource_group_name.lower())
+        with self.state.lock:
+            resource_group = self.state.resource_groups.get(key)
+            if method == "PUT":
+                created = resource_group is None
+                return Response(201 if created else 200, self._put_resource_group(azure_subscription_id, resource_group_name, body))
+        if resource_group is None:
+            return _arm_error(404, "ResourceGroupNotFound", f"Resource group '{resource_group_name}' could not be found.")
+        if method == "HEAD":
+            return Response(204)
+        if method == "GET":
+            return Response(200, resource_group)
+        return _arm_error(405, "MethodNotAllowed", f"{method} is not emulated on resource groups")
+
+    def _list_resource_group(self, azure_subscription_id: str, resource_group_name: str) -> Response:
+        prefix = f"/subscriptions/{azure_subscription_id}/resourcegroups/{resource_group_name}/providers/".lower()
+        value = []
+        with self.state.lock:
+            for resource_id, resource in self.state.resources.items():
+                # Only the top level resources, i.e. 'Namespace/type/name', are listed.
+                if resource_id.startswith(prefix) and resource_id[len(prefix) :].count("/") == 2:
+                    body = resource.to_json()
+                    value.append(
+                        {
+                            "id": body["id"],
+                            "name": body["name"],
+                            "type": body["type"],
+                            "location": body.get("location"),
+                            "provisioningState": body["properties"]["provisioningState"],
+                        }
+                    )
+        return Response(200, {"value": value})
+
+    def _check_name_availability(self, body: Any) -> Response:
+        name = str((body or {}).get("name", "")).lower()
+        with self.state.lock:
+            taken = any(resource.body["name"].lower() == name for resource in self.state.resources.values())
+        return Response(
+            200,
+            {
+                "nameAvailable": not taken,
+                "reason": "AlreadyExists" if taken else None,
+                "message": f"The name '{name}' is already taken." if taken else None,
+            },
+        )
+
+    def _create_resource(
+        self,
+        resource_id: str,
+        resource_type: str,
+        name: str,
+        body: Dict[str, Any],
+        latency: float,
+    ) -> _Resource:
+        resource_body = dict(body)
+        resource_body.update({"id": resource_id, "name": name, "type": resource_type})
+        properties = dict(resource_body.get("properties") or {})
+        # Point the data planes of the resources back to the emulator.
+        type_lower = resource_type.lower()
+        if type_lower == "microsoft.devices/iothubs":
+            properties["hostName"] = self.netloc
+            properties["eventHubEndpoints"] = {
+                "events": {
+                    "endpoint": f"sb://{name.lower()}.servicebus.emulator/",
+                    "path": name.lower(),
+                    "partitionCount": 2,
+                    "retentionTimeInDays": 1,
+                    "partitionIds": ["0", "1"],
+                }
+            }
+        elif type_lower == "microsoft.documentdb/databaseaccounts":
+            properties["documentEndpoint"] = f"{self.url}/"
+        elif type_lower == "microsoft.storage/storageaccounts":
+            properties["primaryEndpoints"] = {service: f"{self.url}/{service}/" for service in ("blob", "queue", "table", "file")}
+        elif type_lower == "microsoft.keyvault/vaults":
+            properties["vaultUri"] = f"{self.url}/vaults/{name}/"
+        elif type_lower == "microsoft.web/sites":
+            properties["defaultHostName"] = f"{name}.azurewebsites.emulator"
+        resource_body["properties"] = properties
+        resource = self.state.resources.get(resource_id.lower())
+        if resource is None:
+            resource = self.state.resources[resource_id.lower()] = _Resource(resource_body, time.time() + latency)
+        else:
+            resource.body = resource_body
+            resource.ready_at = time.time() + latency
+        return resource
+
+    def _resource(self, method: str, segments: List[str], resource_type: str, body: Any) -> Response:
+        resource_id = "/" + "/".join(segments)
+        with self.state.lock:
+            resource = self.state.resources.get(resource_id.lower())
+            if method == "PUT":
+                # Child resources (e.g. event hubs, network rule sets) are created right away,
+                # the top level ones by a long-running operation.
+                is_top_level = len(segments) == 8
+                latency = self.state.lro_latency if is_top_level else 0.0
+                resource = self._create_resource(resource_id, resource_type, segments[-1], body or {}, latency)
+                if latency <= 0:
+                    return Response(200, resource.to_json())
+                operation_id = str(next(self._operation_ids))
+                self.state.operations[operation_id] = resource.ready_at
+                return Response(
+                    # Every management client of the deployment accepts a 200 for its create operations.
+                    200,
+                    resource.to_json(),
+                    {
+                        "Azure-AsyncOperation": f"{self.url}/operations/{operation_id}",
+                        "Retry-After": self._retry_after(resource.ready_at),
+                    },
+                )
+            if resource is None:
+                return _arm_error(404, "ResourceNotFound", f"The Resource '{resource_type}/{segments[-1]}' was not found.")
+            if method == "GET":
+                return Response(200, resource.to_json())
+            if method == "PATCH":
+                resource.body.update({key: value for key, value in (body or {}).items() if key != "properties"})
+                resource.body.setdefault("properties", {}).update((body or {}).get("properties") or {})
+                return Response(200, resource.to_json())
+            if method == "DELETE":
+                prefix = resource_id.lower()
+                for child_id in [key for key in self.state.resources if key == prefix or key.startswith(prefix + "/")]:
+                    del self.state.resources[child_id]
+                return Response(200)
+        return _arm_error(405, "MethodNotAllowed", f"{method} is not emulated on resources")
+
+    @staticmethod
+    def _retry_after(ready_at: float) -> str:
+        # Whole seconds: the msrest pollers parse the header as an integer, and the azure-core
+        # ones fall back to their 30 seconds default for a 0.
+        return str(max(1, math.ceil(ready_at - time.time())))
+
+    def _get_operation(self, operation_id: str) -> Response:
+        with self.state.lock:
+            ready_at = self.state.operations.get(operation_id)
+        if ready_at is None:
+            return _arm_error(404, "NotFound", f"Operation '{operation_id}' was not found.")
+        if time.time() < ready_at:
+            return Response(200, {"status": "InProgress"}, {"Retry-After": self._retry_after(ready_at)})
+        return Response(200, {"status": "Succeeded"})
+
+    def _list_children(self, segments: List[str]) -> Response:
+        prefix = "/" + "/".join(segments).lower() + "/"
+        with self.state.lock:
+            value = [
+                resource.to_json()
+                for resource_id, resource in self.state.resources.items()
+                if resource_id.startswith(prefix) and "/" not in resource_id[len(prefix) :]
+            ]
+        return Response(200, {"value": value})
+
+    def _resource_action(self, segments: List[str]) -> Response:
+        # The action is the last segment, on the top level resource of the first 8 segments,
+        # e.g. '.../IotHubs/{name}/IotHubKeys/{key name}/listkeys'.
+        with self.state.lock:
+            resource = self.state.resources.get("/" + "/".join(segments[:8]).lower())
+        if resource is None:
+            return _arm_error(404, "ResourceNotFound", f"The Resource '{segments[7]}' was not found.")
+        action = segments[-1].lower()
+        resource_type = resource.body["type"].lower()
+        primary_key, secondary_key = resource.keys
+        if action == "listkeys" and resource_type == "microsoft.storage/storageaccounts":
+            return Response(
+                200,
+                {
+                    "keys": [
+                        {"keyName": "key1", "value": primary_key, "permissions": "FULL"},
+                        {"keyName": "key2", "value": secondary_key, "permissions": "FULL"},
+                    ]
+                },
+            )
+        if action == "listkeys" and resource_type == "microsoft.documentdb/databaseaccounts":
+            return Response(
+                200,
+                {
+                    "primaryMasterKey": primary_key,
+                    "secondaryMasterKey": secondary_key,
+                    "primaryReadonlyMasterKey": primary_key,
+                    "secondaryReadonlyMasterKey": secondary_key,
+                },
+            )
+        if action == "listkeys":
+            # IoT Hub, Event Hub and Service Bus authorization rules.
+            key_name = segments[-2] if len(segments) > 9 else "owner"
+            return Response(
+                200,
+                {
+                    "keyName": key_name,
+                    "primaryKey": primary_key,
+                    "secondaryKey": secondary_key,
+                    "rights": "RegistryRead, RegistryWrite, ServiceConnect, DeviceConnect",
+                    "primaryConnectionString": f"Endpoint=sb://emulator/;SharedAccessKeyName={key_name};SharedAccessKey={primary_key}",
+                    "secondaryConnectionString": f"Endpoint=sb://emulator/;SharedAccessKeyName={key_name};SharedAccessKey={secondary_key}",
+                },
+            )
+        if action == "list" and segments[-2].lower() == "publishingcredentials":
+            user_name = f"${resource.body['name']}"
+            return Response(
+                200,
+                {
+                    "name": resource.body["name"],
+                    "properties": {
+                        "publishingUserName": user_name,
+                        "publishingPassword": primary_key,
+                        "scmUri": f"{self.url}/scm/{resource.body['name']}",
+                    },
+                },
+            )
+        return Response(200, {})
+
+    # IoT Hub registry
+
+    def _route_registry(
+        self,
+        method: str,
+        segments: List[str],
+        lower: List[str],
+        query: Dict[str, List[str]],
+        headers: Any,
+        body: Any,
+    ) -> Tuple[str, Response]:
+        if lower == ["devices"] and method == "POST":
+            return "registry POST devices (bulk)", self._bulk_devices(body)
+        if lower == ["devices", "query"] and method == "POST":
+            return "registry POST devices/query", self._query_twins(headers)
+        if lower == ["statistics", "devices"] and method == "GET":
+            return "registry GET statistics/devices", self._device_statistics()
+        if len(lower) == 3 and lower[:2] == ["jobs", "v2"]:
+            return f"registry {method} job", self._scheduled_job(method, segments[2], body)
+        if len(lower) == 2 and lower[0] == "devices":
+            return f"registry {method} device", self._device(method, segments[1], headers, body)
+        if len(lower) == 2 and lower[0] == "twins":
+            return f"registry {method} twin", self._twin(method, segments[1], body)
+        return f"registry {method} unknown", _registry_error(404, "NotFound", "Unknown registry path")
+
+    def _put_device(self, device_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        authentication = body.get("authentication") or {"type": "sas"}
+        if authentication.get("type", "sas") == "sas":
+            symmetric_key = dict(authentication.get("symmetricKey") or {})
+            symmetric_key["primaryKey"] = symmetric_key.get("primaryKey") or _new_key()
+            symmetric_key["secondaryKey"] = symmetric_key.get("secondaryKey") or _new_key()
+            authentication = {**authentication, "type": "sas", "symmetricKey": symmetric_key}
+        device = self.state.devices.get(device_id)
+        device = {
+            "deviceId": device_id,
+            "generationId": device["generationId"] if device else str(next(self._operation_ids)),
+            "etag": _new_etag(),
+            "status": body.get("status") or "enabled",
+            "connectionState": "Disconnected",
+            "cloudToDeviceMessageCount": 0,
+            "authentication": authentication,
+            "capabilities": body.get("capabilities") or {"iotEdge": False},
+        }
+        self.state.devices[device_id] = device
+        twin = self.state.twins.setdefault(
+            device_id,
+            {"deviceId": device_id, "version": 1, "tags": {}, "properties": {"desired": {}, "reported": {}}},
+        )
+        twin.update({"etag": _new_etag(), "status": device["status"], "capabilities": device["capabilities"]})
+        return device
+
+    def _delete_device(self, device_id: str):
+        self.state.devices.pop(device_id, None)
+        self.state.twins.pop(device_id, None)
+
+    def _device(self, method: str, device_id: str, headers: Any, body: Any) -> Response:
+        with self.state.lock:
+            device = self.state.devices.get(device_id)
+            if method == "PUT":
+                if device is not None and not headers.get("If-Match"):
+                    return _registry_error(409, "DeviceAlreadyExists", f"A device with ID '{device_id}' is already registered.")
+                return Response(200, self._put_device(device_id, body or {}))
+            if device is None:
+                return _registry_error(404, "DeviceNotFound", f"Device '{device_id}' is not registered.")
+            if method == "GET":
+                return Response(200, device)
+            if method == "DELETE":
+                self._delete_device(device_id)
+                return Response(204)
+        return _registry_error(405, "MethodNotAllowed", f"{method} is not emulated on devices")
+
+    def _update_twin(self, twin: Dict[str, Any], patch: Dict[str, Any], replace: bool):
+        if replace:
+            twin["tags"] = dict(patch.get("tags") or {})
+            twin["properties"]["desired"] = dict((patch.get("properties") or {}).get("desired") or {})
+        else:
+            for key, value in (patch.get("tags") or {}).items():
+                if value is None:
+                    twin["tags"].pop(key, None)
+                else:
+                    twin["tags"][key] = value
+            twin["properties"]["desired"].update((patch.get("properties") or {}).get("desired") or {})
+        twin["version"] += 1
+        twin["etag"] = _new_etag()
+
+    def _twin(self, method: str, device_id: str, body: Any) -> Response:
+        with self.state.lock:
+            twin = self.state.twins.get(device_id)
+            if twin is None:
+                return _registry_error(404, "DeviceNotFound", f"Device '{device_id}' is not registered.")
+            if method in ("PATCH", "PUT"):
+                self._update_twin(twin, body or {}, method == "PUT")
+            elif method != "GET":
+                return _registry_error(405, "MethodNotAllowed", f"{method} is not emulated on twins")
+            return Response(200, twin)
+
+    def _scheduled_job(self, method: str, job_id: str, body: Any) -> Response:
+        with self.state.lock:
+            if method == "GET":
+                job = self.state.jobs.get(job_id)
+                if job is None:
+                    return _registry_error(404, "JobNotFound", f"Job '{job_id}' was not found.")
+                return Response(200, job)
+            if method != "PUT":
+                return _registry_error(405, "MethodNotAllowed", f"{method} is not emulated on jobs")
+            body = body or {}
+            if body.get("type") != "scheduleUpdateTwin":
+                return _registry_error(400, "ArgumentInvalid", "Only scheduleUpdateTwin jobs are emulated.")
+            condition = body.get("queryCondition") or ""
+            if condition.replace(" ", "").lower().startswith("deviceidin["):
+                device_ids = [single or double for single, double in _CONDITION_DEVICE_ID.findall(condition)]
+            else:
+                device_ids = list(self.state.twins)
+            twins = [self.state.twins[device_id] for device_id in device_ids if device_id in self.state.twins]
+            for twin in twins:
+                self._update_twin(twin, body.get("updateTwin") or {}, False)
+            now = datetime.datetime.utcnow().isoformat() + "Z"
+            job = {
+                "jobId": job_id,
+                "type": "scheduleUpdateTwin",
+                "status": "completed",
+                "queryCondition": condition,
+                "createdTime": now,
+                "startTime": now,
+                "endTime": now,
+                "deviceJobStatistics": {
+                    "deviceCount": len(twins),
+                    "succeededCount": len(twins),
+                    "failedCount": 0,
+                    "runningCount": 0,
+                    "pendingCount": 0,
+                },
+            }
+            self.state.jobs[job_id] = job
+            return Response(200, job)
+
+    def _device_statistics(self) -> Response:
+        with self.state.lock:
+            enabled_count = sum(device["status"] == "enabled" for device in self.state.devices.values())
+            total_count = len(self.state.devices)
+        return Response(
+            200,
+            {
+                "totalDeviceCount": total_count,
+                "enabledDeviceCount": enabled_count,
+                "disabledDeviceCount": total_count - enabled_count,
+            },
+        )
+
+    def _query_twins(self, headers: Any) -> Response:
+        # The query itself is not evaluated: all twins are returned, in pages.
+        page_size = int(headers.get("x-ms-max-item-count") or DEFAULT_QUERY_PAGE_SIZE)
+        start = int(headers.get("x-ms-continuation") or 0)
+        with self.state.lock:
+            twins = list(self.state.twins.values())
+        response_headers = {"x-ms-item-type": "twin"}
+        if start + page_size < len(twins):
+            response_headers["x-ms-continuation"] = str(start + page_size)
+        return Response(200, twins[start : start + page_size], response_headers)
+
+    def _bulk_devices(self, body: Any) -> Response:
+        devices = body or []
+        if len(devices) > MAX_BULK_DEVICES:
+            return _registry_error(400, "TooManyDevices", f"At most {MAX_BULK_DEVICES} devices per bulk operation.")
+        errors = []
+        with self.state.lock:
+            for device in devices:
+                device_id = device.get("id")
+                mode = (device.get("importMode") or "createOrUpdate").lower()
+                exists = device_id in self.state.devices
+                if mode == "create" and exists:
+                    errors.append(
+                        {
+                            "deviceId": device_id,
+                            "errorCode": "DeviceAlreadyExists",
+                            "errorStatus": f"A device with ID '{device_id}' is already registered.",
+                        }
+                    )
+                elif mode.startswith("delete"):
+                    self._delete_device(device_id)
+                elif mode.startswith("updatetwin"):
+                    if not exists:
+                        errors.append({"deviceId": device_id, "errorCode": "DeviceNotFound", "errorStatus": "Not registered."})
+                    else:
+                        self._update_twin(self.state.twins[device_id], device, False)
+                else:
+                    self._put_device(device_id, device)
+                    if device.get("tags") or device.get("properties"):
+                        self._update_twin(self.state.twins[device_id], device, False)
+        return Response(200 if not errors else 400, {"isSuccessful": not errors, "errors": errors, "warnings": []})
+
+    # Cosmos DB
+
+    def _route_cosmos(self, method: str, segments: List[str], lower: List[str], body: Any) -> Tuple[str, Response]:
+        if not lower:
+            return "cosmos GET account", Response(200, self._database_account())
+        with self.state.lock:
+            if len(lower) == 1:
+                return f"cosmos {method} dbs", self._collection(method, self.state.databases, "Databases", body, "dbs")
+            database_id = segments[1]
+            if database_id not in self.state.databases:
+                return f"cosmos {method} db", _cosmos_error(404, "NotFound", f"Database '{database_id}' does not exist.")
+            containers = self.state.containers[database_id]
+            if len(lower) == 2:
+                return f"cosmos {method} db", self._item(method, self.state.databases, database_id, body)
+            if lower[2] != "colls":
+                return f"cosmos {method} unknown", _cosmos_error(404, "NotFound", "Unknown Cosmos DB path")
+            if len(lower) == 3:
+                return f"cosmos {method} colls", self._collection(
+                    method, containers, "DocumentCollections", body, f"dbs/{database_id}/colls"
+                )
+            if len(lower) == 4:
+                return f"cosmos {method} coll", self._item(method, containers, segments[3], body)
+        return f"cosmos {method} unknown", _cosmos_error(404, "NotFound", "Unknown Cosmos DB path")
+
+    def _database_account(self) -> Dict[str, Any]:
+        location = {"name": "Emulator", "databaseAccountEndpoint": f"{self.url}/"}
+        return {
+            "_self": "",
+            "id": "emulator",
+            "_rid": "emulator",
+            "media": "//media/",
+            "addresses": "//addresses/",
+            "_dbs": "//dbs/",
+            "writableLocations": [location],
+            "readableLocations": [location],
+            "enableMultipleWriteLocations": False,
+            "userReplicationPolicy": {"asyncReplication": False, "minReplicaSetSize": 1, "maxReplicasetSize": 4},
+            "userConsistencyPolicy": {"defaultConsistencyLevel": "Session"},
+            "systemReplicationPolicy": {"minReplicaSetSize": 1, "maxReplicasetSize": 4},
+            "readPolicy": {"primaryReadCoefficient": 1, "secondaryReadCoefficient": 1},
+            "queryEngineConfiguration": "{}",
+        }
+
+    def _collection(
+        self,
+        method: str,
+        items: Dict[str, Dict[str, Any]],
+        list_key: str,
+        body: Any,
+        self_link: str,
+    ) -> Response:
+        if method == "GET":
+            return Response(200, {"_rid": "", list_key: list(items.values()), "_count": len(items)})
+        if method != "POST":
+            return _cosmos_error(405, "MethodNotAllowed", f"{method} is not emulated")
+        item_id = (body or {}).get("id")
+        if item_id in items:
+            return _cosmos_error(409, "Conflict", "Resource with specified id or name already exists.")
+        item = dict(body or {})
+        item.update(
+            {
+                "_rid": base64.b64encode(item_id.encode("utf-8")).decode("utf-8"),
+                "_self": f"{self_link}/{item_id}/",
+                "_etag": _new_etag(),
+                "_ts": int(time.time()),
+            }
+        )
+        if list_key == "Databases":
+            item.update({"_colls": "colls/", "_users": "users/"})
+            self.state.containers[item_id] = {}
+        else:
+            item.setdefault("indexingPolicy", {"indexingMode": "consistent", "automatic": True})
+            item.update({"_docs": "docs/", "_sprocs": "sprocs/", "_triggers": "triggers/", "_udfs": "udfs/"})
+        items[item_id] = item
+        return Response(201, item, {"etag": item["_etag"], "x-ms-request-charge": "1.0"})
+
+    def _item(self, method: str, items: Dict[str, Dict[str, Any]], item_id: str, body: Any) -> Response:
+        item = items.get(item_id)
+        if item is None:
+            return _cosmos_error(404, "NotFound", f"Resource '{item_id}' does not exist.")
+        if method == "GET":
+            return Response(200, item, {"etag": item["_etag"], "x-ms-request-charge": "1.0"})
+        if method == "PUT":
+            item.update({key: value for key, value in (body or {}).items() if not key.startswith("_")})
+            item["_etag"] = _new_etag()
+            return Response(200, item, {"etag": item["_etag"], "x-ms-request-charge": "1.0"})
+        if method == "DELETE":
+            del items[item_id]
+            if items is self.state.databases:
+                del self.state.containers[item_id]
+            return Response(204)
+        return _cosmos_error(405, "MethodNotAllowed", f"{method} is not emulated")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on.")
+    parser.add_argument(
+        "--lro-latency",
+        type=float,
+        default=DEFAULT_LRO_LATENCY,
+        help="Seconds the long-running creation of a top level resource takes.",
+    )
+    parser.add_argument(
+        "--request-latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to every request, to model the round trip to Azure.",
+    )
+    args = parser.parse_args()
+    emulator = Emulator(args.host, args.port, args.lro_latency, args.request_latency)
+    print(f"Emulating Azure on {emulator.url}, use '--arm-endpoint {emulator.url}'")
+    try:
+        emulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""End-to-end benchmarks of the deployment against the local emulator.
+
+Times 'deploy vanilla', 'deploy' and 'onboard' with generated device ID files of each given
+size, every run against a fresh emulator, and reports their wall time, the requests they sent
+and their peak RSS. 'onboard-rerun' onboards the devices to a hub that has 99% of them already. Run from the repository root:
+
+    python -m benchmarks.run --devices 1000 10000 --out results.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from benchmarks.emulator import DEFAULT_LRO_LATENCY, Emulator
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("deploy-vanilla", "deploy", "onboard", "onboard-rerun")
+# Share of the devices of the "onboard-rerun" scenario registered by an earlier run.
+RERUN_REGISTERED_SHARE = 0.99
+DEFAULT_DEVICE_COUNTS = (1000, 10000, 100000)
+AZURE_SUBSCRIPTION_ID = "00000000-0000-0000-0000-000000000000"
+TENANT_ID = "00000000-0000-0000-0000-000000000000"
+RESOURCE_GROUP_NAME = "benchmark"
+IOT_HUB_NAME = "iot-hub-benchmark"
+# The default names with their random postfix are longer than the 24 characters allowed to these two.
+STORAGE_ACC_NAME = "storagebenchmark"
+KEY_VAULT_NAME = "keyvault-benchmark"
+
+
+def _write_device_ids(path: str, device_count: int):
+    with open(path, "w") as f:
+        for i in range(device_count):
+            f.write(f"device-{i:06d}\n")
+
+
+def _get_argv(scenario: str, emulator: Emulator, run_dir: str, device_ids_path: str, args: argparse.Namespace) -> List[str]:
+    common = [
+        "--azure-subscription-id",
+        AZURE_SUBSCRIPTION_ID,
+        "--resource-group-name",
+        RESOURCE_GROUP_NAME,
+        "--iot-hub-name",
+        IOT_HUB_NAME,
+        "--device-ids-file-path",
+        device_ids_path,
+        "--arm-endpoint",
+        emulator.url,
+        "--metrics-out",
+        os.path.join(run_dir, "metrics.json"),
+        "--logging-level",
+        "WARNING",
+        # The emulator does not throttle, the IoT Hub default rate is the limit of a real S1 unit.
+        "--iot-hub-rate",
+        "0",
+        "--iot-hub-query-rate",
+        "0",
+    ]
+    if scenario.startswith("onboard"):
+        return ["onboard"] + common
+    vendor_credentials_path = os.path.join(run_dir, "vendor-credentials.json")
+    with open(vendor_credentials_path, "w") as f:
+        json.dump({}, f)
+    deploy_args = common + [
+        "--vendor-credentials-path",
+        vendor_credentials_path,
+        "--state-dir",
+        os.path.join(run_dir, "state"),
+        "--storage-acc-name",
+        STORAGE_ACC_NAME,
+    ]
+    if args.use_async:
+        deploy_args.append("--async")
+    if scenario == "deploy-vanilla":
+        return ["deploy", "vanilla"] + deploy_args
+    return (
+        ["deploy"]
+        + deploy_args
+        + ["--tenant-id", TENANT_ID, "--service-hostname", "benchmark.emulator", "--key-vault-name", KEY_VAULT_NAME]
+    )
+
+
+def _get_peak_rss_mb(rusage: Any) -> float:
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS.
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return rusage.ru_maxrss / divisor
+
+
+def _get_client_calls(metrics_path: str) -> int:
+    if not os.path.isfile(metrics_path):
+        return 0
+    with open(metrics_path, "r") as f:
+        return sum(endpoint["calls"] for endpoint in json.load(f)["endpoints"].values())
+
+
+def run_scenario(scenario: str, device_count: int, args: argparse.Namespace) -> Dict[str, Any]:
+    run_dir = tempfile.mkdtemp(prefix=f"bench-{scenario}-{device_count}-")
+    emulator = Emulator(lro_latency=args.lro_latency, request_latency=args.request_latency).start()
+    try:
+        if scenario.startswith("onboard"):
+            emulator.add_resource(AZURE_SUBSCRIPTION_ID, RESOURCE_GROUP_NAME, "Microsoft.Devices/IotHubs", IOT_HUB_NAME)
+        device_ids_path = os.path.join(run_dir, "device-ids.txt")
+        _write_device_ids(device_ids_path, device_count)
+        if scenario == "onboard-rerun":
+            emulator.add_devices(f"device-{i:06d}" for i in range(int(device_count * RERUN_REGISTERED_SHARE)))
+        argv = [sys.executable, os.path.join(REPO_ROOT, "main.py")] + _get_argv(
+            scenario, emulator, run_dir, device_ids_path, args
+        )
+        log_path = os.path.join(run_dir, "output.log")
+        with open(log_path, "w") as log:
+            start = time.perf_counter()
+            process = subprocess.Popen(argv, cwd=REPO_ROOT, stdout=log, stderr=subprocess.STDOUT)
+            # Unlike getrusage(RUSAGE_CHILDREN), wait4 reports the resource usage of this child only.
+            _, status, rusage = os.wait4(process.pid, 0)
+            wall_time = time.perf_counter() - start
+        process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        request_counts = emulator.get_request_counts()
+        result = {
+            "scenario": scenario,
+            "devices": device_count,
+            "exit_code": process.returncode,
+            "wall_time_s": round(wall_time, 3),
+            "requests": sum(request_counts.values()),
+            "client_calls": _get_client_calls(os.path.join(run_dir, "metrics.json")),
+            "peak_rss_mb": round(_get_peak_rss_mb(rusage), 1),
+            "requests_by_route": request_counts,
+        }
+        if process.returncode != 0:
+            with open(log_path, "r") as f:
+                result["output_tail"] = f.read()[-2000:]
+        return result
+    finally:
+        emulator.stop()
+        if not args.keep_runs:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def _print_results(results: List[Dict[str, Any]]):
+    rows = [["Scenario", "Devices", "Exit", "Wall s", "Requests", "Req/s", "Peak RSS MB"]]
+    for result in results:
+        rows.append(
+            [
+                result["scenario"],
+                str(result["devices"]),
+                str(result["exit_code"]),
+                f"{result['wall_time_s']:.2f}",
+                str(result["requests"]),
+                f"{result['requests'] / max(result['wall_time_s'], 1e-9):.0f}",
+                f"{result['peak_rss_mb']:.1f}",
+            ]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+    for result in results:
+        if "output_tail" in result:
+            print(f"\n{result['scenario']} with {result['devices']} devices failed:\n{result['output_tail']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="Scenarios to run.")
+    parser.add_argument(
+        "--devices",
+        nargs="+",
+        type=int,
+        default=list(DEFAULT_DEVICE_COUNTS),
+        help="Numbers of device IDs to run every scenario with.",
+    )
+    parser.add_argument(
+        "--lro-latency",
+        type=float,
+        default=DEFAULT_LRO_LATENCY,
+        help="Seconds the emulated long-running creation of a resource takes.",
+    )
+    parser.add_argument(
+        "--request-latency",
+        type=float,
+        default=0.0,
+        help="Seconds the emulator adds to every request, to model the round trip to Azure.",
+    )
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run the deployments with '--async'.")
+    parser.add_argument("--keep-runs", action="store_true", help="Keep the folders of the runs, with their logs.")
+    parser.add_argument("--out", type=str, default=None, help="Path of a JSON file to write the results to.")
+    args = parser.parse_args()
+
+    results = []
+    for device_count in args.devices:
+        for scenario in args.scenarios:
+            results.append(run_scenario(scenario, device_count, args))
+    _print_results(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if any(result["exit_code"] != 0 for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Startup time regression check of the command line.
+
+Runs the tool with `python -X importtime` and fails if a command imports more than its budget
+(in milliseconds of import time) or any module it should not load at all, e.g. the management
+SDKs of the deployment for `onboard`. Run from the repository root:
+
+    python -m benchmarks.startup
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, NamedTuple, Tuple
+
+from benchmarks.emulator import Emulator
+from benchmarks.run import AZURE_SUBSCRIPTION_ID, IOT_HUB_NAME, REPO_ROOT, RESOURCE_GROUP_NAME
+
+# Nothing beyond the argument parsers is needed to print the help.
+HELP_FORBIDDEN = ("azure", "msrest", "requests", "aiohttp", "git", "cryptography")
+# Onboarding only needs the IoT Hub registry and the IoT Hub management client.
+ONBOARD_FORBIDDEN = (
+    "aiohttp",
+    "git",
+    "azure.cosmos",
+    "azure.mgmt.cosmosdb",
+    "azure.mgmt.eventhub",
+    "azure.mgmt.keyvault",
+    "azure.mgmt.servicebus",
+    "azure.mgmt.signalr",
+    "azure.mgmt.storage",
+    "azure.mgmt.web",
+    "services.aio",
+)
+
+
+class Check(NamedTuple):
+    name: str
+    argv: List[str]
+    budget_ms: float
+    forbidden: Tuple[str, ...]
+
+
+def get_import_times(argv: List[str]) -> Tuple[int, Dict[str, float]]:
+    """Exit code of the command and self import time in milliseconds of every module it imported."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(REPO_ROOT, "main.py")] + argv,
+        cwd=REPO_ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    import_times = {}
+    for line in process.stderr.splitlines():
+        # e.g. 'import time:       245 |      84658 |   parsers.main_parser'
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, module = line[len("import time:") :].split("|", 2)
+        if self_us.strip().isdigit():
+            import_times[module.strip()] = int(self_us) / 1000
+    return process.returncode, import_times
+
+
+def run_check(check: Check) -> List[str]:
+    exit_code, import_times = get_import_times(check.argv)
+    total_ms = sum(import_times.values())
+    forbidden = sorted(
+        module
+        for module in import_times
+        if any(module == prefix or module.startswith(prefix + ".") for prefix in check.forbidden)
+    )
+    print(f"{check.name}: {total_ms:.0f} ms of imports (budget {check.budget_ms:.0f} ms), {len(import_times)} modules")
+    failures = []
+    if exit_code != 0:
+        failures.append(f"{check.name} exited with {exit_code}, its imports are incomplete")
+    if total_ms > check.budget_ms:
+        slowest = sorted(import_times.items(), key=lambda item: item[1], reverse=True)[:10]
+        failures.append(
+            f"{check.name} is over its budget, slowest imports: "
+            + ", ".join(f"{module} ({ms:.1f} ms)" for module, ms in slowest)
+        )
+    if forbidden:
+        failures.append(f"{check.name} imports {', '.join(forbidden)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--help-budget-ms", type=float, default=150, help="Import time budget of '--help'.")
+    parser.add_argument("--onboard-budget-ms", type=float, default=1500, help="Import time budget of 'onboard'.")
+    args = parser.parse_args()
+
+    emulator = Emulator().start()
+    emulator.add_resource(AZURE_SUBSCRIPTION_ID, RESOURCE_GROUP_NAME, "Microsoft.Devices/IotHubs", IOT_HUB_NAME)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            device_ids_path = os.path.join(tmp_dir, "device-ids.txt")
+            with open(device_ids_path, "w") as f:
+                f.write("device-000000\n")
+            checks = [
+                Check("--help", ["--help"], args.help_budget_ms, HELP_FORBIDDEN),
+                Check("deploy --help", ["deploy", "--help"], args.help_budget_ms, HELP_FORBIDDEN),
+                Check("onboard --help", ["onboard", "--help"], args.help_budget_ms, HELP_FORBIDDEN),
+                Check(
+                    "onboard",
+                    [
+                        "onboard",
+                        "--azure-subscription-id",
+                        AZURE_SUBSCRIPTION_ID,
+                        "--resource-group-name",
+                        RESOURCE_GROUP_NAME,
+                        "--iot-hub-name",
+                        IOT_HUB_NAME,
+                        "--device-ids-file-path",
+                        device_ids_path,
+                        "--arm-endpoint",
+                        emulator.url,
+                    ],
+                    args.onboard_budget_ms,
+                    ONBOARD_FORBIDDEN,
+                ),
+            ]
+            failures = [failure for check in checks for failure in run_check(check)]
+    finally:
+        emulator.stop()
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Request charge of the telemetry writes, with the indexing policies of the containers before and after.
+
+Writes sample documents of every vendor to two containers of a scratch database of a Cosmos DB
+account: one indexing every path, as the containers used to, and one with the indexing policy of
+`cosmosdb.get_vendor_containers`. The samples are the latest documents of the vendor containers
+of the `iot` database, or the JSON lines of `--samples-path`, grouped by their `deviceVendor`.
+The scratch database is deleted at the end. Run from the repository root:
+
+    python -m benchmarks.write_cost --document-endpoint https://<account>.documents.azure.com:443/
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from azure.cosmos import ContainerProxy, CosmosClient, DatabaseProxy
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+from services import cosmosdb
+
+MASTER_KEY_ENV_VAR = "COSMOSDB_MASTER_KEY"
+DEFAULT_SAMPLE_COUNT = 100
+# Indexing policy of the containers before the per-vendor ones.
+INDEX_ALL_POLICY = {"automatic": True}
+# Properties the service adds to the documents, written anew by the measurement.
+SYSTEM_PROPERTIES = ("id", "_rid", "_self", "_etag", "_attachments", "_ts")
+
+
+def read_samples(cosmos_client: CosmosClient, vendor_names: List[str], count: int) -> Dict[str, List[Dict[str, Any]]]:
+    """The latest documents of the messages container of every vendor."""
+    db_proxy = cosmos_client.get_database_client(cosmosdb.COSMOSDB_DB_NAME)
+    samples = {}
+    for vendor_name in vendor_names:
+        try:
+            samples[vendor_name] = list(
+                db_proxy.get_container_client(vendor_name).query_items(
+                    f"SELECT TOP {count} * FROM c ORDER BY c.enqueuedTimeUtc DESC", enable_cross_partition_query=True
+                )
+            )
+        except CosmosResourceNotFoundError:
+            samples[vendor_name] = []
+    return samples
+
+
+def load_samples(path: str, vendor_names: List[str], count: int) -> Dict[str, List[Dict[str, Any]]]:
+    samples: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                document = json.loads(line)
+                vendor_name = document.get("deviceVendor")
+                if vendor_name in vendor_names and len(samples[vendor_name]) < count:
+                    samples[vendor_name].append(document)
+    return samples
+
+
+def write(container: ContainerProxy, document: Dict[str, Any]) -> float:
+    """Request units charged for the creation of the document."""
+    body = {key: value for key, value in document.items() if key not in SYSTEM_PROPERTIES}
+    body["id"] = str(uuid.uuid4())
+    container.create_item(body)
+    return float(container.client_connection.last_response_headers["x-ms-request-charge"])
+
+
+def measure(db_proxy: DatabaseProxy, vendor_name: str, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    spec = cosmosdb.get_vendor_containers(vendor_name)[0]
+    charges = {}
+    for name, indexing_policy in (("before", INDEX_ALL_POLICY), ("after", spec.indexing_policy)):
+        container_id = f"{vendor_name}_{name}"
+        container = db_proxy.create_container(container_id, spec.partition_key, indexing_policy=indexing_policy)
+        charges[name] = [write(container, document) for document in documents]
+    before, after = statistics.mean(charges["before"]), statistics.mean(charges["after"])
+    return {
+        "vendor": vendor_name,
+        "samples": len(documents),
+        "before_ru": before,
+        "after_ru": after,
+        "change": after / before - 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--document-endpoint", type=str, required=True, help="Document endpoint of the account.")
+    parser.add_argument(
+        "--master-key",
+        type=str,
+        default=os.environ.get(MASTER_KEY_ENV_VAR),
+        help=f"Master key of the account, '{MASTER_KEY_ENV_VAR}' environment variable by default.",
+    )
+    parser.add_argument(
+        "--vendors", nargs="+", choices=cosmosdb.VENDOR_NAMES, default=list(cosmosdb.VENDOR_NAMES), help="Vendors."
+    )
+    parser.add_argument(
+        "--sample-count", type=int, default=DEFAULT_SAMPLE_COUNT, help="Documents written per vendor and container."
+    )
+    parser.add_argument(
+        "--samples-path",
+        type=str,
+        default=None,
+        help="Path of a JSON lines file of sample documents, instead of the latest ones of the vendor containers.",
+    )
+    parser.add_argument("--out", type=str, default=None, help="Path of a JSON file to write the results to.")
+    args = parser.parse_args()
+    if not args.master_key:
+        parser.error(f"--master-key or '{MASTER_KEY_ENV_VAR}' is required")
+
+    cosmos_client = CosmosClient(args.document_endpoint, args.master_key)
+    if args.samples_path:
+        samples = load_samples(args.samples_path, args.vendors, args.sample_count)
+    else:
+        samples = read_samples(cosmos_client, args.vendors, args.sample_count)
+
+    db_proxy = cosmos_client.create_database(f"write-cost-{uuid.uuid4().hex[:8]}", offer_throughput=400)
+    try:
+        results = [
+            measure(db_proxy, vendor_name, samples[vendor_name]) for vendor_name in args.vendors if samples[vendor_name]
+        ]
+    finally:
+        cosmos_client.delete_database(db_proxy)
+
+    print(f"{'vendor':<14}{'samples':>9}{'before RU':>11}{'after RU':>10}{'change':>9}")
+    for result in results:
+        print(
+            f"{result['vendor']:<14}{result['samples']:>9}{result['before_ru']:>11.2f}{result['after_ru']:>10.2f}"
+            f"{result['change']:>9.0%}"
+        )
+    skipped = [vendor_name for vendor_name in args.vendors if not samples[vendor_name]]
+    if skipped:
+        print(f"No sample documents of {', '.join(skipped)}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if not results:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,9 @@ module.exports = function (context, IoTHubMessages) {
         if ("deviceVendor" in message) {
             message.deviceId = context.bindingData.systemPropertiesArray[i]["iothub-connection-device-id"];
             message.enqueuedTimeUtc = context.bindingData.enqueuedTimeUtcArray[i];
+            // Partition key properties of the containers partitioned by device and day.
+            message.day = new Date(message.enqueuedTimeUtc).toISOString().slice(0, 10);
+            message.partitionKey = message.deviceId + "_" + message.day.replace(/-/g, "");
             switch (message["deviceVendor"]) {
                 case "vemcon":
                     output_vemcon.push(message);
@@ -37,6 +37,9 @@ module.exports = function (context, myTimer) {
                 message.deviceVendor = "mts_smart";
                 message.deviceId = message.deviceVendor + "_" + message["AssetID"];
                 message.enqueuedTimeUtc = date;
+                // Partition key properties of the containers partitioned by device and day.
+                message.day = date.slice(0, 10);
+                message.partitionKey = message.deviceId + "_" + message.day.replace(/-/g, "");
             });
             context.bindings.outputDocument = resp_arr;
             context.done();
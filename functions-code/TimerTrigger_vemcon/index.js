@@ -19,6 +19,9 @@ module.exports = function (context, myTimer) {
             message.deviceVendor = "vemcon";
             message.deviceId = message.deviceVendor + "_" + message["tooltracker"]["ttid"];
             message.enqueuedTimeUtc = date;
+            // Partition key properties of the containers partitioned by device and day.
+            message.day = date.slice(0, 10);
+            message.partitionKey = message.deviceId + "_" + message.day.replace(/-/g, "");
             delete message["motion"]["history"];
         });
         context.bindings.outputDocument = resp_arr;
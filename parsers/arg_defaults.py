@@ -1,3 +1,4 @@
+import os
 import random
 
 # Constants we need in multiple places: the resource group name and the region
@@ -16,3 +17,16 @@ DEFAULT_KEY_VAULT_NAME = f"keyvault-materialfluss{COMMON_RANDOM_POSTFIX}"
 DEFAULT_SIGNALR_NAME = f"signalr-materialfluss{COMMON_RANDOM_POSTFIX}"
 DEFAULT_IIOT_APP_NAME = f"azure-iiot-materialfluss{COMMON_RANDOM_POSTFIX}"
 DEFAULT_LOCATION = "North Europe"
+DEFAULT_MAX_PARALLEL = 8
+DEFAULT_ONBOARD_CONCURRENCY = 8
+DEFAULT_KEY_STORE = "sqlite"
+KEY_STORE_KINDS = (DEFAULT_KEY_STORE, "jsonl", "json")
+DEFAULT_TAGGING = "bulk"
+TAGGING_KINDS = (DEFAULT_TAGGING, "job")
+DEFAULT_PARTITIONING = "device"
+PARTITIONING_KINDS = (DEFAULT_PARTITIONING, "hierarchical", "synthetic")
+DEFAULT_MIGRATE_CONCURRENCY = 8
+DEFAULT_STATE_DIR = ".deploy-state"
+DEFAULT_CREDENTIAL = "cli"
+CREDENTIAL_KINDS = (DEFAULT_CREDENTIAL, "environment", "managed-identity")
+DEFAULT_TOKEN_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".iot-deployment", "token-cache.bin")
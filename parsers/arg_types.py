@@ -0,0 +1,12 @@
+import argparse
+
+
+def positive_int(value: str) -> int:
+    """Argument type of the counts that have to be at least 1, e.g. of concurrent workers."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"has to be at least 1, not {number}")
+    return number
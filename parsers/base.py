@@ -27,4 +27,9 @@ class BaseParser(abc.ABC):
 
     @abc.abstractmethod
     def execute(self):
+        """Parse the arguments and run the task of the parser.
+
+        The task modules, and with them the Azure SDKs, are imported here rather than at the top of
+        the parser modules, so that only the ones of the subcommand that runs are loaded.
+        """
         raise NotImplementedError
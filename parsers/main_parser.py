@@ -2,11 +2,21 @@ import argparse
 import sys
 
 from .subcommands.deploy import DeployParser
+from .subcommands.export_keys import ExportKeysParser
+from .subcommands.migrate_messages import MigrateMessagesParser
 from .subcommands.onboard import OnboardParser
+from .subcommands.retag import RetagParser
+from .subcommands.status import StatusParser
+from .subcommands.wait import WaitParser
 from .subparser import SubcommandInfo, SubcommandParser
 
 DEPLOY_SUBCOMMAND = "deploy"
 ONBOARD_SUBCOMMAND = "onboard"
+WAIT_SUBCOMMAND = "wait"
+STATUS_SUBCOMMAND = "status"
+EXPORT_KEYS_SUBCOMMAND = "export-keys"
+RETAG_SUBCOMMAND = "retag"
+MIGRATE_MESSAGES_SUBCOMMAND = "migrate-messages"
 
 
 class MainParser(SubcommandParser):
@@ -16,6 +26,23 @@ class MainParser(SubcommandParser):
             ONBOARD_SUBCOMMAND: SubcommandInfo(
                 self._onboard, {}, "Subcommand for batch device onboarding into the Azure IotHub."
             ),
+            WAIT_SUBCOMMAND: SubcommandInfo(
+                self._wait, {}, "Subcommand to wait for the operations submitted by a '--no-wait' deployment."
+            ),
+            STATUS_SUBCOMMAND: SubcommandInfo(
+                self._status, {}, "Subcommand to show the operations submitted by a '--no-wait' deployment."
+            ),
+            EXPORT_KEYS_SUBCOMMAND: SubcommandInfo(
+                self._export_keys, {}, "Subcommand to export the keys of the onboarded devices to a JSON file."
+            ),
+            RETAG_SUBCOMMAND: SubcommandInfo(
+                self._retag, {}, "Subcommand to merge tags into the device twins with IotHub scheduled jobs."
+            ),
+            MIGRATE_MESSAGES_SUBCOMMAND: SubcommandInfo(
+                self._migrate_messages,
+                {},
+                "Subcommand to copy the messages of a vendor to its Cosmos DB container of another partitioning.",
+            ),
         }
         no_subcommand_case = None
         arg_list = sys.argv[1:]
@@ -29,3 +56,25 @@ class MainParser(SubcommandParser):
     def _onboard(self):
         onboard_parser = OnboardParser(self._arg_list[1:], self._subcommand_parsers[ONBOARD_SUBCOMMAND])
         onboard_parser.execute()
+
+    def _wait(self):
+        wait_parser = WaitParser(self._arg_list[1:], self._subcommand_parsers[WAIT_SUBCOMMAND])
+        wait_parser.execute()
+
+    def _status(self):
+        status_parser = StatusParser(self._arg_list[1:], self._subcommand_parsers[STATUS_SUBCOMMAND])
+        status_parser.execute()
+
+    def _export_keys(self):
+        export_keys_parser = ExportKeysParser(self._arg_list[1:], self._subcommand_parsers[EXPORT_KEYS_SUBCOMMAND])
+        export_keys_parser.execute()
+
+    def _retag(self):
+        retag_parser = RetagParser(self._arg_list[1:], self._subcommand_parsers[RETAG_SUBCOMMAND])
+        retag_parser.execute()
+
+    def _migrate_messages(self):
+        migrate_messages_parser = MigrateMessagesParser(
+            self._arg_list[1:], self._subcommand_parsers[MIGRATE_MESSAGES_SUBCOMMAND]
+        )
+        migrate_messages_parser.execute()
@@ -4,7 +4,7 @@ from typing import Any, Dict, List, Optional
 from parsers.base import BaseParser
 from parsers.subcommands.subcommands.iiot import IiotParser
 from parsers.subparser import SubcommandInfo, SubcommandParser
-from tasks import deploy
+from utils import task_session
 
 from .subcommands import iiot, vanilla
 from .subcommands.vanilla import VanillaParser
@@ -68,4 +68,7 @@ class NoSubcommandParser(BaseParser):
 
     def execute(self):
         args = self._parser.parse_args(self._arg_list)
-        deploy.task_func(args)
+        from tasks import deploy
+
+        with task_session(args):
+            deploy.task_func(args)
@@ -0,0 +1,60 @@
+import argparse
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from parsers.arg_defaults import DEFAULT_KEY_STORE, KEY_STORE_KINDS
+from parsers.base import BaseParser
+
+
+def get_arg_dictionary() -> Dict[str, Dict[str, Any]]:
+    # Do not use positional arguments, to prevent possible collision with subcommand names!
+    arg_dict = OrderedDict(
+        [
+            (
+                "--device-ids-file-path",
+                {
+                    "type": str,
+                    "required": True,
+                    "help": "Path of the device ids file the devices were onboarded from.",
+                },
+            ),
+            (
+                "--key-store",
+                {
+                    "type": str,
+                    "choices": KEY_STORE_KINDS,
+                    "default": DEFAULT_KEY_STORE,
+                    "help": "Format of the key store the devices were onboarded with.",
+                },
+            ),
+            (
+                "--out",
+                {
+                    "type": str,
+                    "default": None,
+                    "help": "Path of the JSON file to write, '<device ids file>.keys' by default.",
+                },
+            ),
+        ]
+    )
+    return arg_dict
+
+
+class ExportKeysParser(BaseParser):
+    def __init__(
+        self,
+        arg_list: List[str],
+        parser: Optional[argparse.ArgumentParser],
+    ):
+        super().__init__(arg_list=arg_list, parser=parser)
+
+    def _add_arguments(self):
+        arg_dict = get_arg_dictionary()
+        for arg, config in arg_dict.items():
+            self._parser.add_argument(arg, **config)
+
+    def execute(self):
+        args = self._parser.parse_args(self._arg_list)
+        from tasks import export_keys
+
+        export_keys.task_func(args)
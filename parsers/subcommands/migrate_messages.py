@@ -0,0 +1,98 @@
+import argparse
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from parsers.arg_defaults import DEFAULT_MIGRATE_CONCURRENCY, DEFAULT_PARTITIONING, PARTITIONING_KINDS
+from parsers.arg_types import positive_int
+from parsers.base import BaseParser
+from utils import task_session
+
+
+def get_arg_dictionary() -> Dict[str, Dict[str, Any]]:
+    # Do not use positional arguments, to prevent possible collision with subcommand names!
+    arg_dict = OrderedDict(
+        [
+            (
+                "--azure-subscription-id",
+                {
+                    "type": str,
+                    "required": True,
+                    "help": "Azure subscription ID.",
+                },
+            ),
+            (
+                "--resource-group-name",
+                {
+                    "type": str,
+                    "required": True,
+                    "help": "Resource group name of the Cosmos DB.",
+                },
+            ),
+            (
+                "--cosmosdb-name",
+                {
+                    "type": str,
+                    "required": True,
+                    "help": "Cosmos DB name of the messages to migrate.",
+                },
+            ),
+            (
+                "--vendor-name",
+                {
+                    "type": str,
+                    "required": True,
+                    "help": "Device vendor of the messages to migrate.",
+                },
+            ),
+            (
+                "--source-partitioning",
+                {
+                    "type": str,
+                    "choices": PARTITIONING_KINDS,
+                    "default": DEFAULT_PARTITIONING,
+                    "help": "Partitioning of the messages container to copy the messages from.",
+                },
+            ),
+            (
+                "--target-partitioning",
+                {
+                    "type": str,
+                    "choices": PARTITIONING_KINDS,
+                    "required": True,
+                    "help": "Partitioning of the messages container to copy the messages to, as created by a "
+                    "deployment with '--cosmosdb-partitioning'.",
+                },
+            ),
+            (
+                "--concurrency",
+                {
+                    "type": positive_int,
+                    "default": DEFAULT_MIGRATE_CONCURRENCY,
+                    "help": "Maximum number of partition key ranges of the source container to copy concurrently, "
+                    "each with a change feed reader of its own.",
+                },
+            ),
+        ]
+    )
+    return arg_dict
+
+
+class MigrateMessagesParser(BaseParser):
+    def __init__(
+        self,
+        arg_list: List[str],
+        parser: Optional[argparse.ArgumentParser],
+    ):
+        super().__init__(arg_list=arg_list, parser=parser)
+
+    def _add_arguments(self):
+        arg_dict = get_arg_dictionary()
+        for arg, config in arg_dict.items():
+            self._parser.add_argument(arg, **config)
+
+    def execute(self):
+        args = self._parser.parse_args(self._arg_list)
+        from tasks import migrate_messages
+
+        with task_session(args):
+            migrate_messages.task_func(args)
@@ -2,8 +2,16 @@ import argparse
 from collections import OrderedDict
 from typing import Any, Dict, List, Optional
 
+from parsers.arg_defaults import (
+    DEFAULT_KEY_STORE,
+    DEFAULT_ONBOARD_CONCURRENCY,
+    DEFAULT_TAGGING,
+    KEY_STORE_KINDS,
+    TAGGING_KINDS,
+)
+from parsers.arg_types import positive_int
 from parsers.base import BaseParser
-from tasks import onboard
+from utils import task_session
 
 
 def get_arg_dictionary() -> Dict[str, Dict[str, Any]]:
@@ -39,7 +47,8 @@ def get_arg_dictionary() -> Dict[str, Dict[str, Any]]:
                 {
                     "type": str,
                     "required": True,
-                    "help": "Path of the text file containing 1 device id per line to be registered in IotHub.",
+                    "help": "Path of the text file containing 1 device id per line to be registered in IotHub, or "
+                    "of a CSV file with the device ids in its first column. Both can be gzipped.",
                 },
             ),
             (
@@ -56,6 +65,63 @@ def get_arg_dictionary() -> Dict[str, Dict[str, Any]]:
                     "help": "The flag indicating whether the devices will run the Azure IIoT edge modules.",
                 },
             ),
+            (
+                "--concurrency",
+                {
+                    "type": positive_int,
+                    "default": DEFAULT_ONBOARD_CONCURRENCY,
+                    "help": "Maximum number of device batches to register concurrently. The requests are still "
+                    "bounded by '--iot-hub-rate'.",
+                },
+            ),
+            (
+                "--tagging",
+                {
+                    "type": str,
+                    "choices": TAGGING_KINDS,
+                    "default": DEFAULT_TAGGING,
+                    "help": "How the tags of '--is-iiot-device' are set: with bulk registry operations as the "
+                    "batches are registered ('bulk'), or with a few IotHub scheduled twin update jobs once all the "
+                    "devices are ('job'), each covering as many devices as a query condition can list.",
+                },
+            ),
+            (
+                "--key-store",
+                {
+                    "type": str,
+                    "choices": KEY_STORE_KINDS,
+                    "default": DEFAULT_KEY_STORE,
+                    "help": "Format of the file next to the device ids file the keys of the registered devices are "
+                    "added to, batch by batch: an indexed SQLite database ('.keys.db'), append-only JSON lines "
+                    "('.keys.jsonl') or the JSON object of all the keys ('.keys'), rewritten at the end. See "
+                    "'export-keys'.",
+                },
+            ),
+            (
+                "--resume",
+                {
+                    "action": "store_true",
+                    "help": "The flag for continuing an interrupted onboarding, skipping the device batches "
+                    "completed according to the journal next to the device ids file ('.journal').",
+                },
+            ),
+            (
+                "--import-job",
+                {
+                    "action": "store_true",
+                    "help": "The flag for registering the devices with a single IotHub import job, through a blob "
+                    "container of the storage account given by '--storage-acc-name'. Meant for very large fleets.",
+                },
+            ),
+            (
+                "--storage-acc-name",
+                {
+                    "type": str,
+                    "default": None,
+                    "help": "Storage account name for the blobs of '--import-job', in the resource group of the "
+                    "device onboarding.",
+                },
+            ),
         ]
     )
     return arg_dict
@@ -76,4 +142,7 @@ class OnboardParser(BaseParser):
 
     def execute(self):
         args = self._parser.parse_args(self._arg_list)
-        onboard.task_func(args)
+        from tasks import onboard
+
+        with task_session(args):
+            onboard.task_func(args)
@@ -0,0 +1,86 @@
+import argparse
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from parsers.base import BaseParser
+from utils import task_session
+
+
+def get_arg_dictionary() -> Dict[str, Dict[str, Any]]:
+    # Do not use positional arguments, to prevent possible collision with subcommand names!
+    arg_dict = OrderedDict(
+        [
+            (
+                "--azure-subscription-id",
+                {
+                    "type": str,
+                    "required": True,
+                    "help": "Azure subscription ID.",
+                },
+            ),
+            (
+                "--resource-group-name",
+                {
+                    "type": str,
+                    "required": True,
+                    "help": "Resource group name of the IotHub.",
+                },
+            ),
+            (
+                "--iot-hub-name",
+                {
+                    "type": str,
+                    "required": True,
+                    "help": "IotHub name of the devices to tag.",
+                },
+            ),
+            (
+                "--tags",
+                {
+                    "type": str,
+                    "default": None,
+                    "help": "JSON object of the tags to merge into the device twins, a null value removes the tag. "
+                    'The IIoT tags by default: \'{"__type__": "iiotedge", "os": "Linux"}\'.',
+                },
+            ),
+            (
+                "--condition",
+                {
+                    "type": str,
+                    "default": None,
+                    "help": "IotHub query condition of the devices to tag, e.g. 'capabilities.iotEdge = true'. "
+                    "Tags all the matching devices of the fleet with a single scheduled job.",
+                },
+            ),
+            (
+                "--device-ids-file-path",
+                {
+                    "type": str,
+                    "default": None,
+                    "help": "Path of a device ids file, as given to 'onboard', to tag only the devices it lists.",
+                },
+            ),
+        ]
+    )
+    return arg_dict
+
+
+class RetagParser(BaseParser):
+    def __init__(
+        self,
+        arg_list: List[str],
+        parser: Optional[argparse.ArgumentParser],
+    ):
+        super().__init__(arg_list=arg_list, parser=parser)
+
+    def _add_arguments(self):
+        arg_dict = get_arg_dictionary()
+        for arg, config in arg_dict.items():
+            self._parser.add_argument(arg, **config)
+
+    def execute(self):
+        args = self._parser.parse_args(self._arg_list)
+        from tasks import retag
+
+        with task_session(args):
+            retag.task_func(args)
@@ -0,0 +1,32 @@
+import argparse
+from typing import Any, Dict, List, Optional
+
+from parsers.base import BaseParser
+from utils import task_session
+
+from . import wait
+
+
+def get_arg_dictionary() -> Dict[str, Dict[str, Any]]:
+    return wait.get_arg_dictionary()
+
+
+class StatusParser(BaseParser):
+    def __init__(
+        self,
+        arg_list: List[str],
+        parser: Optional[argparse.ArgumentParser],
+    ):
+        super().__init__(arg_list=arg_list, parser=parser)
+
+    def _add_arguments(self):
+        arg_dict = get_arg_dictionary()
+        for arg, config in arg_dict.items():
+            self._parser.add_argument(arg, **config)
+
+    def execute(self):
+        args = self._parser.parse_args(self._arg_list)
+        from tasks import status
+
+        with task_session(args):
+            status.task_func(args)
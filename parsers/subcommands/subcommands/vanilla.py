@@ -8,11 +8,14 @@ from parsers.arg_defaults import (
     DEFAULT_FUNCTIONS_NAME,
     DEFAULT_IOT_HUB_NAME,
     DEFAULT_LOCATION,
+    DEFAULT_MAX_PARALLEL,
     DEFAULT_RESOURCE_GROUP_NAME,
+    DEFAULT_STATE_DIR,
     DEFAULT_STORAGE_ACC_NAME,
 )
+from parsers.arg_types import positive_int
 from parsers.base import BaseParser
-from tasks import deploy_vanilla
+from utils import task_session
 
 from .. import onboard
 
@@ -73,6 +76,37 @@ def get_arg_dictionary() -> Dict[str, Dict[str, Any]]:
                     "help": "Cosmos DB name for the deployment.",
                 },
             ),
+            (
+                "--cosmosdb-throughput-profile",
+                {
+                    "type": str,
+                    "default": None,
+                    "help": "Path of the JSON file of the manual or autoscale throughput of the Cosmos DB database "
+                    "and of the containers that do not share it, matched by ID patterns. Existing ones are updated "
+                    "to it. Defaults to 400 RU/s shared by all the containers.",
+                },
+            ),
+            (
+                "--cosmosdb-partitioning",
+                {
+                    "type": str,
+                    "nargs": "*",
+                    "default": None,
+                    "help": "Partitioning of the messages containers of the given vendors, as VENDOR=PARTITIONING "
+                    "pairs: by device ('device', the default), or by device and day with hierarchical partition keys "
+                    "('hierarchical') or a synthetic key ('synthetic'). Each is a container of its own, see "
+                    "'migrate-messages' for moving the existing messages to it.",
+                },
+            ),
+            (
+                "--iot-hub-cosmosdb-routing",
+                {
+                    "action": "store_true",
+                    "help": "The flag for routing the IotHub device messages with a 'deviceVendor' JSON body "
+                    "property straight to the messages container of their vendor, through IotHub Cosmos DB custom "
+                    "endpoints, instead of the 'IoTHub_EventHub' function, which is not deployed then.",
+                },
+            ),
             (
                 "--app-srv-plan-name",
                 {
@@ -114,6 +148,56 @@ def get_arg_dictionary() -> Dict[str, Dict[str, Any]]:
                     "help": "Location of the Azure datacenter for the deployment.",
                 },
             ),
+            (
+                "--max-parallel",
+                {
+                    "type": positive_int,
+                    "default": DEFAULT_MAX_PARALLEL,
+                    "help": "Maximum number of provisioning steps to run concurrently. "
+                    "Steps that do not depend on each other are run in parallel.",
+                },
+            ),
+            (
+                "--async",
+                {
+                    "dest": "use_async",
+                    "action": "store_true",
+                    "help": "Provision with the asynchronous Azure SDK clients on a single event loop, "
+                    "instead of one thread per running step.",
+                },
+            ),
+            (
+                "--state-dir",
+                {
+                    "type": str,
+                    "default": DEFAULT_STATE_DIR,
+                    "help": "Folder of the deployment state files. The steps completed by an earlier run with "
+                    "the same inputs are skipped.",
+                },
+            ),
+            (
+                "--verify",
+                {
+                    "action": "store_true",
+                    "help": "Check that the resources of the steps recorded in the deployment state still exist, "
+                    "and run the steps again for the ones that do not.",
+                },
+            ),
+            (
+                "--force",
+                {
+                    "action": "store_true",
+                    "help": "Ignore the deployment state and run all steps.",
+                },
+            ),
+            (
+                "--no-wait",
+                {
+                    "action": "store_true",
+                    "help": "Submit the long-running operations without waiting for them to finish. Use the "
+                    "'wait' subcommand to wait for them, then run the deployment again for the dependent steps.",
+                },
+            ),
         ]
     )
     arg_dict.update(vanilla_arg_dict)
@@ -135,4 +219,7 @@ class VanillaParser(BaseParser):
 
     def execute(self):
         args = self._parser.parse_args(self._arg_list)
-        deploy_vanilla.task_func(args)
+        from tasks import deploy_vanilla
+
+        with task_session(args):
+            deploy_vanilla.task_func(args)
@@ -0,0 +1,61 @@
+import argparse
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from parsers.arg_defaults import DEFAULT_RESOURCE_GROUP_NAME, DEFAULT_STATE_DIR
+from parsers.base import BaseParser
+from utils import task_session
+
+
+def get_arg_dictionary() -> Dict[str, Dict[str, Any]]:
+    # Do not use positional arguments, to prevent possible collision with subcommand names!
+    arg_dict = OrderedDict(
+        [
+            (
+                "--azure-subscription-id",
+                {
+                    "type": str,
+                    "required": True,
+                    "help": "Azure subscription ID.",
+                },
+            ),
+            (
+                "--resource-group-name",
+                {
+                    "type": str,
+                    "default": DEFAULT_RESOURCE_GROUP_NAME,
+                    "help": "Resource group name of the deployment.",
+                },
+            ),
+            (
+                "--state-dir",
+                {
+                    "type": str,
+                    "default": DEFAULT_STATE_DIR,
+                    "help": "Folder of the deployment state files, where the pending operations are stored.",
+                },
+            ),
+        ]
+    )
+    return arg_dict
+
+
+class WaitParser(BaseParser):
+    def __init__(
+        self,
+        arg_list: List[str],
+        parser: Optional[argparse.ArgumentParser],
+    ):
+        super().__init__(arg_list=arg_list, parser=parser)
+
+    def _add_arguments(self):
+        arg_dict = get_arg_dictionary()
+        for arg, config in arg_dict.items():
+            self._parser.add_argument(arg, **config)
+
+    def execute(self):
+        args = self._parser.parse_args(self._arg_list)
+        from tasks import wait
+
+        with task_session(args):
+            wait.task_func(args)
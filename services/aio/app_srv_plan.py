@@ -0,0 +1,41 @@
+import logging
+
+from azure.identity.aio import AzureCliCredential
+from azure.mgmt.web.aio import WebSiteManagementClient
+from utils import clients, lro
+
+from services import app_srv_plan
+from services.aio import inventory
+
+
+async def provision(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    app_srv_plan_name: str,
+    location: str,
+    logger: logging.Logger,
+):
+    website_client = clients.get_async_client(
+        WebSiteManagementClient, credential, azure_subscription_id, app_srv_plan.WEBSITE_MGMT_API_VER
+    )
+    rg_inventory = await inventory.get(credential, azure_subscription_id, resource_group_name)
+    if not rg_inventory.is_provisioned(app_srv_plan.RESOURCE_TYPE, app_srv_plan_name):
+        poller = await website_client.app_service_plans.begin_create_or_update(
+            resource_group_name, app_srv_plan_name, app_srv_plan.get_create_params(location)
+        )
+        asp_res = await lro.result_async(
+            poller,
+            lro.Operation(
+                app_srv_plan.RESOURCE_TYPE,
+                app_srv_plan_name,
+                WebSiteManagementClient,
+                app_srv_plan.WEBSITE_MGMT_API_VER,
+                "app_service_plans.begin_create_or_update",
+                (resource_group_name, app_srv_plan_name, None),
+            ),
+        )
+        rg_inventory.record(app_srv_plan.RESOURCE_TYPE, asp_res.name, asp_res.id)
+        logger.info(f"Provisioned App Service Plan '{asp_res.name}'")
+    else:
+        logger.info(f"App Service Plan '{app_srv_plan_name}' is already provisioned")
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import sys
+from typing import Any, List, Optional, Set, Tuple
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.identity.aio import AzureCliCredential
+from azure.mgmt.cosmosdb.aio import CosmosDBManagementClient
+from utils import clients, lro
+
+from services import cosmosdb
+from services.aio import inventory
+
+
+class Provisioner:
+    def __init__(
+        self,
+        credential: AzureCliCredential,
+        azure_subscription_id: str,
+        resource_group_name: str,
+        cosmosdb_name: str,
+        location: str,
+        throughput_profile_path: Optional[str],
+        vendor_partitionings: Optional[List[str]],
+        logger: logging.Logger,
+    ):
+        self._credential = credential
+        self._azure_subscription_id = azure_subscription_id
+        self._resource_group_name = resource_group_name
+        self._cosmosdb_name = cosmosdb_name
+        self._location = location
+        self._logger = logger
+        self._containers = cosmosdb.get_containers(cosmosdb.get_partitionings(vendor_partitionings, logger))
+        self._throughput_profile = cosmosdb.load_throughput_profile(throughput_profile_path, self._containers, logger)
+
+    async def provision(self):
+        cosmosdb_client = clients.get_async_client(
+            CosmosDBManagementClient, self._credential, self._azure_subscription_id
+        )
+        rg_inventory = await inventory.get(self._credential, self._azure_subscription_id, self._resource_group_name)
+        if not rg_inventory.is_provisioned(cosmosdb.RESOURCE_TYPE, self._cosmosdb_name):
+            if await cosmosdb_client.database_accounts.check_name_exists(self._cosmosdb_name):
+                self._logger.error(f"Cosmos DB name '{self._cosmosdb_name}' is not available")
+                sys.exit(1)
+            poller = await cosmosdb_client.database_accounts.begin_create_or_update(
+                self._resource_group_name, self._cosmosdb_name, cosmosdb.get_create_params(self._location)
+            )
+            cosmosdb_res = await lro.result_async(
+                poller,
+                lro.Operation(
+                    cosmosdb.RESOURCE_TYPE,
+                    self._cosmosdb_name,
+                    CosmosDBManagementClient,
+                    None,
+                    "database_accounts.begin_create_or_update",
+                    (self._resource_group_name, self._cosmosdb_name, None),
+                ),
+            )
+            rg_inventory.record(cosmosdb.RESOURCE_TYPE, cosmosdb_res.name, cosmosdb_res.id)
+            self._logger.info(f"Provisioned Cosmos DB '{cosmosdb_res.name}'")
+        else:
+            self._logger.info(f"Cosmos DB '{self._cosmosdb_name}' is already provisioned")
+
+        keys, acc_res = await asyncio.gather(
+            cosmosdb_client.database_accounts.list_keys(self._resource_group_name, self._cosmosdb_name),
+            cosmosdb_client.database_accounts.get(self._resource_group_name, self._cosmosdb_name),
+        )
+        db_args = (self._resource_group_name, self._cosmosdb_name, cosmosdb.COSMOSDB_DB_NAME)
+        database_throughput = self._throughput_profile.database
+        if cosmosdb.is_autoscale(database_throughput):
+            try:
+                await cosmosdb_client.sql_resources.get_sql_database(*db_args)
+            except ResourceNotFoundError:
+                await self._create(
+                    cosmosdb_client,
+                    "sql_database",
+                    db_args,
+                    cosmosdb.COSMOSDB_DB_NAME,
+                    cosmosdb.get_database_create_params(database_throughput),
+                    database_throughput,
+                )
+        # The data plane initialization stays on the synchronous Cosmos client.
+        db_initializer = cosmosdb.DatabaseInitializer(
+            acc_res.document_endpoint,
+            keys.secondary_master_key,
+            self._containers,
+            self._throughput_profile,
+            self._logger,
+        )
+        existing = await asyncio.get_running_loop().run_in_executor(None, db_initializer.initialize)
+        await asyncio.gather(
+            *(
+                self._create(
+                    cosmosdb_client,
+                    "sql_container",
+                    (*db_args, container.id),
+                    container.id,
+                    cosmosdb.get_container_create_params(container, throughput),
+                    throughput,
+                )
+                for container, throughput in cosmosdb.get_missing_autoscale_containers(
+                    self._containers, self._throughput_profile, existing
+                )
+            )
+        )
+        if existing is not None:
+            await self._reconcile_throughput(cosmosdb_client, existing)
+
+    async def _create(
+        self,
+        cosmosdb_client: CosmosDBManagementClient,
+        kind: str,
+        args: Tuple[str, ...],
+        name: str,
+        params: Any,
+        throughput: cosmosdb.Throughput,
+    ):
+        sql_resources = cosmosdb_client.sql_resources
+        method = f"begin_create_update_{kind}"
+        poller = await getattr(sql_resources, method)(*args, params)
+        await lro.result_async(
+            poller,
+            lro.Operation(
+                cosmosdb.SQL_RESOURCE_TYPES[kind],
+                f"{self._cosmosdb_name}/{name}",
+                CosmosDBManagementClient,
+                None,
+                f"sql_resources.{method}",
+                (*args, None),
+            ),
+        )
+        settings = await getattr(sql_resources, f"get_{kind}_throughput")(*args)
+        cosmosdb.check_created_throughput(name, settings, throughput, self._logger)
+
+    async def _reconcile_throughput(self, cosmosdb_client: CosmosDBManagementClient, existing: Set[str]):
+        """Bring the throughput of the database and containers that existed before to the profile."""
+        db_args = (self._resource_group_name, self._cosmosdb_name, cosmosdb.COSMOSDB_DB_NAME)
+        await self._reconcile(
+            cosmosdb_client, "sql_database", db_args, cosmosdb.COSMOSDB_DB_NAME, self._throughput_profile.database
+        )
+        await asyncio.gather(
+            *(
+                self._reconcile(
+                    cosmosdb_client,
+                    "sql_container",
+                    (*db_args, container.id),
+                    container.id,
+                    self._throughput_profile.get_container_throughput(container.id),
+                )
+                for container in self._containers
+                if container.id in existing
+            )
+        )
+
+    async def _reconcile(
+        self,
+        cosmosdb_client: CosmosDBManagementClient,
+        kind: str,
+        args: Tuple[str, ...],
+        name: str,
+        wanted: Optional[cosmosdb.Throughput],
+    ):
+        sql_resources = cosmosdb_client.sql_resources
+        try:
+            current = cosmosdb.Throughput.from_settings(await getattr(sql_resources, f"get_{kind}_throughput")(*args))
+        except ResourceNotFoundError:
+            # Without throughput settings of its own, a container shares the one of the database.
+            current = None
+        for method_template, params in cosmosdb.get_throughput_changes(name, current, wanted, self._logger):
+            method = method_template.format(kind)
+            poller = await getattr(sql_resources, method)(*args, *params)
+            await lro.result_async(
+                poller,
+                lro.Operation(
+                    cosmosdb.THROUGHPUT_SETTINGS_TYPE,
+                    f"{self._cosmosdb_name}/{name}",
+                    CosmosDBManagementClient,
+                    None,
+                    f"sql_resources.{method}",
+                    (*args, *([None] * len(params))),
+                ),
+            )
@@ -0,0 +1,76 @@
+import logging
+import sys
+
+from azure.identity.aio import AzureCliCredential
+from azure.mgmt.eventhub.aio import EventHubManagementClient
+from azure.mgmt.eventhub.models import CheckNameAvailabilityParameter
+from utils import clients
+
+from services import event_hub
+from services.aio import inventory
+
+
+class Provisioner:
+    def __init__(
+        self,
+        credential: AzureCliCredential,
+        azure_subscription_id: str,
+        resource_group_name: str,
+        event_hub_namespace: str,
+        event_hub_name: str,
+        location: str,
+        logger: logging.Logger,
+    ):
+        self._credential = credential
+        self._azure_subscription_id = azure_subscription_id
+        self._resource_group_name = resource_group_name
+        self._event_hub_namespace = event_hub_namespace
+        self._event_hub_name = event_hub_name
+        self._location = location
+        self._logger = logger
+
+    async def _provision_eh_namespace(self, event_hub_client: EventHubManagementClient):
+        rg_inventory = await inventory.get(self._credential, self._azure_subscription_id, self._resource_group_name)
+        if not rg_inventory.is_provisioned(event_hub.RESOURCE_TYPE, self._event_hub_namespace):
+            avail_res = await event_hub_client.namespaces.check_name_availability(
+                CheckNameAvailabilityParameter(name=self._event_hub_namespace)
+            )
+            if not avail_res.name_available:
+                self._logger.error(f"EventHub namespace '{self._event_hub_namespace}' is not available")
+                sys.exit(1)
+            poller = await event_hub_client.namespaces.begin_create_or_update(
+                self._resource_group_name,
+                self._event_hub_namespace,
+                event_hub.get_namespace_create_params(self._location),
+            )
+            eh_res = await poller.result()
+            rg_inventory.record(event_hub.RESOURCE_TYPE, eh_res.name, eh_res.id)
+            await event_hub_client.namespaces.create_or_update_network_rule_set(
+                self._resource_group_name, self._event_hub_namespace, event_hub.get_namespace_network_rule_set()
+            )
+            self._logger.info(f"Provisioned EventHub namespace '{eh_res.name}'")
+        else:
+            self._logger.info(f"EventHub namespace '{self._event_hub_namespace}' is already provisioned")
+
+    async def _provision_eh(self, event_hub_client: EventHubManagementClient):
+        if self._event_hub_name not in {
+            desc_list_res.name
+            async for desc_list_res in event_hub_client.event_hubs.list_by_namespace(
+                self._resource_group_name, self._event_hub_namespace
+            )
+        }:
+            eh = await event_hub_client.event_hubs.create_or_update(
+                self._resource_group_name, self._event_hub_namespace, self._event_hub_name, event_hub.get_create_params()
+            )
+            self._logger.info(f"Provisioned EventHub '{eh.name}'")
+        else:
+            self._logger.info(f"EventHub '{self._event_hub_name}' is already provisioned")
+
+    async def provision(self):
+        event_hub_client = clients.get_async_client(
+            EventHubManagementClient, self._credential, self._azure_subscription_id, event_hub.EVENT_HUB_MGMT_API_VER
+        )
+        # Provision the EventHub namespace first.
+        await self._provision_eh_namespace(event_hub_client)
+        # Provision the EventHub inside the EventHub namespace.
+        await self._provision_eh(event_hub_client)
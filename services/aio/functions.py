@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import sys
+from typing import Dict, List
+
+from azure.core.exceptions import ResourceExistsError
+from azure.identity.aio import AzureCliCredential
+from azure.mgmt.cosmosdb.aio import CosmosDBManagementClient
+from azure.mgmt.iothub.aio import IotHubClient
+from azure.mgmt.storage.aio import StorageManagementClient
+from azure.mgmt.web.aio import WebSiteManagementClient
+from utils import clients, lro
+
+from services import app_srv_plan, functions, iot_hub, storage
+from services.aio import inventory
+
+
+class Provisioner:
+    def __init__(
+        self,
+        credential: AzureCliCredential,
+        azure_subscription_id: str,
+        resource_group_name: str,
+        iot_hub_name: str,
+        cosmosdb_name: str,
+        app_srv_plan_name: str,
+        storage_acc_name: str,
+        functions_name: str,
+        location: str,
+        logger: logging.Logger,
+    ):
+        self._credential = credential
+        self._azure_subscription_id = azure_subscription_id
+        self._resource_group_name = resource_group_name
+        self._iot_hub_name = iot_hub_name
+        self._cosmosdb_name = cosmosdb_name
+        self._app_srv_plan_name = app_srv_plan_name
+        self._storage_acc_name = storage_acc_name
+        self._functions_name = functions_name
+        self._location = location
+        self._logger = logger
+
+    async def _get_app_settings(self) -> List[Dict]:
+        iot_hub_client = clients.get_async_client(
+            IotHubClient, self._credential, self._azure_subscription_id, iot_hub.IOT_HUB_MGMT_API_VER
+        )
+        cosmosdb_client = clients.get_async_client(CosmosDBManagementClient, self._credential, self._azure_subscription_id)
+        storage_client = clients.get_async_client(
+            StorageManagementClient, self._credential, self._azure_subscription_id, storage.STORAGE_MGMT_API_VER
+        )
+        # Fetch all the keys and endpoints at once.
+        storage_keys, cosmosdb_acc, cosmosdb_keys, sas_auth_rule, iot_hub_desc = await asyncio.gather(
+            storage_client.storage_accounts.list_keys(self._resource_group_name, self._storage_acc_name),
+            cosmosdb_client.database_accounts.get(self._resource_group_name, self._cosmosdb_name),
+            cosmosdb_client.database_accounts.list_keys(self._resource_group_name, self._cosmosdb_name),
+            iot_hub_client.iot_hub_resource.get_keys_for_key_name(
+                self._resource_group_name, self._iot_hub_name, iot_hub.SHARED_ACCESS_KEY_NAME
+            ),
+            iot_hub_client.iot_hub_resource.get(self._resource_group_name, self._iot_hub_name),
+        )
+        return functions.get_app_settings(
+            self._storage_acc_name,
+            storage_keys.keys[1].value,
+            self._cosmosdb_name,
+            cosmosdb_acc.document_endpoint,
+            cosmosdb_keys.secondary_master_key,
+            self._iot_hub_name,
+            iot_hub_desc.properties.event_hub_endpoints["events"],
+            sas_auth_rule.secondary_key,
+        )
+
+    async def provision(self):
+        website_client = clients.get_async_client(
+            WebSiteManagementClient, self._credential, self._azure_subscription_id, app_srv_plan.WEBSITE_MGMT_API_VER
+        )
+        rg_inventory = await inventory.get(self._credential, self._azure_subscription_id, self._resource_group_name)
+        if rg_inventory.is_provisioned(functions.RESOURCE_TYPE, self._functions_name):
+            self._logger.info(f"Azure Functions '{self._functions_name}' is already provisioned")
+            return
+        app_srv_plan_info = rg_inventory.get(app_srv_plan.RESOURCE_TYPE, self._app_srv_plan_name)
+        if app_srv_plan_info is not None:
+            server_farm_id = app_srv_plan_info.id
+            app_settings = await self._get_app_settings()
+        else:
+            app_srv_plan_res, app_settings = await asyncio.gather(
+                website_client.app_service_plans.get(self._resource_group_name, self._app_srv_plan_name),
+                self._get_app_settings(),
+            )
+            server_farm_id = app_srv_plan_res.id
+        site = functions.get_create_params(self._location, server_farm_id, app_settings)
+        try:
+            poller = await website_client.web_apps.begin_create_or_update(
+                self._resource_group_name, self._functions_name, site
+            )
+            func_res = await lro.result_async(
+                poller,
+                lro.Operation(
+                    functions.RESOURCE_TYPE,
+                    self._functions_name,
+                    WebSiteManagementClient,
+                    app_srv_plan.WEBSITE_MGMT_API_VER,
+                    "web_apps.begin_create_or_update",
+                    (self._resource_group_name, self._functions_name, None),
+                ),
+            )
+            rg_inventory.record(functions.RESOURCE_TYPE, func_res.name, func_res.id)
+            self._logger.info(f"Provisioned Azure Functions '{func_res.name}'")
+        except ResourceExistsError as e:
+            if not hasattr(e.response, "status_code") or e.response.status_code != 409:
+                raise e
+            self._logger.error(f"Azure Functions name '{self._functions_name}' is not available")
+            sys.exit(1)
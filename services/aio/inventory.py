@@ -0,0 +1,34 @@
+import asyncio
+from typing import Optional
+
+from azure.identity.aio import AzureCliCredential
+from azure.mgmt.resource.resources.aio import ResourceManagementClient
+from utils import clients
+
+from services import inventory, resource_group
+
+# Created lazily, since it must belong to the running event loop.
+_lock: Optional[asyncio.Lock] = None
+
+
+async def get(credential: AzureCliCredential, azure_subscription_id: str, resource_group_name: str) -> inventory.Inventory:
+    """Async counterpart of `inventory.get`, sharing its cache with the sync steps."""
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        rg_inventory = inventory.get_cached(azure_subscription_id, resource_group_name)
+        if rg_inventory is None:
+            resource_client = clients.get_async_client(
+                ResourceManagementClient, credential, azure_subscription_id, resource_group.RESOURCE_MGMT_API_VER
+            )
+            rg_inventory = inventory.Inventory(
+                [
+                    resource
+                    async for resource in resource_client.resources.list_by_resource_group(
+                        resource_group_name, expand="provisioningState"
+                    )
+                ]
+            )
+            inventory.set_cached(azure_subscription_id, resource_group_name, rg_inventory)
+    return rg_inventory
@@ -0,0 +1,47 @@
+import logging
+import sys
+
+from azure.identity.aio import AzureCliCredential
+from azure.mgmt.iothub.aio import IotHubClient
+from azure.mgmt.iothub.models import OperationInputs
+from utils import clients, lro
+
+from services import iot_hub
+from services.aio import inventory
+
+
+async def provision(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    iot_hub_name: str,
+    location: str,
+    logger: logging.Logger,
+):
+    iot_hub_client = clients.get_async_client(
+        IotHubClient, credential, azure_subscription_id, iot_hub.IOT_HUB_MGMT_API_VER
+    )
+    rg_inventory = await inventory.get(credential, azure_subscription_id, resource_group_name)
+    if not rg_inventory.is_provisioned(iot_hub.RESOURCE_TYPE, iot_hub_name):
+        avail_res = await iot_hub_client.iot_hub_resource.check_name_availability(OperationInputs(name=iot_hub_name))
+        if not avail_res.name_available:
+            logger.error(f"IotHub name '{iot_hub_name}' is not available")
+            sys.exit(1)
+        poller = await iot_hub_client.iot_hub_resource.begin_create_or_update(
+            resource_group_name, iot_hub_name, iot_hub.get_create_params(location)
+        )
+        iot_res = await lro.result_async(
+            poller,
+            lro.Operation(
+                iot_hub.RESOURCE_TYPE,
+                iot_hub_name,
+                IotHubClient,
+                iot_hub.IOT_HUB_MGMT_API_VER,
+                "iot_hub_resource.begin_create_or_update",
+                (resource_group_name, iot_hub_name, None),
+            ),
+        )
+        rg_inventory.record(iot_hub.RESOURCE_TYPE, iot_res.name, iot_res.id)
+        logger.info(f"Provisioned IotHub '{iot_res.name}'")
+    else:
+        logger.info(f"IotHub '{iot_hub_name}' is already provisioned")
@@ -0,0 +1,50 @@
+import logging
+import sys
+
+from azure.identity.aio import AzureCliCredential
+from azure.mgmt.keyvault.aio import KeyVaultManagementClient
+from azure.mgmt.keyvault.models import VaultCheckNameAvailabilityParameters
+from utils import clients, lro
+
+from services import key_vault
+from services.aio import inventory
+
+
+async def provision(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    key_vault_name: str,
+    tenant_id: str,
+    location: str,
+    logger: logging.Logger,
+):
+    key_vault_client = clients.get_async_client(
+        KeyVaultManagementClient, credential, azure_subscription_id, key_vault.KEY_VAULT_MGMT_API_VER
+    )
+    rg_inventory = await inventory.get(credential, azure_subscription_id, resource_group_name)
+    if not rg_inventory.is_provisioned(key_vault.RESOURCE_TYPE, key_vault_name):
+        avail_res = await key_vault_client.vaults.check_name_availability(
+            VaultCheckNameAvailabilityParameters(name=key_vault_name)
+        )
+        if not avail_res.name_available:
+            logger.error(f"Key Vault '{key_vault_name}' is not available")
+            sys.exit(1)
+        poller = await key_vault_client.vaults.begin_create_or_update(
+            resource_group_name, key_vault_name, key_vault.get_create_params(tenant_id, location)
+        )
+        kv_res = await lro.result_async(
+            poller,
+            lro.Operation(
+                key_vault.RESOURCE_TYPE,
+                key_vault_name,
+                KeyVaultManagementClient,
+                key_vault.KEY_VAULT_MGMT_API_VER,
+                "vaults.begin_create_or_update",
+                (resource_group_name, key_vault_name, None),
+            ),
+        )
+        rg_inventory.record(key_vault.RESOURCE_TYPE, kv_res.name, kv_res.id)
+        logger.info(f"Provisioned Key Vault '{kv_res.name}'")
+    else:
+        logger.info(f"Key Vault '{key_vault_name}' is already provisioned")
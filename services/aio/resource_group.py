@@ -0,0 +1,27 @@
+import logging
+
+from azure.identity.aio import AzureCliCredential
+from azure.mgmt.resource.resources.aio import ResourceManagementClient
+from azure.mgmt.resource.resources.models import ResourceGroup
+from utils import clients
+
+from services import resource_group
+
+
+async def provision(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    location: str,
+    logger: logging.Logger,
+):
+    resource_client = clients.get_async_client(
+        ResourceManagementClient, credential, azure_subscription_id, resource_group.RESOURCE_MGMT_API_VER
+    )
+    if not await resource_client.resource_groups.check_existence(resource_group_name):
+        rg_result = await resource_client.resource_groups.create_or_update(
+            resource_group_name, ResourceGroup(location=location)
+        )
+        logger.info(f"Provisioned resource group '{rg_result.name}'")
+    else:
+        logger.info(f"Resource group '{resource_group_name}' is already provisioned")
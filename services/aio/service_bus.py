@@ -0,0 +1,47 @@
+import logging
+import sys
+
+from azure.identity.aio import AzureCliCredential
+from azure.mgmt.servicebus.aio import ServiceBusManagementClient
+from azure.mgmt.servicebus.models import CheckNameAvailability
+from utils import clients, lro
+
+from services import service_bus
+from services.aio import inventory
+
+
+async def provision(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    service_bus_namespace: str,
+    location: str,
+    logger: logging.Logger,
+):
+    service_bus_client = clients.get_async_client(ServiceBusManagementClient, credential, azure_subscription_id)
+    rg_inventory = await inventory.get(credential, azure_subscription_id, resource_group_name)
+    if not rg_inventory.is_provisioned(service_bus.RESOURCE_TYPE, service_bus_namespace):
+        avail_res = await service_bus_client.namespaces.check_name_availability(
+            CheckNameAvailability(name=service_bus_namespace)
+        )
+        if not avail_res.name_available:
+            logger.error(f"ServiceBus namespace '{service_bus_namespace}' is not available")
+            sys.exit(1)
+        poller = await service_bus_client.namespaces.begin_create_or_update(
+            resource_group_name, service_bus_namespace, service_bus.get_create_params(location)
+        )
+        sb_res = await lro.result_async(
+            poller,
+            lro.Operation(
+                service_bus.RESOURCE_TYPE,
+                service_bus_namespace,
+                ServiceBusManagementClient,
+                None,
+                "namespaces.begin_create_or_update",
+                (resource_group_name, service_bus_namespace, None),
+            ),
+        )
+        rg_inventory.record(service_bus.RESOURCE_TYPE, sb_res.name, sb_res.id)
+        logger.info(f"Provisioned ServiceBus namespace '{sb_res.name}'")
+    else:
+        logger.info(f"ServiceBus namespace '{service_bus_namespace}' is already provisioned")
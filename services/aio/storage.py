@@ -0,0 +1,49 @@
+import logging
+import sys
+
+from azure.identity.aio import AzureCliCredential
+from azure.mgmt.storage.aio import StorageManagementClient
+from azure.mgmt.storage.models import StorageAccountCheckNameAvailabilityParameters
+from utils import clients, lro
+
+from services import storage
+from services.aio import inventory
+
+
+async def provision(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    storage_acc_name: str,
+    location: str,
+    logger: logging.Logger,
+):
+    storage_client = clients.get_async_client(
+        StorageManagementClient, credential, azure_subscription_id, storage.STORAGE_MGMT_API_VER
+    )
+    rg_inventory = await inventory.get(credential, azure_subscription_id, resource_group_name)
+    if not rg_inventory.is_provisioned(storage.RESOURCE_TYPE, storage_acc_name):
+        avail_res = await storage_client.storage_accounts.check_name_availability(
+            StorageAccountCheckNameAvailabilityParameters(name=storage_acc_name)
+        )
+        if not avail_res.name_available:
+            logger.error(f"Storage account '{storage_acc_name}' is not available")
+            sys.exit(1)
+        poller = await storage_client.storage_accounts.begin_create(
+            resource_group_name, storage_acc_name, storage.get_create_params(location)
+        )
+        storage_res = await lro.result_async(
+            poller,
+            lro.Operation(
+                storage.RESOURCE_TYPE,
+                storage_acc_name,
+                StorageManagementClient,
+                storage.STORAGE_MGMT_API_VER,
+                "storage_accounts.begin_create",
+                (resource_group_name, storage_acc_name, None),
+            ),
+        )
+        rg_inventory.record(storage.RESOURCE_TYPE, storage_res.name, storage_res.id)
+        logger.info(f"Provisioned Storage account '{storage_res.name}'")
+    else:
+        logger.info(f"Storage account '{storage_acc_name}' is already provisioned")
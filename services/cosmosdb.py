@@ -1,13 +1,44 @@
+import contextvars
+import datetime
+import fnmatch
+import functools
+import json
 import logging
+import re
 import sys
-from typing import Any, Dict, Optional, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
 
-from azure.cosmos import CosmosClient, DatabaseProxy
-from azure.cosmos.exceptions import CosmosResourceExistsError
+from azure.core.exceptions import ResourceNotFoundError
+from azure.cosmos import ContainerProxy, CosmosClient, DatabaseProxy
+from azure.cosmos.exceptions import CosmosResourceExistsError, CosmosResourceNotFoundError
 from azure.identity import AzureCliCredential
 from azure.mgmt.cosmosdb import CosmosDBManagementClient
-from azure.mgmt.cosmosdb.models import BackupPolicy, ConsistencyPolicy, DatabaseAccountCreateUpdateParameters, Location
+from azure.mgmt.cosmosdb.models import (
+    AutoscaleSettings,
+    AutoscaleSettingsResource,
+    BackupPolicy,
+    ConsistencyPolicy,
+    ContainerPartitionKey,
+    CreateUpdateOptions,
+    DatabaseAccountCreateUpdateParameters,
+    IndexingPolicy,
+    Location,
+    SqlContainerCreateUpdateParameters,
+    SqlContainerResource,
+    SqlDatabaseCreateUpdateParameters,
+    SqlDatabaseResource,
+    ThroughputSettingsGetResults,
+    ThroughputSettingsResource,
+    ThroughputSettingsUpdateParameters,
+    UniqueKeyPolicy,
+)
+from utils import clients, lro
 
+from services import inventory
+
+RESOURCE_TYPE = "Microsoft.DocumentDB/databaseAccounts"
 COSMOSDB_DB_NAME = "iot"
 MSG_CONTAINER_PART_KEY = "/deviceId"
 # Make sure the vendor names are known to `IoTHub_EventHub` Azure function.
@@ -16,6 +47,360 @@ LATEST_MSG_CONTAINER_TEMPLATE = "_latest_{}"
 LEASES_CONTAINER_TEMPLATE = "_leases_{}"
 LATEST_MSG_CONTAINER_PART_KEY = "/id"
 MSG_CONTAINER_DEFAULT_TTL = 15768000  # in seconds (6 months)
+# https://docs.microsoft.com/en-us/azure/cosmos-db/partitioning-overview
+# The messages containers are partitioned by device, pinning all the messages of a device to one logical partition
+# (at most 20 GB and 10k RU/s) for their whole TTL, or by device and day, with hierarchical partition keys or with a
+# synthetic key. The ingest functions set the day and synthetic key properties of every message.
+DEVICE_PARTITIONING = "device"
+HIERARCHICAL_PARTITIONING = "hierarchical"
+SYNTHETIC_PARTITIONING = "synthetic"
+DAY_PROPERTY = "day"
+SYNTHETIC_PART_KEY_PROPERTY = "partitionKey"
+# Containers created at a time, each creation is a round trip of its own.
+CONTAINER_CREATE_CONCURRENCY = 8
+# https://docs.microsoft.com/en-us/azure/cosmos-db/set-throughput
+MANUAL_THROUGHPUT = "manual"
+AUTOSCALE_THROUGHPUT = "autoscale"
+SHARED_THROUGHPUT = "shared"
+DEDICATED_THROUGHPUT = "dedicated"
+# Lowest RU/s and their increment, by throughput mode.
+MIN_THROUGHPUT = {MANUAL_THROUGHPUT: 400, AUTOSCALE_THROUGHPUT: 1000}
+THROUGHPUT_INCREMENT = {MANUAL_THROUGHPUT: 100, AUTOSCALE_THROUGHPUT: 1000}
+SQL_RESOURCE_TYPES = {
+    "sql_database": "Microsoft.DocumentDB/databaseAccounts/sqlDatabases",
+    "sql_container": "Microsoft.DocumentDB/databaseAccounts/sqlDatabases/containers",
+}
+THROUGHPUT_SETTINGS_TYPE = "Microsoft.DocumentDB/databaseAccounts/sqlDatabases/throughputSettings"
+
+
+# https://docs.microsoft.com/en-us/azure/cosmos-db/index-policy
+# Paths every messages container is queried by, the rest of the telemetry is not indexed.
+MSG_INDEXED_PATHS: Tuple[str, ...] = ("/deviceId/?", "/enqueuedTimeUtc/?", "/deviceVendor/?")
+# The latest message of a device is read by its ID, only the staleness of the devices is queried.
+LATEST_MSG_INDEXED_PATHS: Tuple[str, ...] = ("/enqueuedTimeUtc/?",)
+# The one path excluded by the service whatever the policy.
+ETAG_PATH = '/"_etag"/?'
+
+
+def get_indexing_policy(
+    included_paths: Tuple[str, ...], composite_indexes: Tuple[Tuple[Tuple[str, str], ...], ...] = ()
+) -> Dict[str, Any]:
+    """Indexing policy of only the given paths, with the given composite indexes of (path, order) pairs."""
+    return {
+        "indexingMode": "consistent",
+        "automatic": True,
+        "includedPaths": [{"path": path} for path in included_paths],
+        "excludedPaths": [{"path": "/*"}],
+        "compositeIndexes": [
+            [{"path": path, "order": order} for path, order in composite_index] for composite_index in composite_indexes
+        ],
+    }
+
+
+def get_messages_indexing_policy() -> Dict[str, Any]:
+    # The messages of a device are queried in either order of their enqueued time.
+    composite_indexes = tuple(
+        (("/deviceId", "ascending"), ("/enqueuedTimeUtc", order)) for order in ("ascending", "descending")
+    )
+    return get_indexing_policy(MSG_INDEXED_PATHS, composite_indexes)
+
+
+def get_indexing_key(indexing_policy: Dict[str, Any]) -> Tuple[Any, ...]:
+    """What an indexing policy amounts to, regardless of the order of its paths and of the defaults the service adds."""
+    return (
+        indexing_policy.get("indexingMode", "consistent").lower(),
+        indexing_policy.get("automatic", True),
+        frozenset(path["path"] for path in indexing_policy.get("includedPaths", [{"path": "/*"}])),
+        frozenset(path["path"] for path in indexing_policy.get("excludedPaths", []) if path["path"] != ETAG_PATH),
+        frozenset(
+            tuple((path["path"], path.get("order", "ascending")) for path in composite_index)
+            for composite_index in indexing_policy.get("compositeIndexes", [])
+        ),
+    )
+
+
+class Partitioning(NamedTuple):
+    # Template of the ID of the messages container of a vendor, a partition key cannot change once created.
+    container_template: str
+    partition_key: Dict[str, Any]
+
+
+PARTITIONINGS: Dict[str, Partitioning] = {
+    DEVICE_PARTITIONING: Partitioning("{}", {"paths": [MSG_CONTAINER_PART_KEY]}),
+    # https://docs.microsoft.com/en-us/azure/cosmos-db/hierarchical-partition-keys
+    HIERARCHICAL_PARTITIONING: Partitioning(
+        "{}_hierarchical", {"paths": [MSG_CONTAINER_PART_KEY, f"/{DAY_PROPERTY}"], "kind": "MultiHash", "version": 2}
+    ),
+    # https://docs.microsoft.com/en-us/azure/cosmos-db/synthetic-partition-keys
+    SYNTHETIC_PARTITIONING: Partitioning("{}_synthetic", {"paths": [f"/{SYNTHETIC_PART_KEY_PROPERTY}"]}),
+}
+
+
+def get_messages_container_id(vendor_name: str, partitioning: str) -> str:
+    return PARTITIONINGS[partitioning].container_template.format(vendor_name)
+
+
+def get_partitionings(vendor_partitionings: Optional[List[str]], logger: logging.Logger) -> Dict[str, str]:
+    """Partitioning of every vendor, from 'VENDOR=PARTITIONING' pairs, by device for the vendors without one."""
+    partitionings = {vendor_name: DEVICE_PARTITIONING for vendor_name in VENDOR_NAMES}
+    for vendor_partitioning in vendor_partitionings or []:
+        vendor_name, _, partitioning = vendor_partitioning.partition("=")
+        if vendor_name not in partitionings or partitioning not in PARTITIONINGS:
+            logger.error(
+                f"Vendor partitioning '{vendor_partitioning}' has to be one of {', '.join(VENDOR_NAMES)}, '=' and "
+                f"one of {', '.join(PARTITIONINGS)}"
+            )
+            sys.exit(1)
+        partitionings[vendor_name] = partitioning
+    return partitionings
+
+
+def get_partition_properties(message: Dict[str, Any]) -> Dict[str, str]:
+    """The day and synthetic partition key properties of a message, as the ingest functions set them."""
+    enqueued_time = message.get("enqueuedTimeUtc")
+    if isinstance(enqueued_time, str) and re.match(r"\d{4}-\d{2}-\d{2}", enqueued_time):
+        day = enqueued_time[:10]
+    else:
+        day = datetime.datetime.fromtimestamp(message["_ts"], datetime.timezone.utc).strftime("%Y-%m-%d")
+    return {DAY_PROPERTY: day, SYNTHETIC_PART_KEY_PROPERTY: f"{message['deviceId']}_{day.replace('-', '')}"}
+
+
+class ContainerSpec(NamedTuple):
+    # https://docs.microsoft.com/en-us/rest/api/cosmos-db-resource-provider/2021-03-15/sqlresources/createupdatesqlcontainer#sqlcontainerresource
+    id: str
+    partition_key: Dict[str, Any]
+    indexing_policy: Dict[str, Any]
+    default_ttl: Optional[int] = None
+    unique_key_policy: Optional[Dict[str, Any]] = None
+
+
+def get_vendor_containers(vendor_name: str, partitioning: str = DEVICE_PARTITIONING) -> List[ContainerSpec]:
+    """The messages container of a vendor and the one of its latest message per device."""
+    return [
+        ContainerSpec(
+            get_messages_container_id(vendor_name, partitioning),
+            PARTITIONINGS[partitioning].partition_key,
+            get_messages_indexing_policy(),
+            MSG_CONTAINER_DEFAULT_TTL,
+        ),
+        ContainerSpec(
+            LATEST_MSG_CONTAINER_TEMPLATE.format(vendor_name),
+            {"paths": [LATEST_MSG_CONTAINER_PART_KEY]},
+            get_indexing_policy(LATEST_MSG_INDEXED_PATHS),
+            None,
+            {"paths": [LATEST_MSG_CONTAINER_PART_KEY]},
+        ),
+    ]
+
+
+def get_containers(partitionings: Dict[str, str]) -> List[ContainerSpec]:
+    return [
+        container
+        for vendor_name in VENDOR_NAMES
+        for container in get_vendor_containers(vendor_name, partitionings[vendor_name])
+    ]
+
+
+class Throughput(NamedTuple):
+    mode: str
+    # The RU/s of the manual mode, the most the autoscale one scales up to.
+    max_ru: int
+
+    def get_create_options(self) -> Dict[str, Any]:
+        """Keyword arguments of the data plane `create_database` and `create_container`, in manual mode only.
+
+        The data plane SDK has no way of creating autoscale resources, see `get_create_update_options`.
+        """
+        return {"offer_throughput": self.max_ru}
+
+    def get_create_update_options(self) -> CreateUpdateOptions:
+        """Options of the `sql_resources` creations of the management plane."""
+        if self.mode == MANUAL_THROUGHPUT:
+            return CreateUpdateOptions(throughput=self.max_ru)
+        return CreateUpdateOptions(autoscale_settings=AutoscaleSettings(max_throughput=self.max_ru))
+
+    def get_update_params(self) -> ThroughputSettingsUpdateParameters:
+        if self.mode == MANUAL_THROUGHPUT:
+            return ThroughputSettingsUpdateParameters(resource=ThroughputSettingsResource(throughput=self.max_ru))
+        resource = ThroughputSettingsResource(autoscale_settings=AutoscaleSettingsResource(max_throughput=self.max_ru))
+        return ThroughputSettingsUpdateParameters(resource=resource)
+
+    @staticmethod
+    def from_settings(settings: ThroughputSettingsGetResults) -> "Throughput":
+        autoscale_settings = settings.resource.autoscale_settings
+        if autoscale_settings is not None and autoscale_settings.max_throughput:
+            return Throughput(AUTOSCALE_THROUGHPUT, autoscale_settings.max_throughput)
+        return Throughput(MANUAL_THROUGHPUT, settings.resource.throughput)
+
+
+class ThroughputProfile(NamedTuple):
+    """Throughput of the database, shared by the containers without one of their own, and of the containers.
+
+    `containers` are (container ID pattern, throughput) pairs: the first pattern matching a
+    container gives its dedicated throughput, or None for the shared one, which is the default.
+    """
+
+    database: Optional[Throughput]
+    containers: List[Tuple[str, Optional[Throughput]]]
+
+    def get_container_throughput(self, container_id: str) -> Optional[Throughput]:
+        for pattern, throughput in self.containers:
+            if fnmatch.fnmatchcase(container_id, pattern):
+                return throughput
+        return None
+
+
+DEFAULT_THROUGHPUT_PROFILE = ThroughputProfile(Throughput(MANUAL_THROUGHPUT, 400), [])
+
+
+def is_autoscale(throughput: Optional[Throughput]) -> bool:
+    return throughput is not None and throughput.mode == AUTOSCALE_THROUGHPUT
+
+
+def get_database_create_params(throughput: Throughput) -> SqlDatabaseCreateUpdateParameters:
+    return SqlDatabaseCreateUpdateParameters(
+        resource=SqlDatabaseResource(id=COSMOSDB_DB_NAME), options=throughput.get_create_update_options()
+    )
+
+
+def get_container_create_params(container: ContainerSpec, throughput: Throughput) -> SqlContainerCreateUpdateParameters:
+    # The specs are in the REST format of the data plane, which the management plane models read as well.
+    resource = SqlContainerResource(
+        id=container.id,
+        partition_key=ContainerPartitionKey.from_dict(container.partition_key),
+        indexing_policy=IndexingPolicy.from_dict(container.indexing_policy),
+        default_ttl=container.default_ttl,
+        unique_key_policy=container.unique_key_policy and UniqueKeyPolicy.from_dict(container.unique_key_policy),
+    )
+    return SqlContainerCreateUpdateParameters(resource=resource, options=throughput.get_create_update_options())
+
+
+def _parse_throughput(name: str, value: Dict[str, Any], logger: logging.Logger) -> Throughput:
+    mode = value.get("mode", MANUAL_THROUGHPUT)
+    max_ru = value.get("max_ru")
+    if mode not in MIN_THROUGHPUT:
+        logger.error(f"Throughput mode of '{name}' has to be '{MANUAL_THROUGHPUT}' or '{AUTOSCALE_THROUGHPUT}'")
+        sys.exit(1)
+    if not isinstance(max_ru, int) or max_ru < MIN_THROUGHPUT[mode] or max_ru % THROUGHPUT_INCREMENT[mode]:
+        logger.error(
+            f"'max_ru' of '{name}' has to be a multiple of {THROUGHPUT_INCREMENT[mode]} RU/s of at least "
+            f"{MIN_THROUGHPUT[mode]} RU/s in {mode} mode"
+        )
+        sys.exit(1)
+    return Throughput(mode, max_ru)
+
+
+def load_throughput_profile(
+    path: Optional[str], containers: List[ContainerSpec], logger: logging.Logger
+) -> ThroughputProfile:
+    """Read a throughput profile JSON file, `DEFAULT_THROUGHPUT_PROFILE` without one. Its format is:
+
+    {"database": {"mode": "manual", "max_ru": 400},
+     "containers": {"vemcon": {"throughput": "dedicated", "mode": "autoscale", "max_ru": 4000},
+                    "_latest_*": {"throughput": "shared"}}}
+
+    A null database has no shared throughput, all its containers need a dedicated one then.
+    """
+    if not path:
+        return DEFAULT_THROUGHPUT_PROFILE
+    try:
+        with open(path, "r") as f:
+            content = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Cannot read the throughput profile '{path}': {e}")
+        sys.exit(1)
+    database = DEFAULT_THROUGHPUT_PROFILE.database
+    if "database" in content:
+        database = content["database"] and _parse_throughput(COSMOSDB_DB_NAME, content["database"], logger)
+    container_throughputs: List[Tuple[str, Optional[Throughput]]] = []
+    for pattern, value in content.get("containers", {}).items():
+        kind = value.get("throughput", DEDICATED_THROUGHPUT)
+        if kind == SHARED_THROUGHPUT:
+            container_throughputs.append((pattern, None))
+        elif kind == DEDICATED_THROUGHPUT:
+            container_throughputs.append((pattern, _parse_throughput(pattern, value, logger)))
+        else:
+            logger.error(f"Throughput of '{pattern}' has to be '{SHARED_THROUGHPUT}' or '{DEDICATED_THROUGHPUT}'")
+            sys.exit(1)
+    profile = ThroughputProfile(database, container_throughputs)
+    if database is None:
+        for container in containers:
+            if profile.get_container_throughput(container.id) is None:
+                logger.error(f"Container '{container.id}' has no throughput, the database has none to share")
+                sys.exit(1)
+    return profile
+
+
+def get_throughput_changes(
+    name: str, current: Optional[Throughput], wanted: Optional[Throughput], logger: logging.Logger
+) -> List[Tuple[str, Tuple[Any, ...]]]:
+    """The `sql_resources` operations bringing a throughput to the wanted one, as method name templates and arguments.
+
+    The templates take the kind of resource, e.g. `sql_container`. None stands for the
+    throughput shared with the database, which only changes by recreating the container.
+    """
+    if current == wanted:
+        return []
+    if current is None or wanted is None:
+        logger.warning(
+            f"'{name}' has {'shared' if current is None else 'dedicated'} throughput unlike its throughput "
+            f"profile, which can only change by recreating it"
+        )
+        return []
+    changes: List[Tuple[str, Tuple[Any, ...]]] = []
+    if current.mode != wanted.mode:
+        migrate = "to_autoscale" if wanted.mode == AUTOSCALE_THROUGHPUT else "to_manual_throughput"
+        changes.append((f"begin_migrate_{{}}_{migrate}", ()))
+    changes.append(("begin_update_{}_throughput", (wanted.get_update_params(),)))
+    logger.info(f"Changing the throughput of '{name}' from {current.mode} {current.max_ru} RU/s to {wanted.mode} "
+                f"{wanted.max_ru} RU/s")
+    return changes
+
+
+def get_missing_autoscale_containers(
+    containers: List[ContainerSpec], throughput_profile: ThroughputProfile, existing: Optional[Set[str]]
+) -> List[Tuple[ContainerSpec, Throughput]]:
+    """The containers `DatabaseInitializer` leaves to the management plane, with their throughput."""
+    missing = []
+    for container in containers:
+        throughput = throughput_profile.get_container_throughput(container.id)
+        if is_autoscale(throughput) and (existing is None or container.id not in existing):
+            missing.append((container, throughput))
+    return missing
+
+
+def check_created_throughput(
+    name: str, settings: ThroughputSettingsGetResults, wanted: Throughput, logger: logging.Logger
+):
+    """Exit unless the throughput read back from a created resource is the wanted one."""
+    current = Throughput.from_settings(settings)
+    if current != wanted:
+        logger.error(
+            f"'{name}' is created with {current.mode} {current.max_ru} RU/s instead of {wanted.mode} "
+            f"{wanted.max_ru} RU/s"
+        )
+        sys.exit(1)
+    logger.info(f"'{name}' is created in Cosmos DB with {wanted.mode} throughput of {wanted.max_ru} RU/s")
+
+
+def get_create_params(location: str) -> DatabaseAccountCreateUpdateParameters:
+    return DatabaseAccountCreateUpdateParameters(
+        locations=[Location(location_name=location, failover_priority=0)],
+        location=location,
+        kind="GlobalDocumentDB",
+        consistency_policy=ConsistencyPolicy(default_consistency_level="Session"),
+        is_virtual_network_filter_enabled=False,
+        enable_automatic_failover=True,
+        enable_multiple_write_locations=False,
+        disable_key_based_metadata_write_access=False,
+        default_identity="FirstPartyIdentity",
+        public_network_access="Enabled",
+        enable_free_tier=True,
+        enable_analytical_storage=False,
+        backup_policy=BackupPolicy(type="Periodic"),
+        network_acl_bypass="None",
+        network_acl_bypass_resource_ids=[],
+    )
 
 
 class Provisioner:
@@ -26,6 +411,8 @@ class Provisioner:
         resource_group_name: str,
         cosmosdb_name: str,
         location: str,
+        throughput_profile_path: Optional[str],
+        vendor_partitionings: Optional[List[str]],
         logger: logging.Logger,
     ):
         self._credential = credential
@@ -34,38 +421,33 @@ class Provisioner:
         self._cosmosdb_name = cosmosdb_name
         self._location = location
         self._logger = logger
+        self._containers = get_containers(get_partitionings(vendor_partitionings, logger))
+        self._throughput_profile = load_throughput_profile(throughput_profile_path, self._containers, logger)
 
-        self._cosmosdb_client = CosmosDBManagementClient(self._credential, self._azure_subscription_id)
+        self._cosmosdb_client = clients.get_client(CosmosDBManagementClient, self._credential, self._azure_subscription_id)
 
     def provision(self):
-        if self._cosmosdb_name not in {
-            desc_list_res.name
-            for desc_list_res in self._cosmosdb_client.database_accounts.list_by_resource_group(self._resource_group_name)
-        }:
+        rg_inventory = inventory.get(self._credential, self._azure_subscription_id, self._resource_group_name)
+        if not rg_inventory.is_provisioned(RESOURCE_TYPE, self._cosmosdb_name):
             if self._cosmosdb_client.database_accounts.check_name_exists(self._cosmosdb_name):
                 self._logger.error(f"Cosmos DB name '{self._cosmosdb_name}' is not available")
                 sys.exit(1)
-            upd_params = DatabaseAccountCreateUpdateParameters(
-                locations=[Location(location_name=self._location, failover_priority=0)],
-                location=self._location,
-                kind="GlobalDocumentDB",
-                consistency_policy=ConsistencyPolicy(default_consistency_level="Session"),
-                is_virtual_network_filter_enabled=False,
-                enable_automatic_failover=True,
-                enable_multiple_write_locations=False,
-                disable_key_based_metadata_write_access=False,
-                default_identity="FirstPartyIdentity",
-                public_network_access="Enabled",
-                enable_free_tier=True,
-                enable_analytical_storage=False,
-                backup_policy=BackupPolicy(type="Periodic"),
-                network_acl_bypass="None",
-                network_acl_bypass_resource_ids=[],
-            )
+            upd_params = get_create_params(self._location)
             poller = self._cosmosdb_client.database_accounts.begin_create_or_update(
                 self._resource_group_name, self._cosmosdb_name, upd_params
             )
-            cosmosdb_res = poller.result()
+            cosmosdb_res = lro.result(
+                poller,
+                lro.Operation(
+                    RESOURCE_TYPE,
+                    self._cosmosdb_name,
+                    CosmosDBManagementClient,
+                    None,
+                    "database_accounts.begin_create_or_update",
+                    (self._resource_group_name, self._cosmosdb_name, None),
+                ),
+            )
+            rg_inventory.record(RESOURCE_TYPE, cosmosdb_res.name, cosmosdb_res.id)
             self._logger.info(f"Provisioned Cosmos DB '{cosmosdb_res.name}'")
         else:
             self._logger.info(f"Cosmos DB '{self._cosmosdb_name}' is already provisioned")
@@ -77,57 +459,280 @@ class Provisioner:
     def _initialize_db(self):
         keys = self._cosmosdb_client.database_accounts.list_keys(self._resource_group_name, self._cosmosdb_name)
         acc_res = self._cosmosdb_client.database_accounts.get(self._resource_group_name, self._cosmosdb_name)
-        cosmos_client = CosmosClient(acc_res.document_endpoint, keys.secondary_master_key)
-        try:
-            cosmos_client.create_database(COSMOSDB_DB_NAME, populate_query_metrics=True, offer_throughput=400)
-            self._logger.info(f"'{COSMOSDB_DB_NAME}' database is created in Cosmos DB")
-        except CosmosResourceExistsError:
-            self._logger.info(f"Cosmos DB already has '{COSMOSDB_DB_NAME}' database")
+        db_args = (self._resource_group_name, self._cosmosdb_name, COSMOSDB_DB_NAME)
+        database_throughput = self._throughput_profile.database
+        if is_autoscale(database_throughput):
+            try:
+                self._cosmosdb_client.sql_resources.get_sql_database(*db_args)
+            except ResourceNotFoundError:
+                self._create(
+                    "sql_database",
+                    db_args,
+                    COSMOSDB_DB_NAME,
+                    get_database_create_params(database_throughput),
+                    database_throughput,
+                )
+        existing = DatabaseInitializer(
+            acc_res.document_endpoint,
+            keys.secondary_master_key,
+            self._containers,
+            self._throughput_profile,
+            self._logger,
+        ).initialize()
+        autoscale_containers = get_missing_autoscale_containers(self._containers, self._throughput_profile, existing)
+        if autoscale_containers:
+            with ThreadPoolExecutor(
+                max_workers=min(CONTAINER_CREATE_CONCURRENCY, len(autoscale_containers)), thread_name_prefix="cosmos"
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        contextvars.copy_context().run,
+                        self._create,
+                        "sql_container",
+                        (*db_args, container.id),
+                        container.id,
+                        get_container_create_params(container, throughput),
+                        throughput,
+                    )
+                    for container, throughput in autoscale_containers
+                ]
+                for future in futures:
+                    future.result()
+        if existing is not None:
+            self._reconcile_throughput(existing)
 
-        db_proxy = cosmos_client.get_database_client(COSMOSDB_DB_NAME)
-        for vendor_name in VENDOR_NAMES:
-            self._create_vendor_containers(db_proxy, vendor_name)
-
-    def _create_vendor_containers(self, db_proxy: DatabaseProxy, vendor_name: str):
-        # https://docs.microsoft.com/en-us/rest/api/cosmos-db-resource-provider/2021-03-15/sqlresources/createupdatesqlcontainer#sqlcontainerresource
-        self._create_container(
-            db_proxy,
-            vendor_name,
-            {"paths": [MSG_CONTAINER_PART_KEY]},
-            {"automatic": True},
-            MSG_CONTAINER_DEFAULT_TTL,
-            True,
-        )
-        self._create_container(
-            db_proxy,
-            LATEST_MSG_CONTAINER_TEMPLATE.format(vendor_name),
-            {"paths": [LATEST_MSG_CONTAINER_PART_KEY]},
-            {"automatic": True},
-            None,
-            True,
-            {"paths": [LATEST_MSG_CONTAINER_PART_KEY]},
+    def _create(self, kind: str, args: Tuple[str, ...], name: str, params: Any, throughput: Throughput):
+        """Create a database or container through the management plane, the only one setting autoscale throughput."""
+        sql_resources = self._cosmosdb_client.sql_resources
+        method = f"begin_create_update_{kind}"
+        poller = getattr(sql_resources, method)(*args, params)
+        lro.result(
+            poller,
+            lro.Operation(
+                SQL_RESOURCE_TYPES[kind],
+                f"{self._cosmosdb_name}/{name}",
+                CosmosDBManagementClient,
+                None,
+                f"sql_resources.{method}",
+                (*args, None),
+            ),
         )
+        settings = getattr(sql_resources, f"get_{kind}_throughput")(*args)
+        check_created_throughput(name, settings, throughput, self._logger)
+
+    def _reconcile_throughput(self, existing: Set[str]):
+        """Bring the throughput of the database and containers that existed before to the profile."""
+        db_args = (self._resource_group_name, self._cosmosdb_name, COSMOSDB_DB_NAME)
+        self._reconcile("sql_database", db_args, COSMOSDB_DB_NAME, self._throughput_profile.database)
+        for container in self._containers:
+            if container.id in existing:
+                self._reconcile(
+                    "sql_container",
+                    (*db_args, container.id),
+                    container.id,
+                    self._throughput_profile.get_container_throughput(container.id),
+                )
+
+    def _reconcile(self, kind: str, args: Tuple[str, ...], name: str, wanted: Optional[Throughput]):
+        sql_resources = self._cosmosdb_client.sql_resources
+        try:
+            current = Throughput.from_settings(getattr(sql_resources, f"get_{kind}_throughput")(*args))
+        except ResourceNotFoundError:
+            # Without throughput settings of its own, a container shares the one of the database.
+            current = None
+        for method_template, params in get_throughput_changes(name, current, wanted, self._logger):
+            method = method_template.format(kind)
+            poller = getattr(sql_resources, method)(*args, *params)
+            lro.result(
+                poller,
+                lro.Operation(
+                    THROUGHPUT_SETTINGS_TYPE,
+                    f"{self._cosmosdb_name}/{name}",
+                    CosmosDBManagementClient,
+                    None,
+                    f"sql_resources.{method}",
+                    (*args, *([None] * len(params))),
+                ),
+            )
 
-    def _create_container(
+
+class DatabaseInitializer:
+    def __init__(
         self,
-        db_proxy: DatabaseProxy,
-        id: str,
-        partition_key: str,
-        indexing_policy: Dict[str, Any],
-        default_ttl: Optional[int] = None,
-        populate_query_metrics: bool = True,
-        unique_key_policy: Dict[str, Any] = None,
+        document_endpoint: str,
+        master_key: str,
+        containers: List[ContainerSpec],
+        throughput_profile: ThroughputProfile,
+        logger: logging.Logger,
     ):
+        self._document_endpoint = document_endpoint
+        self._master_key = master_key
+        self._containers = containers
+        self._throughput_profile = throughput_profile
+        self._logger = logger
+
+    def initialize(self) -> Optional[Set[str]]:
+        """Create the database and its missing containers with the throughput of the profile.
+
+        Those of autoscale throughput are left to the management plane, the database being
+        created beforehand and the containers afterwards. Return the IDs of the containers that
+        already existed, None when the database is new.
+        """
+        cosmos_client = CosmosClient(self._document_endpoint, self._master_key, **clients.get_data_plane_options())
+        database_throughput = self._throughput_profile.database
+        if is_autoscale(database_throughput):
+            existing: Optional[Set[str]] = set()
+        else:
+            try:
+                cosmos_client.create_database(
+                    COSMOSDB_DB_NAME,
+                    populate_query_metrics=True,
+                    **(database_throughput.get_create_options() if database_throughput else {}),
+                )
+                self._logger.info(f"'{COSMOSDB_DB_NAME}' database is created in Cosmos DB")
+                existing = None
+            except CosmosResourceExistsError:
+                self._logger.info(f"Cosmos DB already has '{COSMOSDB_DB_NAME}' database")
+                existing = set()
+
+        db_proxy = cosmos_client.get_database_client(COSMOSDB_DB_NAME)
+        listed: Dict[str, Dict[str, Any]] = {}
+        if existing is not None:
+            # A single listing instead of a conflicting creation per existing container.
+            listed = {properties["id"]: properties for properties in db_proxy.list_containers()}
+            existing = set(listed)
+        tasks = []
+        for container in self._containers:
+            properties = listed.get(container.id)
+            if properties is None:
+                if not is_autoscale(self._throughput_profile.get_container_throughput(container.id)):
+                    tasks.append((self._create_container, container))
+                continue
+            self._logger.info(f"Collection '{container.id}' already exists in '{db_proxy.id}' database")
+            indexing_policy = properties.get("indexingPolicy", {})
+            if get_indexing_key(indexing_policy) != get_indexing_key(container.indexing_policy):
+                tasks.append((functools.partial(self._replace_indexing_policy, properties), container))
+        if not tasks:
+            return existing
+        # The containers are independent, their creations only share the pooled transport of the client.
+        with ThreadPoolExecutor(
+            max_workers=min(CONTAINER_CREATE_CONCURRENCY, len(tasks)), thread_name_prefix="cosmos"
+        ) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, func, db_proxy, container) for func, container in tasks
+            ]
+            for future in futures:
+                future.result()
+        return existing
+
+    def _replace_indexing_policy(self, properties: Dict[str, Any], db_proxy: DatabaseProxy, container: ContainerSpec):
+        # https://docs.microsoft.com/en-us/rest/api/cosmos-db/replace-a-collection
+        # A replace resets the properties its body leaves out, e.g. the unique keys, which `replace_container` does
+        # not send. The properties as listed are sent back instead, only the indexing policy changed.
+        body = dict(properties, indexingPolicy=container.indexing_policy)
+        container_link = db_proxy.get_container_client(container.id).container_link
+        db_proxy.client_connection.ReplaceContainer(container_link, body, {"populateQueryMetrics": True})
+        # The documents are reindexed in the background, the queries keep using the previous index meanwhile.
+        self._logger.info(f"Indexing policy of collection '{container.id}' is updated in '{db_proxy.id}' database")
+
+    def _create_container(self, db_proxy: DatabaseProxy, container: ContainerSpec):
         # https://docs.microsoft.com/en-us/rest/api/cosmos-db-resource-provider/2021-03-15/sqlresources/createupdatesqlcontainer#sqlcontainerresource
+        throughput = self._throughput_profile.get_container_throughput(container.id)
         try:
             db_proxy.create_container(
-                id=id,
-                partition_key=partition_key,
-                indexing_policy=indexing_policy,
-                default_ttl=default_ttl,
-                populate_query_metrics=populate_query_metrics,
-                unique_key_policy=unique_key_policy,
+                id=container.id,
+                partition_key=container.partition_key,
+                indexing_policy=container.indexing_policy,
+                default_ttl=container.default_ttl,
+                populate_query_metrics=True,
+                unique_key_policy=container.unique_key_policy,
+                **(throughput.get_create_options() if throughput else {}),
             )
-            self._logger.info("Collection '{}' is created in '{}' database".format(id, db_proxy.id))
+            self._logger.info("Collection '{}' is created in '{}' database".format(container.id, db_proxy.id))
         except CosmosResourceExistsError:
-            self._logger.info("Collection '{}' already exists in '{}' database".format(id, db_proxy.id))
+            # Created by another run since the listing.
+            self._logger.info("Collection '{}' already exists in '{}' database".format(container.id, db_proxy.id))
+
+
+def _copy_partition_key_range(
+    source: ContainerProxy, target: ContainerProxy, range_id: str, now: float, logger: logging.Logger
+) -> Tuple[int, int]:
+    copied = expired = 0
+    # The change feed from the beginning has the latest version of every message of the range, and ends once read.
+    for message in source.query_items_change_feed(partition_key_range_id=range_id, is_start_from_beginning=True):
+        # The copy expires with the message, instead of living for a whole TTL again.
+        ttl = MSG_CONTAINER_DEFAULT_TTL - int(now - message["_ts"])
+        if ttl <= 0:
+            expired += 1
+            continue
+        body = {key: value for key, value in message.items() if not key.startswith("_")}
+        body.update(get_partition_properties(message))
+        body["ttl"] = ttl
+        # Upserts, so that an interrupted migration can simply be run again.
+        target.upsert_item(body)
+        copied += 1
+    logger.info(f"Copied {copied} messages of partition key range {range_id} of '{source.id}'")
+    return copied, expired
+
+
+def migrate_messages(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    cosmosdb_name: str,
+    vendor_name: str,
+    source_partitioning: str,
+    target_partitioning: str,
+    concurrency: int,
+    logger: logging.Logger,
+):
+    """Copy the messages of a vendor to its container of another partitioning.
+
+    The target container is the one a deployment with that partitioning creates and writes the
+    new messages to. The partition key ranges of the source container are read in parallel.
+    """
+    source_id = get_messages_container_id(vendor_name, source_partitioning)
+    target_id = get_messages_container_id(vendor_name, target_partitioning)
+    if source_id == target_id:
+        logger.error(f"The messages of '{vendor_name}' are already in '{source_id}'")
+        sys.exit(1)
+    cosmosdb_client = clients.get_client(CosmosDBManagementClient, credential, azure_subscription_id)
+    keys = cosmosdb_client.database_accounts.list_keys(resource_group_name, cosmosdb_name)
+    acc_res = cosmosdb_client.database_accounts.get(resource_group_name, cosmosdb_name)
+    cosmos_client = CosmosClient(
+        acc_res.document_endpoint, keys.secondary_master_key, **clients.get_data_plane_options()
+    )
+    db_proxy = cosmos_client.get_database_client(COSMOSDB_DB_NAME)
+    source = db_proxy.get_container_client(source_id)
+    target = db_proxy.get_container_client(target_id)
+    for container in (source, target):
+        try:
+            container.read()
+        except CosmosResourceNotFoundError:
+            logger.error(f"'{COSMOSDB_DB_NAME}' database has no '{container.id}' container, deploy with it first")
+            sys.exit(1)
+
+    # The SDK has no public listing of the partition key ranges, the change feed is read by range.
+    range_ids = [
+        partition_key_range["id"]
+        for partition_key_range in source.client_connection._ReadPartitionKeyRanges(source.container_link)
+    ]
+    logger.info(f"Copying '{source_id}' to '{target_id}' with {len(range_ids)} change feed readers")
+    now = time.time()
+    copied = expired = 0
+    max_workers = max(1, min(concurrency, len(range_ids)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="migrate") as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run, _copy_partition_key_range, source, target, range_id, now, logger
+            )
+            for range_id in range_ids
+        ]
+        for future in futures:
+            range_copied, range_expired = future.result()
+            copied += range_copied
+            expired += range_expired
+    logger.info(
+        f"Copied {copied} messages of '{source_id}' to '{target_id}', skipped {expired} expired ones. "
+        f"'{source_id}' can be deleted once the functions write to '{target_id}'"
+    )
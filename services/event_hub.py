@@ -4,10 +4,30 @@ import sys
 from azure.identity import AzureCliCredential
 from azure.mgmt.eventhub import EventHubManagementClient
 from azure.mgmt.eventhub.models import CheckNameAvailabilityParameter, EHNamespace, Eventhub, NetworkRuleSet, Sku
+from utils import clients
 
+from services import inventory
+
+RESOURCE_TYPE = "Microsoft.EventHub/namespaces"
 EVENT_HUB_MGMT_API_VER = "2017-04-01"
 
 
+def get_namespace_create_params(location: str) -> EHNamespace:
+    # https://docs.microsoft.com/en-us/python/api/azure-mgmt-eventhub/azure.mgmt.eventhub.v2017_04_01.models.ehnamespace?view=azure-python
+    eh_namespace_sku = Sku(name="Standard", tier="Standard", capacity=1)
+    # https://docs.microsoft.com/en-us/azure/event-hubs/event-hubs-auto-inflate
+    return EHNamespace(location=location, sku=eh_namespace_sku, is_auto_inflate_enabled=True, maximum_throughput_units=20)
+
+
+def get_namespace_network_rule_set() -> NetworkRuleSet:
+    return NetworkRuleSet(default_action="Allow")
+
+
+def get_create_params() -> Eventhub:
+    # https://docs.microsoft.com/en-us/azure/event-hubs/event-hubs-faq#partitions
+    return Eventhub(message_retention_in_days=1, partition_count=32)
+
+
 class Provisioner:
     def __init__(
         self,
@@ -27,33 +47,27 @@ class Provisioner:
         self._location = location
         self._logger = logger
 
-        self._event_hub_client = EventHubManagementClient(
-            credential, azure_subscription_id, api_version=EVENT_HUB_MGMT_API_VER
+        self._event_hub_client = clients.get_client(
+            EventHubManagementClient, credential, azure_subscription_id, EVENT_HUB_MGMT_API_VER
         )
 
     def _provision_eh_namespace(self):
         # https://docs.microsoft.com/en-us/python/api/azure-mgmt-eventhub/azure.mgmt.eventhub.v2017_04_01.operations.namespacesoperations?view=azure-python
-        if self._event_hub_namespace not in {
-            desc_list_res.name
-            for desc_list_res in self._event_hub_client.namespaces.list_by_resource_group(self._resource_group_name)
-        }:
+        rg_inventory = inventory.get(self._credential, self._azure_subscription_id, self._resource_group_name)
+        if not rg_inventory.is_provisioned(RESOURCE_TYPE, self._event_hub_namespace):
             avail_res = self._event_hub_client.namespaces.check_name_availability(
                 CheckNameAvailabilityParameter(name=self._event_hub_namespace)
             )
             if not avail_res.name_available:
                 self._logger.error(f"EventHub namespace '{self._event_hub_namespace}' is not available")
                 sys.exit(1)
-            # https://docs.microsoft.com/en-us/python/api/azure-mgmt-eventhub/azure.mgmt.eventhub.v2017_04_01.models.ehnamespace?view=azure-python
-            eh_namespace_sku = Sku(name="Standard", tier="Standard", capacity=1)
-            # https://docs.microsoft.com/en-us/azure/event-hubs/event-hubs-auto-inflate
-            eh_namespace = EHNamespace(
-                location=self._location, sku=eh_namespace_sku, is_auto_inflate_enabled=True, maximum_throughput_units=20
-            )
+            eh_namespace = get_namespace_create_params(self._location)
             poller = self._event_hub_client.namespaces.begin_create_or_update(
                 self._resource_group_name, self._event_hub_namespace, eh_namespace
             )
             eh_res = poller.result()
-            net_ruleset = NetworkRuleSet(default_action="Allow")
+            rg_inventory.record(RESOURCE_TYPE, eh_res.name, eh_res.id)
+            net_ruleset = get_namespace_network_rule_set()
             self._event_hub_client.namespaces.create_or_update_network_rule_set(
                 self._resource_group_name, self._event_hub_namespace, net_ruleset
             )
@@ -70,8 +84,7 @@ class Provisioner:
             )
         }:
             # https://docs.microsoft.com/en-us/python/api/azure-mgmt-eventhub/azure.mgmt.eventhub.v2017_04_01.operations.eventhubsoperations?view=azure-python#create-or-update-resource-group-name--namespace-name--event-hub-name--parameters----kwargs-
-            # https://docs.microsoft.com/en-us/azure/event-hubs/event-hubs-faq#partitions
-            eh_parameters = Eventhub(message_retention_in_days=1, partition_count=32)
+            eh_parameters = get_create_params()
             eh = self._event_hub_client.event_hubs.create_or_update(
                 self._resource_group_name, self._event_hub_namespace, self._event_hub_name, eh_parameters
             )
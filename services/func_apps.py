@@ -3,12 +3,12 @@ import logging
 import os
 import shutil
 import stat
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from azure.identity import AzureCliCredential
 from azure.mgmt.web import WebSiteManagementClient
 from git import Repo
-from utils import convert
+from utils import clients, convert
 
 from services import app_srv_plan, cosmosdb, functions
 
@@ -35,6 +35,8 @@ class Provisioner:
         functions_name: str,
         functions_code_path: str,
         vendor_credentials_path: str,
+        vendor_partitionings: Optional[List[str]],
+        iot_hub_cosmosdb_routing: bool,
         logger: logging.Logger,
     ):
         self._credential = credential
@@ -45,13 +47,20 @@ class Provisioner:
         self._functions_name = functions_name
         self._functions_code_path = functions_code_path
         self._vendor_credentials_path = vendor_credentials_path
+        self._iot_hub_cosmosdb_routing = iot_hub_cosmosdb_routing
         self._logger = logger
+        # The messages container of every vendor depends on its partitioning.
+        self._msg_container_ids = {
+            vendor_name: cosmosdb.get_messages_container_id(vendor_name, partitioning)
+            for vendor_name, partitioning in cosmosdb.get_partitionings(vendor_partitionings, logger).items()
+        }
 
         self._repo: Optional[Repo] = None
-        self._website_client = WebSiteManagementClient(
+        self._website_client = clients.get_client(
+            WebSiteManagementClient,
             credential,
             azure_subscription_id,
-            api_version=app_srv_plan.WEBSITE_MGMT_API_VER,
+            app_srv_plan.WEBSITE_MGMT_API_VER,
         )
         self._functions_copy_path: Optional[str] = None
 
@@ -64,8 +73,9 @@ class Provisioner:
         for vendor_name in cosmosdb.VENDOR_NAMES:
             self._configure_cosmos_messages_func_app(vendor_name)
         # Provision the Azure function app triggered by incoming IotHub device messages.
-        # It will redirect these messages to the messages container.
-        self._configure_iot_hub_event_func_app(cosmosdb.VENDOR_NAMES)
+        # It will redirect these messages to the messages container, unless IotHub routes them there.
+        if not self._iot_hub_cosmosdb_routing:
+            self._configure_iot_hub_event_func_app(cosmosdb.VENDOR_NAMES)
         # Provision the Azure function app triggered periodically to pull device
         # telemetry data and write it to the messages container.
         for vendor_name in PULL_VENDOR_NAMES:
@@ -112,10 +122,13 @@ class Provisioner:
                         "type": "cosmosDBTrigger",
                         "name": "documents",
                         "direction": "in",
-                        "leaseCollectionName": cosmosdb.LEASES_CONTAINER_TEMPLATE.format(vendor_name),
+                        # The leases are of the partitions of the monitored container.
+                        "leaseCollectionName": cosmosdb.LEASES_CONTAINER_TEMPLATE.format(
+                            self._msg_container_ids[vendor_name]
+                        ),
                         "connectionStringSetting": "{}{}".format(self._cosmosdb_name, functions.COSMOSDB_CONN_STR_POSTFIX),
                         "databaseName": cosmosdb.COSMOSDB_DB_NAME,
-                        "collectionName": vendor_name,
+                        "collectionName": self._msg_container_ids[vendor_name],
                         "createLeaseCollectionIfNotExists": True,
                     },
                     {
@@ -152,7 +165,7 @@ class Provisioner:
                     "direction": "out",
                     "type": "cosmosDB",
                     "databaseName": cosmosdb.COSMOSDB_DB_NAME,
-                    "collectionName": vendor_name,
+                    "collectionName": self._msg_container_ids[vendor_name],
                     "connectionStringSetting": "{}{}".format(self._cosmosdb_name, functions.COSMOSDB_CONN_STR_POSTFIX),
                 }
             )
@@ -177,7 +190,7 @@ class Provisioner:
                         "direction": "out",
                         "type": "cosmosDB",
                         "databaseName": cosmosdb.COSMOSDB_DB_NAME,
-                        "collectionName": vendor_name,
+                        "collectionName": self._msg_container_ids[vendor_name],
                         "connectionStringSetting": "{}{}".format(self._cosmosdb_name, functions.COSMOSDB_CONN_STR_POSTFIX),
                     },
                 ]
@@ -10,8 +10,11 @@ from azure.mgmt.iothub.models import EventHubProperties, IotHubProperties
 from azure.mgmt.storage import StorageManagementClient
 from azure.mgmt.web import WebSiteManagementClient
 from azure.mgmt.web.models import IpSecurityRestriction, Site, SiteConfig
+from utils import clients, lro
 
-from services import app_srv_plan, iot_hub, storage
+from services import app_srv_plan, inventory, iot_hub, storage
+
+RESOURCE_TYPE = "Microsoft.Web/sites"
 
 STORAGE_CONN_STR_TEMPLATE = "DefaultEndpointsProtocol=https;AccountName={};AccountKey={};EndpointSuffix=core.windows.net"
 COSMOSDB_CONN_STR_POSTFIX = "_DOCUMENTDB"
@@ -22,6 +25,83 @@ FUNCTIONS_WORKER_RUNTIME = "node"
 WEBSITE_NODE_DEFAULT_VERSION = "~14"
 
 
+def get_app_settings(
+    storage_acc_name: str,
+    storage_acc_key: str,
+    cosmosdb_name: str,
+    cosmosdb_uri: str,
+    cosmosdb_key: str,
+    iot_hub_name: str,
+    event_hub_props: EventHubProperties,
+    iot_hub_key: str,
+) -> List[Dict]:
+    # https://docs.microsoft.com/en-us/azure/azure-functions/functions-app-settings
+    return [
+        {
+            "name": "AzureWebJobsStorage",
+            "value": STORAGE_CONN_STR_TEMPLATE.format(storage_acc_name, storage_acc_key),
+        },
+        {
+            "name": "WEBSITE_CONTENTAZUREFILECONNECTIONSTRING",
+            "value": STORAGE_CONN_STR_TEMPLATE.format(storage_acc_name, storage_acc_key),
+        },
+        {
+            "name": f"{cosmosdb_name}{COSMOSDB_CONN_STR_POSTFIX}",
+            "value": COSMOSDB_CONN_STR_TEMPLATE.format(cosmosdb_uri, cosmosdb_key),
+        },
+        {
+            "name": f"{iot_hub_name}{IOT_HUB_CONN_STR_POSTFIX}",
+            "value": IOT_HUB_CONN_STR_TEMPLATE.format(
+                event_hub_props.endpoint,
+                iot_hub.SHARED_ACCESS_KEY_NAME,
+                iot_hub_key,
+                event_hub_props.path,
+            ),
+        },
+        {"name": "FUNCTIONS_EXTENSION_VERSION", "value": "~3"},
+        {
+            "name": "FUNCTIONS_WORKER_RUNTIME",
+            "value": FUNCTIONS_WORKER_RUNTIME,
+        },
+        {
+            "name": "WEBSITE_NODE_DEFAULT_VERSION",
+            "value": WEBSITE_NODE_DEFAULT_VERSION,
+        },
+    ]
+
+
+def get_create_params(location: str, server_farm_id: str, app_settings: List[Dict]) -> Site:
+    ip_sec = IpSecurityRestriction(
+        ip_address="Any",
+        action="Allow",
+        priority=1,
+        name="Allow all",
+        description="Allow all access",
+    )
+    # https://docs.microsoft.com/en-us/python/api/azure-mgmt-web/azure.mgmt.web.v2020_12_01.models.siteconfig?view=azure-python
+    site_conf = SiteConfig(
+        app_settings=app_settings,
+        managed_pipeline_mode="Integrated",
+        scm_type="LocalGit",
+        load_balancing="LeastRequests",
+        ip_security_restrictions=[ip_sec],
+        http20_enabled=True,
+        min_tls_version="1.2",
+        ftps_state="FtpsOnly",
+    )
+    # https://docs.microsoft.com/en-us/python/api/azure-mgmt-web/azure.mgmt.web.v2020_12_01.models.site?view=azure-python
+    return Site(
+        kind="functionapp",
+        location=location,
+        enabled=True,
+        server_farm_id=server_farm_id,
+        reserved=False,
+        site_config=site_conf,
+        client_cert_mode="Required",
+        https_only=True,
+    )
+
+
 class Provisioner:
     def __init__(
         self,
@@ -47,15 +127,18 @@ class Provisioner:
         self._location = location
         self._logger = logger
 
-        self._iot_hub_client = IotHubClient(credential, azure_subscription_id, api_version=iot_hub.IOT_HUB_MGMT_API_VER)
-        self._cosmosdb_client = CosmosDBManagementClient(credential, azure_subscription_id)
-        self._storage_client = StorageManagementClient(
-            credential, azure_subscription_id, api_version=storage.STORAGE_MGMT_API_VER
+        self._iot_hub_client = clients.get_client(
+            IotHubClient, credential, azure_subscription_id, iot_hub.IOT_HUB_MGMT_API_VER
+        )
+        self._cosmosdb_client = clients.get_client(CosmosDBManagementClient, credential, azure_subscription_id)
+        self._storage_client = clients.get_client(
+            StorageManagementClient, credential, azure_subscription_id, storage.STORAGE_MGMT_API_VER
         )
-        self._website_client = WebSiteManagementClient(
+        self._website_client = clients.get_client(
+            WebSiteManagementClient,
             credential,
             azure_subscription_id,
-            api_version=app_srv_plan.WEBSITE_MGMT_API_VER,
+            app_srv_plan.WEBSITE_MGMT_API_VER,
         )
 
     def _get_storage_acc_key(self) -> str:
@@ -87,79 +170,45 @@ class Provisioner:
         cosmosdb_uri, cosmosdb_key = self._get_cosmosdb_uri_and_key()
         # Get the IotHub properties and key.
         props, iot_hub_key = self._get_iot_hub_key()
-        # https://docs.microsoft.com/en-us/azure/azure-functions/functions-app-settings
-        return [
-            {
-                "name": "AzureWebJobsStorage",
-                "value": STORAGE_CONN_STR_TEMPLATE.format(self._storage_acc_name, storage_acc_key),
-            },
-            {
-                "name": "WEBSITE_CONTENTAZUREFILECONNECTIONSTRING",
-                "value": STORAGE_CONN_STR_TEMPLATE.format(self._storage_acc_name, storage_acc_key),
-            },
-            {
-                "name": f"{self._cosmosdb_name}{COSMOSDB_CONN_STR_POSTFIX}",
-                "value": COSMOSDB_CONN_STR_TEMPLATE.format(cosmosdb_uri, cosmosdb_key),
-            },
-            {
-                "name": f"{self._iot_hub_name}{IOT_HUB_CONN_STR_POSTFIX}",
-                "value": IOT_HUB_CONN_STR_TEMPLATE.format(
-                    props.endpoint,
-                    iot_hub.SHARED_ACCESS_KEY_NAME,
-                    iot_hub_key,
-                    props.path,
-                ),
-            },
-            {"name": "FUNCTIONS_EXTENSION_VERSION", "value": "~3"},
-            {
-                "name": "FUNCTIONS_WORKER_RUNTIME",
-                "value": FUNCTIONS_WORKER_RUNTIME,
-            },
-            {
-                "name": "WEBSITE_NODE_DEFAULT_VERSION",
-                "value": WEBSITE_NODE_DEFAULT_VERSION,
-            },
-        ]
+        return get_app_settings(
+            self._storage_acc_name,
+            storage_acc_key,
+            self._cosmosdb_name,
+            cosmosdb_uri,
+            cosmosdb_key,
+            self._iot_hub_name,
+            props,
+            iot_hub_key,
+        )
 
     def provision(self):
-        if self._website_client.web_apps.get(self._resource_group_name, self._functions_name) is None:
-            ip_sec = IpSecurityRestriction(
-                ip_address="Any",
-                action="Allow",
-                priority=1,
-                name="Allow all",
-                description="Allow all access",
-            )
-            # https://docs.microsoft.com/en-us/python/api/azure-mgmt-web/azure.mgmt.web.v2020_12_01.models.siteconfig?view=azure-python
-            site_conf = SiteConfig(
-                app_settings=self._get_app_settings(),
-                managed_pipeline_mode="Integrated",
-                scm_type="LocalGit",
-                load_balancing="LeastRequests",
-                ip_security_restrictions=[ip_sec],
-                http20_enabled=True,
-                min_tls_version="1.2",
-                ftps_state="FtpsOnly",
-            )
-            # https://docs.microsoft.com/en-us/python/api/azure-mgmt-web/azure.mgmt.web.v2020_12_01.models.site?view=azure-python
-            site = Site(
-                kind="functionapp",
-                location=self._location,
-                enabled=True,
-                server_farm_id=self._website_client.app_service_plans.get(
+        rg_inventory = inventory.get(self._credential, self._azure_subscription_id, self._resource_group_name)
+        if not rg_inventory.is_provisioned(RESOURCE_TYPE, self._functions_name):
+            app_srv_plan_info = rg_inventory.get(app_srv_plan.RESOURCE_TYPE, self._app_srv_plan_name)
+            if app_srv_plan_info is not None:
+                server_farm_id = app_srv_plan_info.id
+            else:
+                server_farm_id = self._website_client.app_service_plans.get(
                     self._resource_group_name, self._app_srv_plan_name
-                ).id,
-                reserved=False,
-                site_config=site_conf,
-                client_cert_mode="Required",
-                https_only=True,
-            )
+                ).id
+            site = get_create_params(self._location, server_farm_id, self._get_app_settings())
             try:
                 # https://docs.microsoft.com/en-us/python/api/azure-mgmt-web/azure.mgmt.web.v2020_12_01.operations.webappsoperations?view=azure-python#begin-create-or-update-resource-group-name--name--site-envelope----kwargs-
                 poller = self._website_client.web_apps.begin_create_or_update(
                     self._resource_group_name, self._functions_name, site
                 )
-                func_res = poller.result()
+                func_res = lro.result(
+                    poller,
+                    lro.Operation(
+                        RESOURCE_TYPE,
+                        self._functions_name,
+                        WebSiteManagementClient,
+                        app_srv_plan.WEBSITE_MGMT_API_VER,
+                        "web_apps.begin_create_or_update",
+                        (self._resource_group_name, self._functions_name, None),
+                    ),
+                )
+                rg_inventory.record(RESOURCE_TYPE, func_res.name, func_res.id)
                 self._logger.info(f"Provisioned Azure Functions '{func_res.name}'")
             except ResourceExistsError as e:
                 if not hasattr(e.response, "status_code") or e.response.status_code != 409:
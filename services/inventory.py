@@ -0,0 +1,80 @@
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from azure.identity import AzureCliCredential
+from azure.mgmt.resource import ResourceManagementClient
+from azure.mgmt.resource.resources.models import GenericResourceExpanded
+from utils import clients, tracing
+
+from services import resource_group
+
+
+class ResourceInfo(NamedTuple):
+    id: str
+    provisioning_state: Optional[str]
+
+
+class Inventory:
+    """Index of the resources of a resource group by (resource type, name).
+
+    It is built from a single listing of the resource group and kept up to date by the
+    provisioners when they create a resource, so that their existence checks do not need
+    a listing call of their own. Resource types and names are case-insensitive in ARM.
+    """
+
+    def __init__(self, resources: Iterable[GenericResourceExpanded]):
+        self._lock = threading.Lock()
+        self._resources: Dict[Tuple[str, str], ResourceInfo] = {}
+        for resource in resources:
+            self.record(resource.type, resource.name, resource.id, resource.provisioning_state)
+
+    def get(self, resource_type: str, name: str) -> Optional[ResourceInfo]:
+        with self._lock:
+            return self._resources.get((resource_type.lower(), name.lower()))
+
+    def contains(self, resource_type: str, name: str) -> bool:
+        return self.get(resource_type, name) is not None
+
+    def is_provisioned(self, resource_type: str, name: str) -> bool:
+        """Same as `contains`, for the existence checks of the provisioners.
+
+        The outcome is also recorded on the current trace span, i.e. the one of the step.
+        """
+        provisioned = self.contains(resource_type, name)
+        tracing.annotate(resource_type=resource_type, resource_name=name, already_existed=provisioned)
+        return provisioned
+
+    def record(self, resource_type: str, name: str, resource_id: str, provisioning_state: Optional[str] = "Succeeded"):
+        with self._lock:
+            self._resources[(resource_type.lower(), name.lower())] = ResourceInfo(resource_id, provisioning_state)
+
+
+_lock = threading.Lock()
+_inventories: Dict[Tuple[str, str], Inventory] = {}
+
+
+def get_cached(azure_subscription_id: str, resource_group_name: str) -> Optional[Inventory]:
+    with _lock:
+        return _inventories.get((azure_subscription_id, resource_group_name.lower()))
+
+
+def set_cached(azure_subscription_id: str, resource_group_name: str, inventory: Inventory):
+    with _lock:
+        _inventories[(azure_subscription_id, resource_group_name.lower())] = inventory
+
+
+def get(credential: AzureCliCredential, azure_subscription_id: str, resource_group_name: str) -> Inventory:
+    """Get the inventory of the resource group, listing it on first use in this run."""
+    key = (azure_subscription_id, resource_group_name.lower())
+    with _lock:
+        inventory = _inventories.get(key)
+        if inventory is None:
+            resource_client = clients.get_client(
+                ResourceManagementClient, credential, azure_subscription_id, resource_group.RESOURCE_MGMT_API_VER
+            )
+            # https://docs.microsoft.com/en-us/python/api/azure-mgmt-resource/azure.mgmt.resource.resources.v2021_04_01.operations.resourcesoperations?view=azure-python#list-by-resource-group-resource-group-name--filter-none--expand-none--top-none----kwargs-
+            inventory = Inventory(
+                resource_client.resources.list_by_resource_group(resource_group_name, expand="provisioningState")
+            )
+            _inventories[key] = inventory
+    return inventory
@@ -1,46 +1,406 @@
 import base64
+import contextvars
+import datetime
+import itertools
 import json
 import logging
+import math
 import os
 import secrets
+import sqlite3
 import sys
-from typing import Dict, Tuple
+import tempfile
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 
 from azure.identity import AzureCliCredential
-from azure.iot.hub import IoTHubRegistryManager
-from azure.iot.hub.models import Twin
-from msrest.exceptions import HttpOperationError
-from utils import load_file
+from azure.iot.hub import IoTHubJobManager, IoTHubRegistryManager
+from azure.iot.hub.models import (
+    AuthenticationMechanism,
+    DeviceCapabilities,
+    ExportImportDevice,
+    JobProperties,
+    JobRequest,
+    QuerySpecification,
+    SymmetricKey,
+    Twin,
+)
+from utils import clients, key_store, load_file, onboard_journal, throttling
 
 from services import iot_hub
 
+# https://docs.microsoft.com/en-us/rest/api/iothub/service/bulk-registry/update-registry
+BULK_BATCH_SIZE = 100
+MAX_BULK_ATTEMPTS = 3
+BULK_RETRY_DELAY = 1.0
+# https://docs.microsoft.com/en-us/rest/api/iothub/common-error-codes
+DEVICE_ALREADY_EXISTS = "DeviceAlreadyExists"
+# Error code of the entries of a bulk operation that failed without reporting the errors of its entries.
+BULK_OPERATION_FAILED = "BulkOperationFailed"
+# Errors of single entries that retrying the entry does not fix.
+FINAL_ERROR_CODES = {DEVICE_ALREADY_EXISTS, "DeviceNotFound", "ArgumentInvalid", "ArgumentNull"}
+IIOT_DEVICE_TAGS = {"__type__": "iiotedge", "os": "Linux"}
+# Seconds between two progress messages.
+PROGRESS_INTERVAL = 5.0
+# Devices per page of the registry queries, larger pages are capped by the service.
+QUERY_PAGE_SIZE = 1000
+# Rough duration of a request that is not rate limited, to compare it with rate limited ones.
+UNLIMITED_REQUEST_SECONDS = 0.1
+# https://docs.microsoft.com/en-us/azure/iot-hub/iot-hub-bulk-identity-mgmt#import-devices
+IMPORT_BLOB_NAME = "devices.txt"
+IMPORT_ERRORS_BLOB_NAME = "importErrors.log"
+IMPORT_CONTAINER_PREFIX = "iot-device-import"
+IMPORT_SAS_LIFETIME = datetime.timedelta(hours=24)
+IMPORT_JOB_POLL_INTERVAL = 10.0
+IMPORT_JOB_FINAL_STATES = {"completed", "failed", "cancelled"}
+# The import jobs report the error codes as numbers, e.g. 409001 for DeviceAlreadyExists.
+ALREADY_EXISTS_CODES = {DEVICE_ALREADY_EXISTS, "409001"}
+# Devices per chunk of the uploaded import blob.
+_IMPORT_CHUNK_SIZE = 1000
+# https://docs.microsoft.com/en-us/azure/iot-hub/iot-hub-devguide-jobs
+TWIN_JOB_PREFIX = "iot-device-tags"
+TWIN_JOB_POLL_INTERVAL = 5.0
+TWIN_JOB_MAX_EXECUTION_SECONDS = 3600
+TWIN_JOB_FINAL_STATES = {"completed", "failed", "cancelled"}
+# Queries are limited to 8 KB, the query conditions of the jobs included.
+QUERY_CONDITION_MAX_LENGTH = 8000
+# Ways of setting the IIoT tags of the onboarded devices.
+BULK_TAGGING = "bulk"
+JOB_TAGGING = "job"
+# Stages of the onboarding of a batch of devices, the tagging depends on the registration.
+_REGISTER = "register"
+_TAG = "tag"
+
 
 class _DeviceKeys:
-    def __init__(self) -> None:
-        self.primary_keys = set()
-        self.secondary_keys = set()
-        self.id_to_keys = {}
+    """Keys generated for the devices being registered, kept in a SQLite database instead of memory."""
+
+    def __init__(self, path: str) -> None:
+        self.count = 0
+        self._db = sqlite3.connect(path)
+        # Only a spill file of the run, the keys of the registered devices go to the key store.
+        self._db.execute("PRAGMA journal_mode = OFF")
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute(
+            "CREATE TABLE keys (device_id TEXT PRIMARY KEY, primary_key TEXT UNIQUE, secondary_key TEXT UNIQUE)"
+        )
 
     def generate_keys(self, device_id: str) -> Tuple[str, str]:
-        # generate a unique primary key
-        primary_key = base64.b64encode(secrets.token_bytes(32)).decode("utf-8")
-        while primary_key in self.primary_keys:
+        self.remove_device(device_id)
+        # generate unique primary and secondary keys
+        while True:
             primary_key = base64.b64encode(secrets.token_bytes(32)).decode("utf-8")
-        self.primary_keys.add(primary_key)
-        # generate a unique secondary key
-        secondary_key = base64.b64encode(secrets.token_bytes(32)).decode("utf-8")
-        while secondary_key in self.secondary_keys:
             secondary_key = base64.b64encode(secrets.token_bytes(32)).decode("utf-8")
-        self.secondary_keys.add(secondary_key)
-        # Associate keys with device ids
-        self.id_to_keys[device_id] = (primary_key, secondary_key)
-
-        return primary_key, secondary_key
+            try:
+                self._db.execute("INSERT INTO keys VALUES (?, ?, ?)", (device_id, primary_key, secondary_key))
+            except sqlite3.IntegrityError:
+                continue
+            self.count += 1
+            return primary_key, secondary_key
 
     def remove_device(self, device_id: str):
-        primary_key, secondary_key = self.id_to_keys.pop(device_id)
-        self.primary_keys.remove(primary_key)
-        self.secondary_keys.remove(secondary_key)
+        self.count -= self._db.execute("DELETE FROM keys WHERE device_id = ?", (device_id,)).rowcount
+
+    def get_many(self, device_ids: Iterable[str]) -> List[key_store.DeviceKeys]:
+        keys = []
+        for device_id in device_ids:
+            row = self._db.execute(
+                "SELECT device_id, primary_key, secondary_key FROM keys WHERE device_id = ?", (device_id,)
+            ).fetchone()
+            if row is not None:
+                keys.append(row)
+        return keys
+
+    def pop_many(self, device_ids: List[str]) -> List[key_store.DeviceKeys]:
+        """Take the keys of registered devices out, to be put in the key store."""
+        keys = self.get_many(device_ids)
+        for device_id, _, _ in keys:
+            self.remove_device(device_id)
+        return keys
+
+    def iter_batches(self) -> Iterator[List[key_store.DeviceKeys]]:
+        cursor = self._db.execute("SELECT device_id, primary_key, secondary_key FROM keys")
+        return iter(lambda: cursor.fetchmany(BULK_BATCH_SIZE), [])
+
+    def iter_device_ids(self) -> Iterator[str]:
+        for (device_id,) in self._db.execute("SELECT device_id FROM keys"):
+            yield device_id
+
+    def close(self):
+        self._db.close()
+
+
+def _has_keys(registry_manager: IoTHubRegistryManager, device: ExportImportDevice) -> bool:
+    """Whether the registered device has the keys of its create entry, rather than being registered by others."""
+    # https://docs.microsoft.com/en-us/python/api/azure-iot-hub/azure.iot.hub.iothubregistrymanager?view=azure-python#get-device-device-id-
+    registered = throttling.call(throttling.IOT_HUB, registry_manager.get_device, device.id)
+    authentication = registered.authentication
+    return (
+        authentication is not None
+        and authentication.symmetric_key is not None
+        and authentication.symmetric_key.primary_key == device.authentication.symmetric_key.primary_key
+    )
+
+
+def _run_bulk_operation(
+    registry_manager: IoTHubRegistryManager, devices: List[ExportImportDevice], logger: logging.Logger
+) -> Dict[str, str]:
+    """Run a bulk registry operation, retrying only the entries that failed with a transient error.
+
+    Returns the error code of every entry that failed in the end, by device ID.
+    """
+    failed: Dict[str, str] = {}
+    # Errors of the entries retried, by device ID, as the previous try reported them.
+    previous: Dict[str, str] = {}
+    for attempt in range(1, MAX_BULK_ATTEMPTS + 1):
+        # The whole call is retried by the limiter when throttled, the errors of single entries are not.
+        result = throttling.call(throttling.IOT_HUB, registry_manager.bulk_create_or_update_devices, devices)
+        errors = {error.device_id: error.error_code for error in result.errors or []}
+        if not result.is_successful and not errors:
+            # Nothing tells which entries went through, so none of them counts as registered.
+            errors = {device.id: BULK_OPERATION_FAILED for device in devices}
+        for device in devices:
+            if errors.get(device.id) != DEVICE_ALREADY_EXISTS or device.id not in previous:
+                continue
+            # The failed try may have registered the device anyway, with the very same keys. An entry error means
+            # the device was not registered before that try, after a failed operation only its keys tell.
+            if previous[device.id] != BULK_OPERATION_FAILED or _has_keys(registry_manager, device):
+                del errors[device.id]
+        failed.update((device_id, code) for device_id, code in errors.items() if code in FINAL_ERROR_CODES)
+        devices = [device for device in devices if device.id in errors and errors[device.id] not in FINAL_ERROR_CODES]
+        previous = errors
+        if not devices:
+            break
+        if attempt < MAX_BULK_ATTEMPTS:
+            logger.info(f"Retrying {len(devices)} devices that failed in a bulk registry operation")
+            time.sleep(BULK_RETRY_DELAY * attempt)
+    failed.update((device.id, errors[device.id]) for device in devices)
+    return failed
+
+
+def _tag_iiot_devices(
+    registry_manager: IoTHubRegistryManager,
+    registered: List[str],
+    already_registered: List[str],
+    logger: logging.Logger,
+) -> Dict[str, str]:
+    # The twins of new devices have no tags yet, so they can be replaced in bulk. The tags of
+    # the devices registered before are merged one by one instead, to keep any other tags.
+    failed: Dict[str, str] = {}
+    if registered:
+        twins = [
+            ExportImportDevice(id=device_id, import_mode="updateTwin", tags=IIOT_DEVICE_TAGS)
+            for device_id in registered
+        ]
+        failed.update(_run_bulk_operation(registry_manager, twins, logger))
+    for device_id in already_registered:
+        throttling.call(throttling.IOT_HUB, registry_manager.update_twin, device_id, Twin(tags=IIOT_DEVICE_TAGS))
+    return failed
+
+
+def _quote(device_id: str) -> str:
+    # The device IDs may contain single quotes, but no double quotes.
+    return f'"{device_id}"' if "'" in device_id else f"'{device_id}'"
+
+
+def iter_query_conditions(device_ids: Iterable[str], max_length: int = QUERY_CONDITION_MAX_LENGTH) -> Iterator[str]:
+    """`deviceId IN [...]` conditions covering the device IDs, as few as `max_length` characters allow."""
+    quoted: List[str] = []
+    length = 0
+    for device_id in device_ids:
+        item = _quote(device_id)
+        # The brackets, and a comma and a space between two device IDs.
+        if quoted and len("deviceId IN []") + length + len(item) + 2 * len(quoted) > max_length:
+            yield f"deviceId IN [{', '.join(quoted)}]"
+            quoted, length = [], 0
+        quoted.append(item)
+        length += len(item)
+    if quoted:
+        yield f"deviceId IN [{', '.join(quoted)}]"
+
+
+def run_twin_update_jobs(
+    job_manager: IoTHubJobManager, query_conditions: Iterable[str], tags: Dict[str, Any], logger: logging.Logger
+) -> List[str]:
+    """Merge the tags into the twins of the devices matching each condition, with a scheduled job per condition.
+
+    The jobs run one after the other, as the hubs run few jobs at a time. Returns the IDs of the
+    jobs that failed or did not update all their devices.
+    """
+    failed_jobs = []
+    for query_condition in query_conditions:
+        job_id = f"{TWIN_JOB_PREFIX}-{uuid.uuid4()}"
+        job_request = JobRequest(
+            job_id=job_id,
+            type="scheduleUpdateTwin",
+            update_twin=Twin(tags=tags, etag="*"),
+            query_condition=query_condition,
+            start_time=datetime.datetime.utcnow(),
+            max_execution_time_in_seconds=TWIN_JOB_MAX_EXECUTION_SECONDS,
+        )
+        # https://docs.microsoft.com/en-us/python/api/azure-iot-hub/azure.iot.hub.iothubjobmanager?view=azure-python#create-scheduled-job-job-id--job-request-
+        job = throttling.call(throttling.IOT_HUB, job_manager.create_scheduled_job, job_id, job_request)
+        logger.info(f"Started twin update job '{job_id}'")
+        while job.status not in TWIN_JOB_FINAL_STATES:
+            time.sleep(TWIN_JOB_POLL_INTERVAL)
+            job = throttling.call(throttling.IOT_HUB, job_manager.get_scheduled_job, job_id)
+        statistics = job.device_job_statistics
+        failed_count = (statistics.failed_count or 0) if statistics is not None else 0
+        if job.status != "completed" or failed_count:
+            logger.error(
+                f"Twin update job '{job_id}' is {job.status}, {failed_count} devices failed: "
+                f"{job.failure_reason or job.status_message}"
+            )
+            failed_jobs.append(job_id)
+        else:
+            updated_count = (statistics.succeeded_count or 0) if statistics is not None else 0
+            logger.info(f"Twin update job '{job_id}' updated the tags of {updated_count} devices")
+    return failed_jobs
+
+
+class _Registry(NamedTuple):
+    """The devices registered to the IoT Hub before the onboarding, only their IDs to keep it compact."""
+
+    device_ids: Set[str]
+    # Those of `device_ids` that are not IoT Edge devices.
+    not_edge: Set[str]
+    # Those of `device_ids` without the IIoT tags, only when onboarding IIoT devices.
+    untagged: Set[str]
+
+
+def _get_request_seconds(kind: str, count: int) -> float:
+    rate = throttling.get_limiter(kind).rate
+    return count / rate if rate > 0 else count * UNLIMITED_REQUEST_SECONDS
+
+
+def _query_registry(
+    registry_manager: IoTHubRegistryManager, device_count: int, is_iiot_device: bool, logger: logging.Logger
+) -> Optional[_Registry]:
+    """Page through the devices registered to the IoT Hub, unless it takes longer than trying to create them.
+
+    `device_count` is the number of devices to onboard. Each of those already registered costs
+    its share of a bulk create request otherwise, plus a twin update for the IIoT devices.
+    """
+    # https://docs.microsoft.com/en-us/python/api/azure-iot-hub/azure.iot.hub.iothubregistrymanager?view=azure-python#get-device-registry-statistics--
+    statistics = throttling.call(throttling.IOT_HUB, registry_manager.get_device_registry_statistics)
+    registered_count = statistics.total_device_count or 0
+    if registered_count == 0:
+        return _Registry(set(), set(), set())
+    query_seconds = _get_request_seconds(throttling.IOT_HUB_QUERIES, math.ceil(registered_count / QUERY_PAGE_SIZE))
+    known_count = min(registered_count, device_count)
+    saved_requests = math.ceil(known_count / BULK_BATCH_SIZE) + (known_count if is_iiot_device else 0)
+    if query_seconds > _get_request_seconds(throttling.IOT_HUB, saved_requests):
+        logger.info(f"Not listing the {registered_count} devices of the IotHub, it would take longer than it saves")
+        return None
+
+    registry = _Registry(set(), set(), set())
+    fields = "deviceId, capabilities, tags" if is_iiot_device else "deviceId, capabilities"
+    query_specification = QuerySpecification(query=f"SELECT {fields} FROM devices")
+    continuation_token = None
+    while True:
+        # https://docs.microsoft.com/en-us/python/api/azure-iot-hub/azure.iot.hub.iothubregistrymanager?view=azure-python#query-iot-hub-query-specification--continuation-token-none--max-item-count-none-
+        result = throttling.call(
+            throttling.IOT_HUB_QUERIES,
+            registry_manager.query_iot_hub,
+            query_specification,
+            continuation_token,
+            QUERY_PAGE_SIZE,
+        )
+        for twin in result.items:
+            registry.device_ids.add(twin.device_id)
+            if twin.capabilities is None or not twin.capabilities.iot_edge:
+                registry.not_edge.add(twin.device_id)
+            if is_iiot_device and any((twin.tags or {}).get(tag) != value for tag, value in IIOT_DEVICE_TAGS.items()):
+                registry.untagged.add(twin.device_id)
+        continuation_token = result.continuation_token
+        if not continuation_token:
+            break
+    logger.info(f"{len(registry.device_ids)} devices are registered to IotHub already")
+    return registry
+
+
+def _is_registered(
+    device_id: str, registry: Optional[_Registry], is_edge_device: bool, logger: logging.Logger
+) -> bool:
+    if registry is None or device_id not in registry.device_ids:
+        return False
+    logger.info(f"Device '{device_id}' is already registered")
+    if is_edge_device and device_id in registry.not_edge:
+        logger.warning(f"Device '{device_id}' is registered, but not as an iot edge device")
+    return True
+
+
+class _Batch(NamedTuple):
+    # Position of the batch in the device IDs file, for the onboarding journal.
+    index: int
+    device_ids: List[str]
+    # Those of `device_ids` that are not registered yet.
+    to_create: List[str]
+    # Those of `device_ids` registered before, which still need their IIoT tags.
+    to_tag: List[str]
+    # Set once the devices to create are registered.
+    registered: Tuple[str, ...] = ()
+    # Devices that failed to register.
+    failed: int = 0
+    # Devices registered, by the batch or before, that failed to get their IIoT tags.
+    tag_failed: int = 0
+
+
+def _get_create_entry(
+    device_id: str, primary_key: str, secondary_key: str, is_edge_device: bool
+) -> ExportImportDevice:
+    return ExportImportDevice(
+        id=device_id,
+        import_mode="create",
+        status="enabled",
+        authentication=AuthenticationMechanism(
+            type="sas", symmetric_key=SymmetricKey(primary_key=primary_key, secondary_key=secondary_key)
+        ),
+        capabilities=DeviceCapabilities(iot_edge=is_edge_device),
+    )
+
+
+class _Progress:
+    """Logs the processed devices per second and the estimated time left, every `PROGRESS_INTERVAL` seconds.
+
+    The total is an estimate, the number of lines of the device IDs file.
+    """
+
+    def __init__(self, total: int, logger: logging.Logger):
+        self.total = total
+        self.done = 0
+        self._logger = logger
+        self._started = self._logged = time.monotonic()
+
+    def add(self, count: int):
+        self.done += count
+        if time.monotonic() - self._logged >= PROGRESS_INTERVAL:
+            self.log()
+
+    def finish(self):
+        # The lines of the file that were not valid and unique device IDs are known by now.
+        self.total = self.done
+        self.log()
+
+    def log(self):
+        now = time.monotonic()
+        self._logged = now
+        self.total = max(self.total, self.done)
+        rate = self.done / max(now - self._started, 1e-6)
+        eta = datetime.timedelta(seconds=round((self.total - self.done) / rate)) if rate > 0 else "unknown"
+        self._logger.info(f"Processed {self.done}/{self.total} devices, {rate:.1f} devices/s, ETA {eta}")
+
+
+def _exit_on_failures(failed: Dict[str, str], failed_jobs: List[str], logger: logging.Logger):
+    if failed:
+        failures = ", ".join(f"'{device_id}' ({error_code})" for device_id, error_code in list(failed.items())[:10])
+        logger.error(f"{len(failed)} devices could not be onboarded, e.g. {failures}")
+    if failed_jobs:
+        logger.error(f"{len(failed_jobs)} twin update jobs did not tag all their devices: {', '.join(failed_jobs)}")
+    if failed or failed_jobs:
+        sys.exit(1)
 
 
 def provision(
@@ -51,41 +411,414 @@ def provision(
     device_ids_file_path: str,
     is_edge_device: bool,
     is_iiot_device: bool,
+    concurrency: int,
+    tagging: str,
+    key_store_kind: str,
+    resume: bool,
     logger: logging.Logger,
 ):
+    """Register the devices in batches, `concurrency` batches at a time.
+
+    With the bulk `tagging`, the tagging of the IIoT devices of a batch starts as soon as the
+    batch is registered, while the next batches are being registered. With the job one, all the
+    devices are tagged at the end by a few scheduled twin update jobs. The rate of the requests is
+    bounded by the IoT Hub limiter of `throttling`, whatever the concurrency. The keys of every
+    registered batch are added to the key store of the device IDs file right away, then the batch
+    to the onboarding journal, whose completed batches are skipped when `resume` is set.
+    """
     if is_iiot_device and not is_edge_device:
         logger.error("'is_iiot_device' flag implies 'is_edge_device' which is not satisfied")
         sys.exit(1)
-    device_ids = load_file.load_device_ids(device_ids_file_path)
+    # The journal and the key store are named after the device IDs file, there is nothing to resume without one.
+    if not device_ids_file_path:
+        return
+    # Read lazily, a batch at a time. The IDs are unique, as a device can appear only once in a
+    # bulk registry operation.
+    device_ids = load_file.iter_device_ids(device_ids_file_path, logger)
     conn_str = iot_hub.get_connection_str(credential, azure_subscription_id, resource_group_name, iot_hub_name)
-    iot_hub_reg_mgr = IoTHubRegistryManager(conn_str)
+    iot_hub_reg_mgr = clients.get_registry_manager(conn_str)
+
+    journal = onboard_journal.OnboardJournal(
+        onboard_journal.get_journal_path(device_ids_file_path),
+        onboard_journal.get_run(iot_hub_name, device_ids_file_path, is_edge_device, is_iiot_device, BULK_BATCH_SIZE),
+        resume,
+        logger,
+    )
+    device_key_store = key_store.open_key_store(device_ids_file_path, key_store_kind, logger)
+    tmp_dir = tempfile.TemporaryDirectory()
+    device_keys = _DeviceKeys(os.path.join(tmp_dir.name, "device-keys.db"))
+    failed: Dict[str, str] = {}
+    progress = _Progress(load_file.count_lines(device_ids_file_path), logger)
+    # Only the missing devices are created, and only the registered ones lacking the IIoT tags are tagged.
+    registry = _query_registry(
+        iot_hub_reg_mgr,
+        max(progress.total - len(journal.completed) * BULK_BATCH_SIZE, 0),
+        is_iiot_device,
+        logger,
+    )
+    running: Dict[Future, Tuple[str, _Batch]] = {}
+    tag_with_jobs = is_iiot_device and tagging == JOB_TAGGING
+    # The devices left to the twin update jobs, and their batches, journaled once the jobs succeeded.
+    to_tag_file = open(os.path.join(tmp_dir.name, "to-tag.txt"), "w+") if tag_with_jobs else None
+    tagged_by_jobs: List[_Batch] = []
+    failed_jobs: List[str] = []
+
+    def record_batch(batch: _Batch):
+        # Only once the keys of its devices are in the key store, so that a resumed run never loses them.
+        registered_count = len(batch.registered)
+        already_registered_count = len(batch.device_ids) - registered_count - batch.failed
+        # The keys written are those of the devices the batch registered.
+        journal.record(
+            batch.index,
+            batch.device_ids,
+            registered_count,
+            already_registered_count,
+            batch.failed,
+            registered_count,
+            batch.tag_failed,
+        )
+
+    def finish_batch(batch: _Batch, to_tag: List[str]):
+        if to_tag and to_tag_file is not None:
+            to_tag_file.writelines(f"{device_id}\n" for device_id in to_tag)
+            tagged_by_jobs.append(batch)
+        else:
+            record_batch(batch)
+        progress.add(len(batch.device_ids))
 
-    device_keys = _DeviceKeys()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="onboard") as executor:
+            batch_indexes = itertools.count()
+            while True:
+                # Only as many batches as workers are queued, so that the keys of the devices
+                # are generated as they are needed.
+                while len(running) < concurrency:
+                    batch_device_ids = list(itertools.islice(device_ids, BULK_BATCH_SIZE))
+                    if not batch_device_ids:
+                        break
+                    batch_index = next(batch_indexes)
+                    if batch_index in journal.completed:
+                        progress.add(len(batch_device_ids))
+                        continue
+                    to_create, to_tag = [], []
+                    for device_id in batch_device_ids:
+                        if not _is_registered(device_id, registry, is_edge_device, logger):
+                            to_create.append(device_id)
+                        elif device_id in registry.untagged:
+                            to_tag.append(device_id)
+                    batch = _Batch(batch_index, batch_device_ids, to_create, to_tag)
+                    if to_create:
+                        devices = [
+                            _get_create_entry(device_id, *device_keys.generate_keys(device_id), is_edge_device)
+                            for device_id in to_create
+                        ]
+                        future = executor.submit(
+                            contextvars.copy_context().run, _run_bulk_operation, iot_hub_reg_mgr, devices, logger
+                        )
+                        running[future] = (_REGISTER, batch)
+                    elif to_tag and not tag_with_jobs:
+                        future = executor.submit(
+                            contextvars.copy_context().run, _tag_iiot_devices, iot_hub_reg_mgr, [], to_tag, logger
+                        )
+                        running[future] = (_TAG, batch)
+                    else:
+                        finish_batch(batch, to_tag)
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage, batch = running.pop(future)
+                    errors = future.result()
+                    if stage == _TAG:
+                        failed.update(errors)
+                        finish_batch(batch._replace(tag_failed=len(errors)), [])
+                        continue
+                    registered, already_registered = [], list(batch.to_tag)
+                    failed_count = 0
+                    for device_id in batch.to_create:
+                        error_code = errors.get(device_id)
+                        if error_code is None:
+                            registered.append(device_id)
+                            logger.info(f"Device '{device_id}' is registered to IotHub")
+                            continue
+                        device_keys.remove_device(device_id)
+                        if error_code == DEVICE_ALREADY_EXISTS:
+                            already_registered.append(device_id)
+                            logger.info(f"Device '{device_id}' is already registered")
+                        else:
+                            failed[device_id] = error_code
+                            failed_count += 1
+                    device_key_store.put_many(device_keys.pop_many(registered))
+                    batch = batch._replace(registered=tuple(registered), failed=failed_count)
+                    if is_iiot_device and not tag_with_jobs:
+                        future = executor.submit(
+                            contextvars.copy_context().run,
+                            _tag_iiot_devices,
+                            iot_hub_reg_mgr,
+                            registered,
+                            already_registered,
+                            logger,
+                        )
+                        running[future] = (_TAG, batch)
+                    else:
+                        finish_batch(batch, registered + already_registered if is_iiot_device else [])
+        if to_tag_file is not None and tagged_by_jobs:
+            to_tag_file.seek(0)
+            query_conditions = iter_query_conditions(line.rstrip("\n") for line in to_tag_file)
+            failed_jobs = run_twin_update_jobs(
+                clients.get_job_manager(conn_str), query_conditions, IIOT_DEVICE_TAGS, logger
+            )
+            if not failed_jobs:
+                for batch in tagged_by_jobs:
+                    record_batch(batch)
+    finally:
+        # When a batch failed, the ones that were still running may have registered their devices as well. The
+        # keys of the devices no bulk result confirmed are dropped, IoT Hub may never have accepted them.
+        for future, (stage, batch) in running.items():
+            if stage == _REGISTER and future.done() and not future.cancelled() and future.exception() is None:
+                errors = future.result()
+                registered = [device_id for device_id in batch.to_create if device_id not in errors]
+                device_key_store.put_many(device_keys.pop_many(registered))
+        device_keys.close()
+        if to_tag_file is not None:
+            to_tag_file.close()
+        tmp_dir.cleanup()
+        device_key_store.close()
+        journal.close()
+    progress.finish()
+    _exit_on_failures(failed, failed_jobs, logger)
+
+
+def _iter_import_blob(
+    device_ids: Iterator[str], device_keys: _DeviceKeys, is_edge_device: bool, is_iiot_device: bool
+) -> Iterator[bytes]:
+    """Chunks of the JSON lines of the import blob, generating the keys of the devices as it goes."""
+    lines = []
     for device_id in device_ids:
         primary_key, secondary_key = device_keys.generate_keys(device_id)
-        try:
-            # Import the device identity to the IotHub
-            # https://docs.microsoft.com/en-us/python/api/azure-iot-hub/azure.iot.hub.iothubregistrymanager?view=azure-python#create-device-with-sas-device-id--primary-key--secondary-key--status--iot-edge-false-
-            iot_hub_reg_mgr.create_device_with_sas(device_id, primary_key, secondary_key, "enabled", iot_edge=is_edge_device)
-            logger.info(f"Device '{device_id}' is registered to IotHub")
-        except HttpOperationError as e:
-            # https://docs.microsoft.com/en-us/rest/api/iothub/common-error-codes
-            if not hasattr(e.response, "status_code") or e.response.status_code != 409:
-                raise e
-            device_keys.remove_device(device_id)
-            logger.info(f"Device '{device_id}' is already registered")
+        device: Dict[str, Any] = {
+            "id": device_id,
+            "importMode": "create",
+            "status": "enabled",
+            "authentication": {
+                "type": "sas",
+                "symmetricKey": {"primaryKey": primary_key, "secondaryKey": secondary_key},
+            },
+            "capabilities": {"iotEdge": is_edge_device},
+        }
         if is_iiot_device:
-            device_twin = Twin(tags={"__type__": "iiotedge", "os": "Linux"})
-            iot_hub_reg_mgr.update_twin(device_id, device_twin)
+            device["tags"] = IIOT_DEVICE_TAGS
+        lines.append(json.dumps(device))
+        if len(lines) >= _IMPORT_CHUNK_SIZE:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _skip_registered(
+    device_ids: Iterator[str],
+    registry: Optional[_Registry],
+    is_edge_device: bool,
+    to_tag: List[str],
+    logger: logging.Logger,
+) -> Iterator[str]:
+    """The device IDs that are not registered yet, adding those registered but lacking the IIoT tags to `to_tag`."""
+    for device_id in device_ids:
+        if not _is_registered(device_id, registry, is_edge_device, logger):
+            yield device_id
+        elif device_id in registry.untagged:
+            to_tag.append(device_id)
 
-    if not device_ids_file_path or not device_keys.id_to_keys:
+
+def _iter_registered(registry_manager: IoTHubRegistryManager, device_ids: Iterable[str]) -> Iterator[List[str]]:
+    """Pages of the device IDs registered to the IoT Hub, out of the given ones."""
+    for query_condition in iter_query_conditions(device_ids):
+        query_specification = QuerySpecification(query=f"SELECT deviceId FROM devices WHERE {query_condition}")
+        continuation_token = None
+        while True:
+            result = throttling.call(
+                throttling.IOT_HUB_QUERIES,
+                registry_manager.query_iot_hub,
+                query_specification,
+                continuation_token,
+                QUERY_PAGE_SIZE,
+            )
+            yield [twin.device_id for twin in result.items]
+            continuation_token = result.continuation_token
+            if not continuation_token:
+                break
+
+
+def _iter_import_errors(blob_client: Any) -> Iterator[Tuple[str, str]]:
+    """Device ID and error code of every line of the error log of an import job, if it wrote one."""
+    from azure.core.exceptions import ResourceNotFoundError
+
+    try:
+        chunks = blob_client.download_blob().chunks()
+    except ResourceNotFoundError:
         return
-    dir_name, file_name = os.path.split(device_ids_file_path)
-    id_to_keys_path = os.path.join(dir_name, f"{file_name}.keys")
-    if os.path.isfile(id_to_keys_path):
-        with open(id_to_keys_path, "r") as f:
-            other_id_to_keys: Dict[str, Tuple[str, str]] = json.load(f)
-            other_id_to_keys.update(device_keys.id_to_keys)
-            device_keys.id_to_keys = other_id_to_keys
-    with open(id_to_keys_path, "w") as f:
-        json.dump(device_keys.id_to_keys, f, indent=2)
+    rest = b""
+    for chunk in itertools.chain(chunks, [b"\n"]):
+        *lines, rest = (rest + chunk).split(b"\n")
+        for line in lines:
+            if not line.strip():
+                continue
+            # The casing of the properties differs between the versions of the service.
+            error = {key.lower(): value for key, value in json.loads(line).items()}
+            yield error.get("deviceid"), str(error.get("errorcode"))
+
+
+def provision_with_import_job(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    iot_hub_name: str,
+    storage_acc_name: str,
+    device_ids_file_path: str,
+    is_edge_device: bool,
+    is_iiot_device: bool,
+    tagging: str,
+    key_store_kind: str,
+    logger: logging.Logger,
+):
+    """Same as `provision`, with a single IoT Hub import job instead of one request per batch of devices.
+
+    The device identities, keys included, are streamed to a blob container of the storage account,
+    from which the job imports them. The container is deleted once the job has ended. When the job
+    does not complete, only the devices found in the registry afterwards keep their keys.
+    """
+    # Only the import jobs need the storage SDKs.
+    from azure.core.exceptions import ResourceNotFoundError
+    from azure.storage.blob import BlobServiceClient, ContainerSasPermissions, generate_container_sas
+
+    from services import storage
+
+    if is_iiot_device and not is_edge_device:
+        logger.error("'is_iiot_device' flag implies 'is_edge_device' which is not satisfied")
+        sys.exit(1)
+    device_ids = load_file.iter_device_ids(device_ids_file_path, logger)
+    conn_str = iot_hub.get_connection_str(credential, azure_subscription_id, resource_group_name, iot_hub_name)
+    registry = _query_registry(
+        clients.get_registry_manager(conn_str), load_file.count_lines(device_ids_file_path), is_iiot_device, logger
+    )
+    # Registered before the job, their tags are merged once it has ended.
+    already_registered: List[str] = []
+    device_ids = _skip_registered(device_ids, registry, is_edge_device, already_registered, logger)
+    blob_endpoint, storage_acc_key = storage.get_blob_endpoint_and_key(
+        credential, azure_subscription_id, resource_group_name, storage_acc_name
+    )
+    blob_service_client = BlobServiceClient(blob_endpoint, storage_acc_key, **clients.get_data_plane_options())
+    container_name = f"{IMPORT_CONTAINER_PREFIX}-{int(time.time())}"
+    container_client = blob_service_client.get_container_client(container_name)
+
+    device_key_store = key_store.open_key_store(device_ids_file_path, key_store_kind, logger)
+    tmp_dir = tempfile.TemporaryDirectory()
+    device_keys = _DeviceKeys(os.path.join(tmp_dir.name, "device-keys.db"))
+    failed: Dict[str, str] = {}
+    failed_jobs: List[str] = []
+    job = None
+    # Set once the keys of the devices the job imported are in the key store.
+    is_stored = False
+    try:
+        container_client.create_container()
+        container_client.upload_blob(
+            IMPORT_BLOB_NAME, _iter_import_blob(device_ids, device_keys, is_edge_device, is_iiot_device)
+        )
+        logger.info(f"Uploaded the identities of {device_keys.count} devices to container '{container_name}'")
+        sas_token = generate_container_sas(
+            storage_acc_name,
+            container_name,
+            account_key=storage_acc_key,
+            permission=ContainerSasPermissions(read=True, write=True, delete=True, list=True),
+            expiry=datetime.datetime.utcnow() + IMPORT_SAS_LIFETIME,
+        )
+        container_uri = f"{blob_endpoint.rstrip('/')}/{container_name}?{sas_token}"
+
+        # https://docs.microsoft.com/en-us/python/api/azure-iot-hub/azure.iot.hub.iothubjobmanager?view=azure-python#create-import-export-job-job-properties-
+        job_manager = clients.get_job_manager(conn_str)
+        job = throttling.call(
+            throttling.IOT_HUB,
+            job_manager.create_import_export_job,
+            JobProperties(
+                type="import", input_blob_container_uri=container_uri, output_blob_container_uri=container_uri
+            ),
+        )
+        logger.info(f"Started import job '{job.job_id}'")
+        while job.status not in IMPORT_JOB_FINAL_STATES:
+            time.sleep(IMPORT_JOB_POLL_INTERVAL)
+            job = throttling.call(throttling.IOT_HUB, job_manager.get_import_export_job, job.job_id)
+            logger.info(f"Import job '{job.job_id}' is {job.status}, {job.progress or 0}% done")
+
+        # Even a failed job may have imported part of the devices, whose keys have to be kept.
+        errors_blob_client = container_client.get_blob_client(IMPORT_ERRORS_BLOB_NAME)
+        for device_id, error_code in _iter_import_errors(errors_blob_client):
+            if device_id is None:
+                continue
+            device_keys.remove_device(device_id)
+            if error_code in ALREADY_EXISTS_CODES:
+                already_registered.append(device_id)
+                logger.info(f"Device '{device_id}' is already registered")
+            else:
+                failed[device_id] = error_code
+        if job.status != "completed":
+            logger.error(f"Import job '{job.job_id}' is {job.status}: {job.failure_reason}")
+            sys.exit(1)
+        # The job imported every device of the blob it did not report an error for.
+        for batch_keys in device_keys.iter_batches():
+            device_key_store.put_many(batch_keys)
+        is_stored = True
+        logger.info(f"Import job '{job.job_id}' registered {device_keys.count} devices to IotHub")
+        if is_iiot_device and already_registered and tagging == JOB_TAGGING:
+            failed_jobs = run_twin_update_jobs(
+                job_manager, iter_query_conditions(already_registered), IIOT_DEVICE_TAGS, logger
+            )
+        elif is_iiot_device and already_registered:
+            # The tags of the devices registered before are merged, as in `provision`.
+            failed.update(_tag_iiot_devices(clients.get_registry_manager(conn_str), [], already_registered, logger))
+    finally:
+        if job is not None and not is_stored:
+            # A job that failed, or that was left running, may have imported part of the devices anyway.
+            registry_manager = clients.get_registry_manager(conn_str)
+            for device_ids_page in _iter_registered(registry_manager, device_keys.iter_device_ids()):
+                device_key_store.put_many(device_keys.get_many(device_ids_page))
+        device_keys.close()
+        tmp_dir.cleanup()
+        device_key_store.close()
+        # The import blob holds the keys of the devices.
+        try:
+            container_client.delete_container()
+        except ResourceNotFoundError:
+            pass
+    _exit_on_failures(failed, failed_jobs, logger)
+
+
+def retag(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    iot_hub_name: str,
+    tags: Dict[str, Any],
+    query_condition: Optional[str],
+    device_ids_file_path: Optional[str],
+    logger: logging.Logger,
+):
+    """Merge the tags into the twins of the devices matching the query condition, or listed in the file, or both.
+
+    A condition alone takes a single scheduled twin update job, whatever the number of devices.
+    """
+    conn_str = iot_hub.get_connection_str(credential, azure_subscription_id, resource_group_name, iot_hub_name)
+    if device_ids_file_path is None:
+        query_conditions: Iterable[str] = [query_condition]
+    else:
+        device_ids = load_file.iter_device_ids(device_ids_file_path, logger)
+        if query_condition is None:
+            query_conditions = iter_query_conditions(device_ids)
+        else:
+            prefix = f"({query_condition}) AND "
+            query_conditions = (
+                prefix + condition
+                for condition in iter_query_conditions(device_ids, QUERY_CONDITION_MAX_LENGTH - len(prefix))
+            )
+    failed_jobs = run_twin_update_jobs(clients.get_job_manager(conn_str), query_conditions, tags, logger)
+    _exit_on_failures({}, failed_jobs, logger)
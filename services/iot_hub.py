@@ -1,13 +1,33 @@
 import logging
 import sys
+from typing import Optional, Tuple
 
 from azure.identity import AzureCliCredential
 from azure.mgmt.iothub import IotHubClient
 from azure.mgmt.iothub.models import IotHubDescription, IotHubProperties, IotHubSkuInfo, OperationInputs
+from utils import clients, lro, throttling
 
-IOT_HUB_MGMT_API_VER = "2021-03-31"
+from services import inventory
+
+RESOURCE_TYPE = "Microsoft.Devices/IotHubs"
+IOT_HUB_MGMT_API_VER = "2023-06-30"
 SHARED_ACCESS_KEY_NAME = "iothubowner"
 IOT_HUB_CONN_STR_TEMPLATE = "HostName={};SharedAccessKeyName={};SharedAccessKey={}"
+# Identity registry operations per minute and unit of each SKU, the free one has a single unit.
+# https://docs.microsoft.com/en-us/azure/iot-hub/iot-hub-devguide-quotas-throttling#operation-throttles
+REGISTRY_OPERATIONS_PER_MINUTE = {"F1": 100, "B1": 100, "B2": 100, "B3": 5000, "S1": 100, "S2": 100, "S3": 5000}
+QUERIES_PER_MINUTE = {"F1": 20, "B1": 20, "B2": 20, "B3": 1000, "S1": 20, "S2": 20, "S3": 1000}
+
+
+def get_create_params(location: str) -> IotHubDescription:
+    iot_hub_properties = IotHubProperties(
+        public_network_access="Enabled",
+        # min_tls_version="1.2",
+        features="DeviceManagement",
+    )
+    # IotHub free: "F1", Standard: "S1"
+    iot_hub_sku_info = IotHubSkuInfo(name="S1", capacity=1)
+    return IotHubDescription(location=location, properties=iot_hub_properties, sku=iot_hub_sku_info)
 
 
 def provision(
@@ -18,25 +38,27 @@ def provision(
     location: str,
     logger: logging.Logger,
 ):
-    iot_hub_client = IotHubClient(credential, azure_subscription_id, api_version=IOT_HUB_MGMT_API_VER)
-    # https://docs.microsoft.com/en-us/python/api/azure-mgmt-iothub/azure.mgmt.iothub.v2021_03_31.operations.iothubresourceoperations?view=azure-python#list-by-resource-group-resource-group-name----kwargs-
-    if iot_hub_name not in {
-        desc_list_res.name for desc_list_res in iot_hub_client.iot_hub_resource.list_by_resource_group(resource_group_name)
-    }:
+    iot_hub_client = clients.get_client(IotHubClient, credential, azure_subscription_id, IOT_HUB_MGMT_API_VER)
+    rg_inventory = inventory.get(credential, azure_subscription_id, resource_group_name)
+    if not rg_inventory.is_provisioned(RESOURCE_TYPE, iot_hub_name):
         avail_res = iot_hub_client.iot_hub_resource.check_name_availability(OperationInputs(name=iot_hub_name))
         if not avail_res.name_available:
             logger.error(f"IotHub name '{iot_hub_name}' is not available")
             sys.exit(1)
-        iot_hub_properties = IotHubProperties(
-            public_network_access="Enabled",
-            # min_tls_version="1.2",
-            features="DeviceManagement",
-        )
-        # IotHub free: "F1", Standard: "S1"
-        iot_hub_sku_info = IotHubSkuInfo(name="S1", capacity=1)
-        iot_hub_desc = IotHubDescription(location=location, properties=iot_hub_properties, sku=iot_hub_sku_info)
+        iot_hub_desc = get_create_params(location)
         poller = iot_hub_client.iot_hub_resource.begin_create_or_update(resource_group_name, iot_hub_name, iot_hub_desc)
-        iot_res = poller.result()
+        iot_res = lro.result(
+            poller,
+            lro.Operation(
+                RESOURCE_TYPE,
+                iot_hub_name,
+                IotHubClient,
+                IOT_HUB_MGMT_API_VER,
+                "iot_hub_resource.begin_create_or_update",
+                (resource_group_name, iot_hub_name, None),
+            ),
+        )
+        rg_inventory.record(RESOURCE_TYPE, iot_res.name, iot_res.id)
         logger.info(f"Provisioned IotHub '{iot_res.name}'")
     else:
         logger.info(f"IotHub '{iot_hub_name}' is already provisioned")
@@ -48,7 +70,7 @@ def get_connection_str(
     resource_group_name: str,
     iot_hub_name: str,
 ) -> str:
-    iot_hub_client = IotHubClient(credential, azure_subscription_id, api_version=IOT_HUB_MGMT_API_VER)
+    iot_hub_client = clients.get_client(IotHubClient, credential, azure_subscription_id, IOT_HUB_MGMT_API_VER)
     # https://docs.microsoft.com/en-us/python/api/azure-mgmt-iothub/azure.mgmt.iothub.v2021_03_31.operations.iothubresourceoperations?view=azure-python#get-keys-for-key-name-resource-group-name--resource-name--key-name----kwargs-
     sas_auth_rule = iot_hub_client.iot_hub_resource.get_keys_for_key_name(
         resource_group_name, iot_hub_name, SHARED_ACCESS_KEY_NAME
@@ -59,3 +81,41 @@ def get_connection_str(
         SHARED_ACCESS_KEY_NAME,
         sas_auth_rule.secondary_key,
     )
+
+
+def get_iot_hub_rates(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    iot_hub_name: str,
+) -> Optional[Tuple[float, float]]:
+    """Identity registry operations and queries per second allowed by the SKU and units of the IoT Hub.
+
+    None if the SKU is unknown.
+    """
+    iot_hub_client = clients.get_client(IotHubClient, credential, azure_subscription_id, IOT_HUB_MGMT_API_VER)
+    sku = iot_hub_client.iot_hub_resource.get(resource_group_name, iot_hub_name).sku
+    if sku is None or sku.name not in REGISTRY_OPERATIONS_PER_MINUTE:
+        return None
+    units = sku.capacity or 1
+    return REGISTRY_OPERATIONS_PER_MINUTE[sku.name] * units / 60, QUERIES_PER_MINUTE[sku.name] * units / 60
+
+
+def set_iot_hub_rates(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    iot_hub_name: str,
+    iot_hub_rate: Optional[float],
+    iot_hub_query_rate: Optional[float],
+):
+    """Pace the IoT Hub requests that have no rate given to the quotas of the hub."""
+    if iot_hub_rate is not None and iot_hub_query_rate is not None:
+        return
+    rates = get_iot_hub_rates(credential, azure_subscription_id, resource_group_name, iot_hub_name)
+    if rates is None:
+        return
+    if iot_hub_rate is None:
+        throttling.set_rate(throttling.IOT_HUB, rates[0])
+    if iot_hub_query_rate is None:
+        throttling.set_rate(throttling.IOT_HUB_QUERIES, rates[1])
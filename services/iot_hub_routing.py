@@ -0,0 +1,171 @@
+import logging
+import sys
+from typing import Any, List, Optional, Tuple
+
+from azure.identity import AzureCliCredential
+from azure.mgmt.cosmosdb import CosmosDBManagementClient
+from azure.mgmt.iothub import IotHubClient
+from azure.mgmt.iothub.models import (
+    EnrichmentProperties,
+    FallbackRouteProperties,
+    RouteProperties,
+    RoutingCosmosDBSqlApiProperties,
+    RoutingEndpoints,
+    RoutingProperties,
+)
+from utils import clients, lro
+
+from services import cosmosdb, iot_hub
+
+# Prefix of the names of the custom endpoints and routes of the messages containers, one per vendor.
+# https://docs.microsoft.com/en-us/azure/iot-hub/iot-hub-devguide-endpoints#custom-endpoints
+COSMOSDB_ROUTE_PREFIX = "cosmosdb-"
+# Property of the device message bodies the routes are filtered on.
+# https://docs.microsoft.com/en-us/azure/iot-hub/iot-hub-devguide-routing-query-syntax#message-body-as-json
+VENDOR_PROPERTY = "deviceVendor"
+# Partition key property and template the endpoint sets on the routed documents, by partitioning.
+# Hierarchical partition keys are not supported by the Cosmos DB endpoints.
+ROUTE_PARTITION_KEYS = {
+    cosmosdb.DEVICE_PARTITIONING: (cosmosdb.MSG_CONTAINER_PART_KEY.lstrip("/"), "{deviceid}"),
+    cosmosdb.SYNTHETIC_PARTITIONING: (cosmosdb.SYNTHETIC_PART_KEY_PROPERTY, "{deviceid}_{YYYY}{MM}{DD}"),
+}
+
+
+def _is_managed(name: str) -> bool:
+    return name.startswith(COSMOSDB_ROUTE_PREFIX)
+
+
+def _get_routing_key(
+    endpoints: List[RoutingCosmosDBSqlApiProperties],
+    routes: List[RouteProperties],
+    enrichments: List[EnrichmentProperties],
+) -> Tuple[Any, ...]:
+    """What the managed routing amounts to, regardless of the keys of the endpoints."""
+    return (
+        sorted(
+            (endpoint.name, endpoint.container_name, endpoint.partition_key_name, endpoint.partition_key_template)
+            for endpoint in endpoints
+            if _is_managed(endpoint.name)
+        ),
+        sorted(
+            (route.name, route.condition, tuple(route.endpoint_names)) for route in routes if _is_managed(route.name)
+        ),
+        sorted(
+            (enrichment.key, enrichment.value, tuple(sorted(enrichment.endpoint_names)))
+            for enrichment in enrichments
+            if any(_is_managed(name) for name in enrichment.endpoint_names)
+        ),
+    )
+
+
+def configure(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    iot_hub_name: str,
+    cosmosdb_name: str,
+    enabled: bool,
+    vendor_partitionings: Optional[List[str]],
+    logger: logging.Logger,
+):
+    """Route the device messages of every vendor straight to its messages container, or remove the routes.
+
+    The messages whose JSON body has a `deviceVendor` property go to a Cosmos DB custom endpoint
+    instead of the built-in one, and thus skip the `IoTHub_EventHub` function. The other messages
+    keep going to the built-in endpoint through the fallback route. The routes only query bodies
+    sent with the `application/json` content type and `utf-8` content encoding.
+
+    A routed document is the message body with the partition key the endpoint sets. Unlike the
+    function, the IotHub does not add `enqueuedTimeUtc` and `day`, nor `deviceId` for the synthetic
+    partitioning: message enrichments are application properties, which are not written to the
+    documents, so the devices have to send these properties in their bodies.
+    """
+    partitionings = cosmosdb.get_partitionings(vendor_partitionings, logger)
+    if enabled:
+        unsupported = [vendor_name for vendor_name, kind in partitionings.items() if kind not in ROUTE_PARTITION_KEYS]
+        if unsupported:
+            logger.error(
+                f"IotHub cannot route to the messages containers of {', '.join(unsupported)}, their partitioning "
+                f"has to be one of {', '.join(ROUTE_PARTITION_KEYS)}"
+            )
+            sys.exit(1)
+
+    iot_hub_client = clients.get_client(IotHubClient, credential, azure_subscription_id, iot_hub.IOT_HUB_MGMT_API_VER)
+    iot_hub_desc = iot_hub_client.iot_hub_resource.get(resource_group_name, iot_hub_name)
+    routing = iot_hub_desc.properties.routing or RoutingProperties()
+    routing_endpoints = routing.endpoints or RoutingEndpoints()
+    current_key = _get_routing_key(
+        routing_endpoints.cosmos_db_sql_containers or [], routing.routes or [], routing.enrichments or []
+    )
+    # The endpoints, routes and enrichments configured by other means are kept as they are, the managed enrichments
+    # of earlier deployments are removed.
+    endpoints = [
+        endpoint for endpoint in routing_endpoints.cosmos_db_sql_containers or [] if not _is_managed(endpoint.name)
+    ]
+    routes = [route for route in routing.routes or [] if not _is_managed(route.name)]
+    enrichments = [
+        enrichment
+        for enrichment in routing.enrichments or []
+        if not any(_is_managed(name) for name in enrichment.endpoint_names)
+    ]
+    if enabled:
+        cosmosdb_client = clients.get_client(CosmosDBManagementClient, credential, azure_subscription_id)
+        document_endpoint = cosmosdb_client.database_accounts.get(resource_group_name, cosmosdb_name).document_endpoint
+        keys = cosmosdb_client.database_accounts.list_keys(resource_group_name, cosmosdb_name)
+        for vendor_name in cosmosdb.VENDOR_NAMES:
+            name = f"{COSMOSDB_ROUTE_PREFIX}{vendor_name}"
+            partition_key_name, partition_key_template = ROUTE_PARTITION_KEYS[partitionings[vendor_name]]
+            endpoints.append(
+                RoutingCosmosDBSqlApiProperties(
+                    name=name,
+                    endpoint_uri=document_endpoint,
+                    database_name=cosmosdb.COSMOSDB_DB_NAME,
+                    container_name=cosmosdb.get_messages_container_id(vendor_name, partitionings[vendor_name]),
+                    authentication_type="keyBased",
+                    primary_key=keys.primary_master_key,
+                    secondary_key=keys.secondary_master_key,
+                    partition_key_name=partition_key_name,
+                    partition_key_template=partition_key_template,
+                )
+            )
+            routes.append(
+                RouteProperties(
+                    name=name,
+                    source="DeviceMessages",
+                    condition=f"$body.{VENDOR_PROPERTY} = '{vendor_name}'",
+                    endpoint_names=[name],
+                    is_enabled=True,
+                )
+            )
+    if _get_routing_key(endpoints, routes, enrichments) == current_key:
+        logger.info(f"IotHub '{iot_hub_name}' message routing to Cosmos DB is up to date")
+        return
+
+    routing_endpoints.cosmos_db_sql_containers = endpoints
+    routing.endpoints = routing_endpoints
+    routing.routes = routes
+    routing.enrichments = enrichments
+    if routing.fallback_route is None:
+        # Once there are routes, only the fallback route sends the other messages to the built-in endpoint.
+        routing.fallback_route = FallbackRouteProperties(
+            source="DeviceMessages", condition="true", endpoint_names=["events"], is_enabled=True
+        )
+    iot_hub_desc.properties.routing = routing
+    poller = iot_hub_client.iot_hub_resource.begin_create_or_update(
+        resource_group_name, iot_hub_name, iot_hub_desc, if_match=iot_hub_desc.etag
+    )
+    lro.result(
+        poller,
+        lro.Operation(
+            iot_hub.RESOURCE_TYPE,
+            iot_hub_name,
+            IotHubClient,
+            iot_hub.IOT_HUB_MGMT_API_VER,
+            "iot_hub_resource.begin_create_or_update",
+            (resource_group_name, iot_hub_name, None),
+        ),
+    )
+    if enabled:
+        logger.info(f"IotHub '{iot_hub_name}' routes the messages of every vendor to Cosmos DB")
+    else:
+        logger.info(f"IotHub '{iot_hub_name}' no longer routes the messages to Cosmos DB")
@@ -9,10 +9,28 @@ from azure.mgmt.keyvault.models import (
     VaultCreateOrUpdateParameters,
     VaultProperties,
 )
+from utils import clients, lro
 
+from services import inventory
+
+RESOURCE_TYPE = "Microsoft.KeyVault/vaults"
 KEY_VAULT_MGMT_API_VER = "2019-09-01"
 
 
+def get_create_params(tenant_id: str, location: str) -> VaultCreateOrUpdateParameters:
+    # https://docs.microsoft.com/en-us/python/api/azure-mgmt-keyvault/azure.mgmt.keyvault.v2019_09_01.models.sku?view=azure-python
+    sb_sku = Sku(family="A", name="standard")
+    kv_properties = VaultProperties(
+        tenant_id=tenant_id,
+        sku=sb_sku,
+        access_policies=[],
+        enabled_for_deployment=True,
+        enabled_for_disk_encryption=True,
+        enabled_for_template_deployment=True,
+    )
+    return VaultCreateOrUpdateParameters(location=location, properties=kv_properties)
+
+
 def provision(
     credential: AzureCliCredential,
     azure_subscription_id: str,
@@ -23,27 +41,27 @@ def provision(
     logger: logging.Logger,
 ):
     # https://docs.microsoft.com/en-us/python/api/azure-mgmt-keyvault/azure.mgmt.keyvault.v2019_09_01.operations.vaultsoperations?view=azure-python
-    key_vault_client = KeyVaultManagementClient(credential, azure_subscription_id, api_version=KEY_VAULT_MGMT_API_VER)
-    if key_vault_name not in {
-        desc_list_res.name for desc_list_res in key_vault_client.vaults.list_by_resource_group(resource_group_name)
-    }:
+    key_vault_client = clients.get_client(KeyVaultManagementClient, credential, azure_subscription_id, KEY_VAULT_MGMT_API_VER)
+    rg_inventory = inventory.get(credential, azure_subscription_id, resource_group_name)
+    if not rg_inventory.is_provisioned(RESOURCE_TYPE, key_vault_name):
         avail_res = key_vault_client.vaults.check_name_availability(VaultCheckNameAvailabilityParameters(name=key_vault_name))
         if not avail_res.name_available:
             logger.error(f"Key Vault '{key_vault_name}' is not available")
             sys.exit(1)
-        # https://docs.microsoft.com/en-us/python/api/azure-mgmt-keyvault/azure.mgmt.keyvault.v2019_09_01.models.sku?view=azure-python
-        sb_sku = Sku(family="A", name="standard")
-        kv_properties = VaultProperties(
-            tenant_id=tenant_id,
-            sku=sb_sku,
-            access_policies=[],
-            enabled_for_deployment=True,
-            enabled_for_disk_encryption=True,
-            enabled_for_template_deployment=True,
-        )
-        kv_parameters = VaultCreateOrUpdateParameters(location=location, properties=kv_properties)
+        kv_parameters = get_create_params(tenant_id, location)
         poller = key_vault_client.vaults.begin_create_or_update(resource_group_name, key_vault_name, kv_parameters)
-        sb_res = poller.result()
+        sb_res = lro.result(
+            poller,
+            lro.Operation(
+                RESOURCE_TYPE,
+                key_vault_name,
+                KeyVaultManagementClient,
+                KEY_VAULT_MGMT_API_VER,
+                "vaults.begin_create_or_update",
+                (resource_group_name, key_vault_name, None),
+            ),
+        )
+        rg_inventory.record(RESOURCE_TYPE, sb_res.name, sb_res.id)
         logger.info(f"Provisioned Key Vault '{sb_res.name}'")
     else:
         logger.info(f"Key Vault '{key_vault_name}' is already provisioned")
@@ -3,6 +3,7 @@ import logging
 from azure.identity import AzureCliCredential
 from azure.mgmt.resource import ResourceManagementClient
 from azure.mgmt.resource.resources.models import ResourceGroup
+from utils import clients
 
 RESOURCE_MGMT_API_VER = "2021-04-01"
 
@@ -14,7 +15,7 @@ def provision(
     location: str,
     logger: logging.Logger,
 ):
-    resource_client = ResourceManagementClient(credential, azure_subscription_id, api_version=RESOURCE_MGMT_API_VER)
+    resource_client = clients.get_client(ResourceManagementClient, credential, azure_subscription_id, RESOURCE_MGMT_API_VER)
     if not resource_client.resource_groups.check_existence(resource_group_name):
         # https://docs.microsoft.com/en-us/python/api/azure-mgmt-resource/azure.mgmt.resource.resources.v2021_04_01.operations.resourcegroupsoperations?view=azure-python#create-or-update-resource-group-name--parameters----kwargs-
         rg_result = resource_client.resource_groups.create_or_update(resource_group_name, ResourceGroup(location=location))
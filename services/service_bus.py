@@ -4,6 +4,16 @@ import sys
 from azure.identity import AzureCliCredential
 from azure.mgmt.servicebus import ServiceBusManagementClient
 from azure.mgmt.servicebus.models import CheckNameAvailability, SBNamespace, SBSku
+from utils import clients, lro
+
+from services import inventory
+
+RESOURCE_TYPE = "Microsoft.ServiceBus/namespaces"
+
+
+def get_create_params(location: str) -> SBNamespace:
+    sb_namespace_sku = SBSku(name="Standard", tier="Standard")
+    return SBNamespace(location=location, sku=sb_namespace_sku, zone_redundant=False)
 
 
 def provision(
@@ -15,21 +25,30 @@ def provision(
     logger: logging.Logger,
 ):
     # https://docs.microsoft.com/en-us/python/api/azure-mgmt-servicebus/azure.mgmt.servicebus.operations.namespacesoperations?view=azure-python
-    service_bus_client = ServiceBusManagementClient(credential, azure_subscription_id)
-    if service_bus_namespace not in {
-        desc_list_res.name for desc_list_res in service_bus_client.namespaces.list_by_resource_group(resource_group_name)
-    }:
+    service_bus_client = clients.get_client(ServiceBusManagementClient, credential, azure_subscription_id)
+    rg_inventory = inventory.get(credential, azure_subscription_id, resource_group_name)
+    if not rg_inventory.is_provisioned(RESOURCE_TYPE, service_bus_namespace):
         avail_res = service_bus_client.namespaces.check_name_availability(CheckNameAvailability(name=service_bus_namespace))
         if not avail_res.name_available:
             logger.error(f"ServiceBus namespace '{service_bus_namespace}' is not available")
             sys.exit(1)
         # https://docs.microsoft.com/en-us/python/api/azure-mgmt-servicebus/azure.mgmt.servicebus.operations.namespacesoperations?view=azure-python#begin-create-or-update-resource-group-name--namespace-name--parameters----kwargs-
-        sb_namespace_sku = SBSku(name="Standard", tier="Standard")
-        sb_parameters = SBNamespace(location=location, sku=sb_namespace_sku, zone_redundant=False)
+        sb_parameters = get_create_params(location)
         poller = service_bus_client.namespaces.begin_create_or_update(
             resource_group_name, service_bus_namespace, sb_parameters
         )
-        sb_res = poller.result()
+        sb_res = lro.result(
+            poller,
+            lro.Operation(
+                RESOURCE_TYPE,
+                service_bus_namespace,
+                ServiceBusManagementClient,
+                None,
+                "namespaces.begin_create_or_update",
+                (resource_group_name, service_bus_namespace, None),
+            ),
+        )
+        rg_inventory.record(RESOURCE_TYPE, sb_res.name, sb_res.id)
         logger.info(f"Provisioned ServiceBus namespace '{sb_res.name}'")
     else:
         logger.info(f"ServiceBus namespace '{service_bus_namespace}' is already provisioned")
@@ -4,8 +4,13 @@ import sys
 from azure.identity import AzureCliCredential
 from azure.mgmt.signalr import SignalRManagementClient
 from azure.mgmt.signalr.models import ResourceSku, SignalRFeature, SignalRNetworkACLs, SignalRResource
+from utils import clients
 from utils.identity import AzureIdentityCredentialAdapter
 
+from services import inventory
+
+RESOURCE_TYPE = "Microsoft.SignalRService/SignalR"
+
 
 def provision(
     credential: AzureCliCredential,
@@ -16,12 +21,13 @@ def provision(
     logger: logging.Logger,
 ):
     # https://azuresdkdocs.blob.core.windows.net/$web/python/azure-mgmt-signalr/1.0.0b2/azure.mgmt.signalr.operations.html#azure.mgmt.signalr.operations.SignalROperations
-    signalr_client = SignalRManagementClient(AzureIdentityCredentialAdapter(credential), azure_subscription_id)
-    if signalr_name not in {
-        desc_list_res.name for desc_list_res in signalr_client.signal_r.list_by_resource_group(resource_group_name)
-    }:
+    signalr_client = clients.get_legacy_client(
+        SignalRManagementClient, AzureIdentityCredentialAdapter(credential), azure_subscription_id
+    )
+    rg_inventory = inventory.get(credential, azure_subscription_id, resource_group_name)
+    if not rg_inventory.is_provisioned(RESOURCE_TYPE, signalr_name):
         avail_res = signalr_client.signal_r.check_name_availability(
-            location, "Microsoft.SignalRService/SignalR", name=signalr_name
+            location, RESOURCE_TYPE, name=signalr_name
         )
         if not avail_res.name_available:
             logger.error(f"SignalR '{signalr_name}' is not available")
@@ -37,6 +43,7 @@ def provision(
         )
         poller = signalr_client.signal_r.create_or_update(resource_group_name, signalr_name, sr_parameters)
         sr_res = poller.result()
+        rg_inventory.record(RESOURCE_TYPE, sr_res.name, sr_res.id)
         logger.info(f"Provisioned SignalR '{sr_res.name}'")
     else:
         logger.info(f"SignalR '{signalr_name}' is already provisioned")
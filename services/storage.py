@@ -1,13 +1,29 @@
 import logging
 import sys
+from typing import Tuple
 
 from azure.identity import AzureCliCredential
 from azure.mgmt.storage import StorageManagementClient
 from azure.mgmt.storage.models import Sku, StorageAccountCheckNameAvailabilityParameters, StorageAccountCreateParameters
+from utils import clients, lro
 
+from services import inventory
+
+RESOURCE_TYPE = "Microsoft.Storage/storageAccounts"
 STORAGE_MGMT_API_VER = "2021-04-01"
 
 
+def get_create_params(location: str) -> StorageAccountCreateParameters:
+    return StorageAccountCreateParameters(
+        sku=Sku(name="Standard_LRS"),
+        kind="StorageV2",
+        location=location,
+        access_tier="Hot",
+        enable_https_traffic_only=True,
+        minimum_tls_version="TLS1_2",
+    )
+
+
 def provision(
     credential: AzureCliCredential,
     azure_subscription_id: str,
@@ -16,27 +32,43 @@ def provision(
     location: str,
     logger: logging.Logger,
 ):
-    storage_client = StorageManagementClient(credential, azure_subscription_id, api_version=STORAGE_MGMT_API_VER)
-    if storage_acc_name not in {
-        desc_list_res.name for desc_list_res in storage_client.storage_accounts.list_by_resource_group(resource_group_name)
-    }:
+    storage_client = clients.get_client(StorageManagementClient, credential, azure_subscription_id, STORAGE_MGMT_API_VER)
+    rg_inventory = inventory.get(credential, azure_subscription_id, resource_group_name)
+    if not rg_inventory.is_provisioned(RESOURCE_TYPE, storage_acc_name):
         avail_res = storage_client.storage_accounts.check_name_availability(
             StorageAccountCheckNameAvailabilityParameters(name=storage_acc_name)
         )
         if not avail_res.name_available:
             logger.error(f"Storage account '{storage_acc_name}' is not available")
             sys.exit(1)
-        params = StorageAccountCreateParameters(
-            sku=Sku(name="Standard_LRS"),
-            kind="StorageV2",
-            location=location,
-            access_tier="Hot",
-            enable_https_traffic_only=True,
-            minimum_tls_version="TLS1_2",
-        )
+        params = get_create_params(location)
         # https://docs.microsoft.com/en-us/python/api/azure-mgmt-storage/azure.mgmt.storage.v2021_04_01.operations.storageaccountsoperations?view=azure-python#begin-create-resource-group-name--account-name--parameters----kwargs-
         poller = storage_client.storage_accounts.begin_create(resource_group_name, storage_acc_name, params)
-        storage_res = poller.result()
+        storage_res = lro.result(
+            poller,
+            lro.Operation(
+                RESOURCE_TYPE,
+                storage_acc_name,
+                StorageManagementClient,
+                STORAGE_MGMT_API_VER,
+                "storage_accounts.begin_create",
+                (resource_group_name, storage_acc_name, None),
+            ),
+        )
+        rg_inventory.record(RESOURCE_TYPE, storage_res.name, storage_res.id)
         logger.info(f"Provisioned Storage account '{storage_res.name}'")
     else:
         logger.info(f"Storage account '{storage_acc_name}' is already provisioned")
+
+
+def get_blob_endpoint_and_key(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    resource_group_name: str,
+    storage_acc_name: str,
+) -> Tuple[str, str]:
+    storage_client = clients.get_client(StorageManagementClient, credential, azure_subscription_id, STORAGE_MGMT_API_VER)
+    storage_acc = storage_client.storage_accounts.get_properties(resource_group_name, storage_acc_name)
+    # https://docs.microsoft.com/en-us/python/api/azure-mgmt-storage/azure.mgmt.storage.v2021_04_01.operations.storageaccountsoperations?view=azure-python#list-keys-resource-group-name--account-name--expand--kerb---kwargs-
+    keys = storage_client.storage_accounts.list_keys(resource_group_name, storage_acc_name).keys
+    return storage_acc.primary_endpoints.blob, keys[0].value
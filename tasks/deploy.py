@@ -1,8 +1,25 @@
 import argparse
 
-from . import deploy_iiot, deploy_vanilla
+from utils import get_logger_and_credential, run_async_steps, scheduler
+
+from . import deploy_iiot, deploy_state, deploy_vanilla
 
 
 def task_func(args: argparse.Namespace):
-    deploy_vanilla.task_func(args)
-    deploy_iiot.task_func(args)
+    logger, credential = get_logger_and_credential(args)
+    specs = deploy_vanilla.get_step_specs(args)
+    specs.update(deploy_iiot.get_step_specs(args))
+    state = deploy_state.load(args, logger, credential, specs)
+    if args.use_async:
+        run_async_steps(
+            lambda aio_credential: deploy_vanilla.get_async_nodes(args, logger, credential, aio_credential)
+            + deploy_iiot.get_async_nodes(args, logger, credential, aio_credential),
+            args.max_parallel,
+            logger,
+            state,
+        )
+        return
+    # Run both deployments as a single graph, so that the IIoT services do not have to
+    # wait for the function apps to be deployed.
+    nodes = deploy_vanilla.get_nodes(args, logger, credential) + deploy_iiot.get_nodes(args, logger, credential)
+    scheduler.run(nodes, args.max_parallel, logger, state)
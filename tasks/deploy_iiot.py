@@ -1,56 +1,206 @@
 import argparse
+import functools
+import logging
 import os
 import subprocess
 import sys
+from typing import Dict, List
 
+from azure.identity import AzureCliCredential
+from azure.identity import aio as identity_aio
 from services import event_hub, key_vault, service_bus, signalr
-from utils import get_logger_and_credential
+from services.aio import event_hub as event_hub_aio
+from services.aio import key_vault as key_vault_aio
+from services.aio import service_bus as service_bus_aio
+from utils import get_logger_and_credential, run_async_steps, scheduler
+from utils.state import StepSpec, fingerprint_path
 
+from . import deploy_state
+
+
+def get_nodes(args: argparse.Namespace, logger: logging.Logger, credential: AzureCliCredential) -> List[scheduler.Node]:
+    return [
+        # Step 10: Provision the EventHub namespace and EventHub inside it.
+        scheduler.Node(
+            "event_hub",
+            event_hub.Provisioner(
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.event_hub_namespace,
+                args.event_hub_name,
+                args.location,
+                logger,
+            ).provision,
+            ("resource_group",),
+        ),
+        # Step 11: Provision the ServiceBus namespace.
+        scheduler.Node(
+            "service_bus",
+            functools.partial(
+                service_bus.provision,
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.service_bus_namespace,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        # Step 12: Provision the Key Vault.
+        scheduler.Node(
+            "key_vault",
+            functools.partial(
+                key_vault.provision,
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.key_vault_name,
+                args.tenant_id,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        # Step 13: Provision the SignalR.
+        scheduler.Node(
+            "signalr",
+            functools.partial(
+                signalr.provision,
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.signalr_name,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        # Step 14: Register the Azure IIoT modules to Azure AAD and deploy
+        # the cloud modules into the 'kubectl' kubernetes cluster.
+        scheduler.Node(
+            "iiot_modules",
+            functools.partial(_deploy_iiot_modules, args, logger),
+            ("iot_hub", "cosmosdb", "storage", "event_hub", "service_bus", "key_vault", "signalr"),
+        ),
+    ]
+
+
+def get_step_specs(args: argparse.Namespace) -> Dict[str, StepSpec]:
+    return {
+        "event_hub": StepSpec(
+            {
+                "event_hub_namespace": args.event_hub_namespace,
+                "event_hub_name": args.event_hub_name,
+                "location": args.location,
+            },
+            ((event_hub.RESOURCE_TYPE, args.event_hub_namespace),),
+        ),
+        "service_bus": StepSpec(
+            {"service_bus_namespace": args.service_bus_namespace, "location": args.location},
+            ((service_bus.RESOURCE_TYPE, args.service_bus_namespace),),
+        ),
+        "key_vault": StepSpec(
+            {"key_vault_name": args.key_vault_name, "tenant_id": args.tenant_id, "location": args.location},
+            ((key_vault.RESOURCE_TYPE, args.key_vault_name),),
+        ),
+        "signalr": StepSpec(
+            {"signalr_name": args.signalr_name, "location": args.location},
+            ((signalr.RESOURCE_TYPE, args.signalr_name),),
+        ),
+        "iiot_modules": StepSpec(
+            {
+                "iiot_app_name": args.iiot_app_name,
+                "service_hostname": args.service_hostname,
+                "iiot_repo_path": args.iiot_repo_path,
+                "aad_reg": fingerprint_path(args.aad_reg_path),
+                "helm_values": fingerprint_path(args.helm_values_yaml_path),
+            }
+        ),
+    }
+
+
+def get_async_nodes(
+    args: argparse.Namespace,
+    logger: logging.Logger,
+    credential: AzureCliCredential,
+    aio_credential: identity_aio.AzureCliCredential,
+) -> List[scheduler.Node]:
+    # Same graph as `get_nodes`. The SignalR management client has no async variant, so
+    # that step and the IIoT module deployment run in the default thread pool.
+    return [
+        scheduler.Node(
+            "event_hub",
+            event_hub_aio.Provisioner(
+                aio_credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.event_hub_namespace,
+                args.event_hub_name,
+                args.location,
+                logger,
+            ).provision,
+            ("resource_group",),
+        ),
+        scheduler.Node(
+            "service_bus",
+            functools.partial(
+                service_bus_aio.provision,
+                aio_credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.service_bus_namespace,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        scheduler.Node(
+            "key_vault",
+            functools.partial(
+                key_vault_aio.provision,
+                aio_credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.key_vault_name,
+                args.tenant_id,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        scheduler.Node(
+            "signalr",
+            scheduler.in_thread(
+                signalr.provision,
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.signalr_name,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        scheduler.Node(
+            "iiot_modules",
+            scheduler.in_thread(_deploy_iiot_modules, args, logger),
+            ("iot_hub", "cosmosdb", "storage", "event_hub", "service_bus", "key_vault", "signalr"),
+        ),
+    ]
 
-def task_func(args: argparse.Namespace):
 
+def task_func(args: argparse.Namespace):
     logger, credential = get_logger_and_credential(args)
-    # Step 9: Provision the EventHub namespace and EventHub inside it.
-    event_hub.Provisioner(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.event_hub_namespace,
-        args.event_hub_name,
-        args.location,
-        logger,
-    ).provision()
-    # Step 10: Provision the ServiceBus namespace.
-    service_bus.provision(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.service_bus_namespace,
-        args.location,
-        logger,
-    )
-    # Step 11: Provision the Key Vault.
-    key_vault.provision(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.key_vault_name,
-        args.tenant_id,
-        args.location,
-        logger,
-    )
-    # Step 12: Provision the SignalR.
-    signalr.provision(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.signalr_name,
-        args.location,
-        logger,
-    )
+    state = deploy_state.load(args, logger, credential, get_step_specs(args))
+    if args.use_async:
+        run_async_steps(functools.partial(get_async_nodes, args, logger, credential), args.max_parallel, logger, state)
+        return
+    scheduler.run(get_nodes(args, logger, credential), args.max_parallel, logger, state)
+
 
-    # Step 13: Register the Azure IIoT modules to Azure AAD and deploy
-    # the cloud modules into the 'kubectl' kubernetes cluster.
+def _deploy_iiot_modules(args: argparse.Namespace, logger: logging.Logger):
     if any(arg is None for arg in [args.iiot_repo_path, args.aad_reg_path, args.helm_values_yaml_path]):
         return
     p = subprocess.Popen(
@@ -90,3 +240,7 @@ def task_func(args: argparse.Namespace):
         stderr=sys.stderr,
     )
     p.communicate()
+    # Otherwise the step would be recorded as completed, and not run again by the next deployment.
+    if p.returncode != 0:
+        logger.error(f"Deploying the Azure IIoT modules failed with exit code {p.returncode}")
+        sys.exit(1)
@@ -0,0 +1,45 @@
+import argparse
+import logging
+import sys
+from typing import Dict
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.identity import AzureCliCredential
+from services import inventory
+from utils import lro
+from utils.state import DeploymentState, StepSpec, get_state_path
+
+
+def load(
+    args: argparse.Namespace,
+    logger: logging.Logger,
+    credential: AzureCliCredential,
+    specs: Dict[str, StepSpec],
+) -> DeploymentState:
+    """Load the deployment state of the resource group, applying `--force` and `--verify`.
+
+    With `--no-wait`, the long-running operations of the run are also detached into the
+    pending operations file of the resource group.
+    """
+    pending = lro.PendingOperations(
+        lro.get_pending_path(args.state_dir, args.azure_subscription_id, args.resource_group_name)
+    )
+    if pending.get_all():
+        # The resources of these operations exist already, but may not be usable yet.
+        logger.error("There are pending operations from a '--no-wait' run, use the 'wait' subcommand first")
+        sys.exit(1)
+    state_path = get_state_path(args.state_dir, args.azure_subscription_id, args.resource_group_name)
+    state = DeploymentState(state_path, specs, logger)
+    if args.force:
+        state.clear()
+    elif args.verify:
+        try:
+            rg_inventory = inventory.get(credential, args.azure_subscription_id, args.resource_group_name)
+        except ResourceNotFoundError:
+            logger.info(f"Resource group '{args.resource_group_name}' does not exist, all steps will run again")
+            state.clear()
+        else:
+            state.verify(rg_inventory.contains)
+    if args.no_wait:
+        lro.detach_to(pending)
+    return state
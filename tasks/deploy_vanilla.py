@@ -1,88 +1,344 @@
 import argparse
+import functools
+import logging
+from typing import Dict, List
 
-from services import app_srv_plan, cosmosdb, func_apps, functions, iot_hub, resource_group, storage
-from utils import get_logger_and_credential
+from azure.identity import AzureCliCredential
+from azure.identity import aio as identity_aio
+from services import app_srv_plan, cosmosdb, func_apps, functions, iot_hub, iot_hub_routing, resource_group, storage
+from services.aio import app_srv_plan as app_srv_plan_aio
+from services.aio import cosmosdb as cosmosdb_aio
+from services.aio import functions as functions_aio
+from services.aio import iot_hub as iot_hub_aio
+from services.aio import resource_group as resource_group_aio
+from services.aio import storage as storage_aio
+from utils import get_logger_and_credential, run_async_steps, scheduler
+from utils.state import StepSpec, fingerprint_path
 
-from . import onboard
+from . import deploy_state, onboard
 
 
-def task_func(args: argparse.Namespace):
-    logger, credential = get_logger_and_credential(args)
-
-    # Step 1: Provision the resource group.
-    resource_group.provision(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.location,
-        logger,
-    )
+def get_nodes(args: argparse.Namespace, logger: logging.Logger, credential: AzureCliCredential) -> List[scheduler.Node]:
+    return [
+        # Step 1: Provision the resource group.
+        scheduler.Node(
+            "resource_group",
+            functools.partial(
+                resource_group.provision,
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.location,
+                logger,
+            ),
+        ),
+        # Step 2: Provision the IotHub.
+        scheduler.Node(
+            "iot_hub",
+            functools.partial(
+                iot_hub.provision,
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.iot_hub_name,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        # Step 3: Onboard & provision default IoT devices.
+        scheduler.Node("onboard", functools.partial(onboard.task_func, args), ("iot_hub",)),
+        # Step 4: Provision the Cosmos DB and initialize it.
+        scheduler.Node(
+            "cosmosdb",
+            cosmosdb.Provisioner(
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.cosmosdb_name,
+                args.location,
+                args.cosmosdb_throughput_profile,
+                args.cosmosdb_partitioning,
+                logger,
+            ).provision,
+            ("resource_group",),
+        ),
+        # Step 5: Provision an App Service Plan for Azure Functions.
+        scheduler.Node(
+            "app_srv_plan",
+            functools.partial(
+                app_srv_plan.provision,
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.app_srv_plan_name,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        # Step 6: Provision a Storage account for Azure Functions.
+        scheduler.Node(
+            "storage",
+            functools.partial(
+                storage.provision,
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.storage_acc_name,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        # Step 7: Provision Azure Functions inside the ASP (app service plan).
+        scheduler.Node(
+            "functions",
+            functions.Provisioner(
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.iot_hub_name,
+                args.cosmosdb_name,
+                args.app_srv_plan_name,
+                args.storage_acc_name,
+                args.functions_name,
+                args.location,
+                logger,
+            ).provision,
+            ("iot_hub", "cosmosdb", "app_srv_plan", "storage"),
+        ),
+        # Step 8: Route the IotHub device messages to Cosmos DB, or remove the routes.
+        scheduler.Node(
+            "iot_hub_routing",
+            functools.partial(
+                iot_hub_routing.configure,
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.iot_hub_name,
+                args.cosmosdb_name,
+                args.iot_hub_cosmosdb_routing,
+                args.cosmosdb_partitioning,
+                logger,
+            ),
+            ("iot_hub", "cosmosdb"),
+        ),
+        # Step 9: Initialize the Azure function apps.
+        scheduler.Node(
+            "func_apps",
+            func_apps.Provisioner(
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.iot_hub_name,
+                args.cosmosdb_name,
+                args.functions_name,
+                args.functions_code_path,
+                args.vendor_credentials_path,
+                args.cosmosdb_partitioning,
+                args.iot_hub_cosmosdb_routing,
+                logger,
+            ).provision,
+            ("functions",),
+        ),
+    ]
 
-    # Step 2: Provision the IotHub.
-    iot_hub.provision(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.iot_hub_name,
-        args.location,
-        logger,
-    )
 
-    onboard.task_func(args)
+def get_step_specs(args: argparse.Namespace) -> Dict[str, StepSpec]:
+    return {
+        "resource_group": StepSpec({"location": args.location}),
+        "iot_hub": StepSpec(
+            {"iot_hub_name": args.iot_hub_name, "location": args.location},
+            ((iot_hub.RESOURCE_TYPE, args.iot_hub_name),),
+        ),
+        "onboard": StepSpec(
+            {
+                "iot_hub_name": args.iot_hub_name,
+                "device_ids": fingerprint_path(args.device_ids_file_path),
+                "is_edge_device": args.is_edge_device,
+                "is_iiot_device": args.is_iiot_device,
+            }
+        ),
+        "cosmosdb": StepSpec(
+            {
+                "cosmosdb_name": args.cosmosdb_name,
+                "location": args.location,
+                "throughput_profile": fingerprint_path(args.cosmosdb_throughput_profile),
+                "partitioning": sorted(args.cosmosdb_partitioning or []),
+            },
+            ((cosmosdb.RESOURCE_TYPE, args.cosmosdb_name),),
+        ),
+        "app_srv_plan": StepSpec(
+            {"app_srv_plan_name": args.app_srv_plan_name, "location": args.location},
+            ((app_srv_plan.RESOURCE_TYPE, args.app_srv_plan_name),),
+        ),
+        "storage": StepSpec(
+            {"storage_acc_name": args.storage_acc_name, "location": args.location},
+            ((storage.RESOURCE_TYPE, args.storage_acc_name),),
+        ),
+        "functions": StepSpec(
+            {
+                "functions_name": args.functions_name,
+                "iot_hub_name": args.iot_hub_name,
+                "cosmosdb_name": args.cosmosdb_name,
+                "app_srv_plan_name": args.app_srv_plan_name,
+                "storage_acc_name": args.storage_acc_name,
+                "location": args.location,
+            },
+            ((functions.RESOURCE_TYPE, args.functions_name),),
+        ),
+        "iot_hub_routing": StepSpec(
+            {
+                "iot_hub_name": args.iot_hub_name,
+                "cosmosdb_name": args.cosmosdb_name,
+                "cosmosdb_routing": args.iot_hub_cosmosdb_routing,
+                "partitioning": sorted(args.cosmosdb_partitioning or []),
+            }
+        ),
+        "func_apps": StepSpec(
+            {
+                "functions_name": args.functions_name,
+                "functions_code": fingerprint_path(args.functions_code_path),
+                "vendor_credentials": fingerprint_path(args.vendor_credentials_path),
+                "partitioning": sorted(args.cosmosdb_partitioning or []),
+                "iot_hub_cosmosdb_routing": args.iot_hub_cosmosdb_routing,
+            }
+        ),
+    }
 
-    # Step 4: Provision the Cosmos DB and initialize it.
-    cosmosdb.Provisioner(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.cosmosdb_name,
-        args.location,
-        logger,
-    ).provision()
 
-    # Step 5: Provision an App Service Plan for Azure Functions.
-    app_srv_plan.provision(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.app_srv_plan_name,
-        args.location,
-        logger,
-    )
+def get_async_nodes(
+    args: argparse.Namespace,
+    logger: logging.Logger,
+    credential: AzureCliCredential,
+    aio_credential: identity_aio.AzureCliCredential,
+) -> List[scheduler.Node]:
+    # Same graph as `get_nodes`. The steps without an async implementation (device onboarding, the
+    # IotHub message routing and the git deployment of the function apps) run in the default thread pool.
+    return [
+        scheduler.Node(
+            "resource_group",
+            functools.partial(
+                resource_group_aio.provision,
+                aio_credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.location,
+                logger,
+            ),
+        ),
+        scheduler.Node(
+            "iot_hub",
+            functools.partial(
+                iot_hub_aio.provision,
+                aio_credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.iot_hub_name,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        scheduler.Node("onboard", scheduler.in_thread(onboard.task_func, args), ("iot_hub",)),
+        scheduler.Node(
+            "cosmosdb",
+            cosmosdb_aio.Provisioner(
+                aio_credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.cosmosdb_name,
+                args.location,
+                args.cosmosdb_throughput_profile,
+                args.cosmosdb_partitioning,
+                logger,
+            ).provision,
+            ("resource_group",),
+        ),
+        scheduler.Node(
+            "app_srv_plan",
+            functools.partial(
+                app_srv_plan_aio.provision,
+                aio_credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.app_srv_plan_name,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        scheduler.Node(
+            "storage",
+            functools.partial(
+                storage_aio.provision,
+                aio_credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.storage_acc_name,
+                args.location,
+                logger,
+            ),
+            ("resource_group",),
+        ),
+        scheduler.Node(
+            "functions",
+            functions_aio.Provisioner(
+                aio_credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.iot_hub_name,
+                args.cosmosdb_name,
+                args.app_srv_plan_name,
+                args.storage_acc_name,
+                args.functions_name,
+                args.location,
+                logger,
+            ).provision,
+            ("iot_hub", "cosmosdb", "app_srv_plan", "storage"),
+        ),
+        scheduler.Node(
+            "iot_hub_routing",
+            scheduler.in_thread(
+                iot_hub_routing.configure,
+                credential,
+                args.azure_subscription_id,
+                args.resource_group_name,
+                args.iot_hub_name,
+                args.cosmosdb_name,
+                args.iot_hub_cosmosdb_routing,
+                args.cosmosdb_partitioning,
+                logger,
+            ),
+            ("iot_hub", "cosmosdb"),
+        ),
+        scheduler.Node(
+            "func_apps",
+            scheduler.in_thread(
+                func_apps.Provisioner(
+                    credential,
+                    args.azure_subscription_id,
+                    args.resource_group_name,
+                    args.iot_hub_name,
+                    args.cosmosdb_name,
+                    args.functions_name,
+                    args.functions_code_path,
+                    args.vendor_credentials_path,
+                    args.cosmosdb_partitioning,
+                    args.iot_hub_cosmosdb_routing,
+                    logger,
+                ).provision
+            ),
+            ("functions",),
+        ),
+    ]
 
-    # Step 6: Provision a Storage account for Azure Functions.
-    storage.provision(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.storage_acc_name,
-        args.location,
-        logger,
-    )
 
-    # Step 7: Provision Azure Functions inside the ASP (app service plan).
-    functions.Provisioner(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.iot_hub_name,
-        args.cosmosdb_name,
-        args.app_srv_plan_name,
-        args.storage_acc_name,
-        args.functions_name,
-        args.location,
-        logger,
-    ).provision()
-
-    # Step 8: Initialize the Azure function apps.
-    func_apps.Provisioner(
-        credential,
-        args.azure_subscription_id,
-        args.resource_group_name,
-        args.iot_hub_name,
-        args.cosmosdb_name,
-        args.functions_name,
-        args.functions_code_path,
-        args.vendor_credentials_path,
-        logger,
-    ).provision()
+def task_func(args: argparse.Namespace):
+    logger, credential = get_logger_and_credential(args)
+    state = deploy_state.load(args, logger, credential, get_step_specs(args))
+    if args.use_async:
+        run_async_steps(functools.partial(get_async_nodes, args, logger, credential), args.max_parallel, logger, state)
+        return
+    scheduler.run(get_nodes(args, logger, credential), args.max_parallel, logger, state)
@@ -0,0 +1,21 @@
+import argparse
+import os
+import sys
+
+from utils import key_store, logging
+
+
+def task_func(args: argparse.Namespace):
+    # No Azure request is sent, so there is no credential to acquire.
+    logger = logging.configure_app_logger(args)
+    path = key_store.get_key_store_path(args.device_ids_file_path, args.key_store)
+    if not os.path.exists(path):
+        logger.error(f"There is no '{args.key_store}' key store '{path}'")
+        sys.exit(1)
+    out_path = args.out or key_store.get_key_store_path(args.device_ids_file_path, key_store.JSON_KEY_STORE)
+    with key_store.open_key_store(args.device_ids_file_path, args.key_store, logger) as device_key_store:
+        if os.path.abspath(out_path) == os.path.abspath(device_key_store.path):
+            logger.info(f"The '{args.key_store}' key store is '{out_path}' already")
+            return
+        key_store.write_legacy_json(device_key_store, out_path)
+    logger.info(f"Exported the device keys of '{path}' to '{out_path}'")
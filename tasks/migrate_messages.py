@@ -0,0 +1,23 @@
+import argparse
+import sys
+
+from services import cosmosdb
+from utils import get_logger_and_credential
+
+
+def task_func(args: argparse.Namespace):
+    logger, credential = get_logger_and_credential(args)
+    if args.vendor_name not in cosmosdb.VENDOR_NAMES:
+        logger.error(f"'--vendor-name' has to be one of {', '.join(cosmosdb.VENDOR_NAMES)}")
+        sys.exit(1)
+    cosmosdb.migrate_messages(
+        credential,
+        args.azure_subscription_id,
+        args.resource_group_name,
+        args.cosmosdb_name,
+        args.vendor_name,
+        args.source_partitioning,
+        args.target_partitioning,
+        args.concurrency,
+        logger,
+    )
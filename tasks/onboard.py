@@ -1,13 +1,48 @@
 import argparse
+import sys
 
-from services import iot_devices
+from services import iot_devices, iot_hub
 from utils import get_logger_and_credential
 
 
 def task_func(args: argparse.Namespace):
     logger, credential = get_logger_and_credential(args)
+    if args.import_job and not args.storage_acc_name:
+        logger.error("'--import-job' requires '--storage-acc-name'")
+        sys.exit(1)
+    if args.import_job and args.resume:
+        logger.error("'--resume' does not apply to '--import-job', which registers all the devices at once")
+        sys.exit(1)
+    # 'deploy' onboards devices only when given a device IDs file.
+    if not args.device_ids_file_path:
+        logger.info("No device IDs file given, there are no devices to onboard")
+        return
+
+    iot_hub.set_iot_hub_rates(
+        credential,
+        args.azure_subscription_id,
+        args.resource_group_name,
+        args.iot_hub_name,
+        args.iot_hub_rate,
+        args.iot_hub_query_rate,
+    )
 
     # Step 3: Onboard & provision default IoT devices.
+    if args.import_job:
+        iot_devices.provision_with_import_job(
+            credential,
+            args.azure_subscription_id,
+            args.resource_group_name,
+            args.iot_hub_name,
+            args.storage_acc_name,
+            args.device_ids_file_path,
+            args.is_edge_device,
+            args.is_iiot_device,
+            args.tagging,
+            args.key_store,
+            logger,
+        )
+        return
     iot_devices.provision(
         credential,
         args.azure_subscription_id,
@@ -16,5 +51,9 @@ def task_func(args: argparse.Namespace):
         args.device_ids_file_path,
         args.is_edge_device,
         args.is_iiot_device,
+        args.concurrency,
+        args.tagging,
+        args.key_store,
+        args.resume,
         logger,
     )
@@ -0,0 +1,42 @@
+import argparse
+import json
+import sys
+
+from services import iot_devices, iot_hub
+from utils import get_logger_and_credential
+
+
+def task_func(args: argparse.Namespace):
+    logger, credential = get_logger_and_credential(args)
+    if not args.condition and not args.device_ids_file_path:
+        logger.error("'retag' requires '--condition', '--device-ids-file-path' or both")
+        sys.exit(1)
+    tags = iot_devices.IIOT_DEVICE_TAGS
+    if args.tags is not None:
+        try:
+            tags = json.loads(args.tags)
+        except ValueError as e:
+            logger.error(f"'--tags' is not valid JSON: {e}")
+            sys.exit(1)
+        if not isinstance(tags, dict):
+            logger.error("'--tags' has to be a JSON object")
+            sys.exit(1)
+
+    iot_hub.set_iot_hub_rates(
+        credential,
+        args.azure_subscription_id,
+        args.resource_group_name,
+        args.iot_hub_name,
+        args.iot_hub_rate,
+        args.iot_hub_query_rate,
+    )
+    iot_devices.retag(
+        credential,
+        args.azure_subscription_id,
+        args.resource_group_name,
+        args.iot_hub_name,
+        tags,
+        args.condition,
+        args.device_ids_file_path,
+        logger,
+    )
@@ -0,0 +1,33 @@
+import argparse
+import datetime
+
+from azure.core.exceptions import ResourceNotFoundError
+from services import inventory
+from utils import get_logger_and_credential, lro
+
+
+def task_func(args: argparse.Namespace):
+    logger, credential = get_logger_and_credential(args)
+    pending = lro.PendingOperations(
+        lro.get_pending_path(args.state_dir, args.azure_subscription_id, args.resource_group_name)
+    )
+    operations = pending.get_all()
+    if not operations:
+        logger.info(f"No pending operations for resource group '{args.resource_group_name}'")
+        return
+    # A single listing of the resource group gives the provisioning state of all of them.
+    try:
+        rg_inventory = inventory.get(credential, args.azure_subscription_id, args.resource_group_name)
+    except ResourceNotFoundError:
+        rg_inventory = None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for operation in operations:
+        info = None
+        if rg_inventory is not None:
+            info = rg_inventory.get(operation["resource_type"], operation["resource_name"])
+        provisioning_state = "NotFound" if info is None else info.provisioning_state
+        elapsed = now - datetime.datetime.fromisoformat(operation["submitted_at"])
+        logger.info(
+            f"{operation['resource_type']} '{operation['resource_name']}': {provisioning_state}, "
+            f"submitted {int(elapsed.total_seconds())}s ago"
+        )
@@ -0,0 +1,47 @@
+import argparse
+import functools
+import logging
+from typing import Any, Dict
+
+from azure.core.exceptions import HttpResponseError
+from azure.identity import AzureCliCredential
+from utils import get_logger_and_credential, lro, scheduler
+
+
+def _wait_for(
+    credential: AzureCliCredential,
+    azure_subscription_id: str,
+    pending: lro.PendingOperations,
+    operation: Dict[str, Any],
+    logger: logging.Logger,
+):
+    poller = lro.resume(operation, credential, azure_subscription_id)
+    try:
+        res = poller.result()
+    except HttpResponseError:
+        # The operation failed, its continuation token is of no use anymore.
+        pending.remove(operation["resource_type"], operation["resource_name"])
+        raise
+    pending.remove(operation["resource_type"], operation["resource_name"])
+    logger.info(f"Provisioned {operation['resource_type']} '{res.name}'")
+
+
+def task_func(args: argparse.Namespace):
+    logger, credential = get_logger_and_credential(args)
+    pending = lro.PendingOperations(
+        lro.get_pending_path(args.state_dir, args.azure_subscription_id, args.resource_group_name)
+    )
+    operations = pending.get_all()
+    if not operations:
+        logger.info(f"No pending operations for resource group '{args.resource_group_name}'")
+        return
+    nodes = [
+        scheduler.Node(
+            f"{operation['resource_type']}/{operation['resource_name']}",
+            functools.partial(_wait_for, credential, args.azure_subscription_id, pending, operation, logger),
+        )
+        for operation in operations
+    ]
+    # Waiting only polls, so all operations are waited for at the same time.
+    scheduler.run(nodes, len(nodes), logger)
+    logger.info("All pending operations are done, run the deployment again to continue with the dependent steps")
@@ -1,19 +1,108 @@
 import argparse
-from typing import Optional, Tuple
-
-from azure.identity import AzureCliCredential
+import asyncio
+import contextlib
+import itertools
+import sys
+from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Optional, Tuple
 
 from . import logging
 
+if TYPE_CHECKING:
+    from azure.identity import AzureCliCredential
+
+    from .identity import TokenCache
+    from .scheduler import Node
+    from .state import DeploymentState
+
+# The modules using the Azure SDKs are imported in the functions below, so that the parsers can
+# import this package without loading them.
 _DEFAULT_LOGGER: Optional[logging.Logger] = None
-_DEFAULT_CREDENTIAL: Optional[AzureCliCredential] = None
+_DEFAULT_CREDENTIAL: Optional["AzureCliCredential"] = None
+_CREDENTIAL_KIND: Optional[str] = None
+_TOKEN_CACHE: Optional["TokenCache"] = None
+
 
+def get_logger_and_credential(args: argparse.Namespace) -> Tuple[logging.Logger, "AzureCliCredential"]:
+    from . import clients, identity, throttling
 
-def get_logger_and_credential(args: argparse.Namespace) -> Tuple[logging.Logger, AzureCliCredential]:
-    global _DEFAULT_LOGGER, _DEFAULT_CREDENTIAL
+    global _DEFAULT_LOGGER, _DEFAULT_CREDENTIAL, _CREDENTIAL_KIND, _TOKEN_CACHE
     if _DEFAULT_LOGGER is None:
         _DEFAULT_LOGGER = logging.configure_app_logger(args)
     if _DEFAULT_CREDENTIAL is None:
-        # Acquire a credential object using CLI-based authentication.
-        _DEFAULT_CREDENTIAL = AzureCliCredential()
+        clients.set_arm_endpoint(args.arm_endpoint)
+        throttling.configure(
+            {
+                throttling.ARM_READS: args.arm_read_rate,
+                throttling.ARM_WRITES: args.arm_write_rate,
+                throttling.IOT_HUB: args.iot_hub_rate,
+                throttling.IOT_HUB_QUERIES: args.iot_hub_query_rate,
+            },
+            clients.POOL_MAXSIZE,
+        )
+        if clients.is_emulated():
+            _DEFAULT_CREDENTIAL = identity.StaticTokenCredential()
+        else:
+            # Acquire a credential object, by default using CLI-based authentication. Its tokens are
+            # cached across the runs, so that e.g. the Azure CLI is not started again for each run.
+            _CREDENTIAL_KIND = args.credential
+            _TOKEN_CACHE = identity.TokenCache(args.token_cache_path)
+            _DEFAULT_CREDENTIAL = identity.CachingCredential(
+                identity.create_credential(_CREDENTIAL_KIND), _CREDENTIAL_KIND, _TOKEN_CACHE
+            )
     return _DEFAULT_LOGGER, _DEFAULT_CREDENTIAL
+
+
+def get_async_credential() -> Any:
+    """A new async credential matching the one of `get_logger_and_credential`, to be used with `async with`."""
+    from . import clients, identity
+
+    if clients.is_emulated():
+        return identity.AsyncStaticTokenCredential()
+    kind = _CREDENTIAL_KIND or identity.CLI_CREDENTIAL
+    return identity.AsyncCachingCredential(
+        identity.create_async_credential(kind), kind, _TOKEN_CACHE or identity.TokenCache(None)
+    )
+
+
+def run_async_steps(
+    get_nodes: Callable[[Any], List["Node"]],
+    max_parallel: int,
+    logger: logging.Logger,
+    state: Optional["DeploymentState"],
+):
+    """Run the steps `get_nodes` builds from an async credential on a new event loop, with `scheduler.run_async`.
+
+    The async clients created by the steps are closed once they are done, whatever the outcome.
+    """
+    from . import clients, scheduler
+
+    async def _run():
+        async with get_async_credential() as aio_credential:
+            try:
+                await scheduler.run_async(get_nodes(aio_credential), max_parallel, logger, state)
+            finally:
+                await clients.close_async_clients()
+
+    asyncio.run(_run())
+
+
+@contextlib.contextmanager
+def task_session(args: argparse.Namespace) -> Iterator[None]:
+    """Wrap a whole task run, reporting the run-wide statistics at its end."""
+    from . import clients, metrics, throttling, tracing
+
+    logger, _ = get_logger_and_credential(args)
+    if args.trace_out or args.trace_otlp_out:
+        tracing.enable()
+    try:
+        # Named after the (sub)commands of the run, e.g. "deploy vanilla".
+        command = itertools.takewhile(lambda arg: not arg.startswith("-"), sys.argv[1:])
+        with tracing.span(f"task {' '.join(command)}"):
+            yield
+    finally:
+        clients.log_connection_stats(logger)
+        metrics.log_summary(logger)
+        throttling.log_summary(logger)
+        if args.metrics_out:
+            metrics.export(args.metrics_out)
+        tracing.export(args.trace_out, args.trace_otlp_out)
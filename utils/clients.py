@@ -0,0 +1,293 @@
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple, Type, TypeVar
+
+import requests
+from azure.core.pipeline.policies import AsyncHTTPPolicy, HTTPPolicy, SansIOHTTPPolicy
+from azure.core.pipeline.transport import RequestsTransport
+from requests.adapters import HTTPAdapter
+
+from azure.core.pipeline import PipelineRequest, PipelineResponse
+
+from . import metrics, throttling, tracing
+
+if TYPE_CHECKING:
+    # Imported on first use, since not every subcommand needs them.
+    import aiohttp
+    from azure.iot.hub import IoTHubJobManager, IoTHubRegistryManager
+
+# The pools must be at least as large as the number of threads sending requests at once,
+# otherwise urllib3 discards the connections that do not fit back into the pool.
+POOL_CONNECTIONS = 16
+POOL_MAXSIZE = 64
+
+T = TypeVar("T")
+_ClientKey = Tuple[type, str, Optional[str]]
+
+
+class ConnectionStats(NamedTuple):
+    opened: int
+    reused: int
+
+
+_lock = threading.Lock()
+_clients: Dict[_ClientKey, Any] = {}
+_session: Optional[requests.Session] = None
+_async_clients: Dict[_ClientKey, Any] = {}
+_async_session: Optional["aiohttp.ClientSession"] = None
+_async_stats = {"opened": 0, "reused": 0}
+# Base URL of the management endpoint, None for the public cloud one.
+_arm_endpoint: Optional[str] = None
+
+
+def set_arm_endpoint(arm_endpoint: Optional[str]):
+    global _arm_endpoint
+    _arm_endpoint = arm_endpoint.rstrip("/") if arm_endpoint else None
+
+
+def is_emulated() -> bool:
+    """Whether the management endpoint is a plain HTTP one, i.e. the local emulator of the benchmarks.
+
+    The emulator also serves the IoT Hub and Cosmos DB data planes, over plain HTTP too, and
+    accepts any token.
+    """
+    return _arm_endpoint is not None and _arm_endpoint.startswith("http://")
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def get_transport() -> RequestsTransport:
+    """A transport on the shared, keep-alive `requests` session of this run."""
+    with _lock:
+        return RequestsTransport(session=_get_session(), session_owner=False)
+
+
+class _AllowHttpPolicy(SansIOHTTPPolicy):
+    """Lets the bearer token policy send its token over plain HTTP, to the emulator."""
+
+    def on_request(self, request: PipelineRequest):
+        request.context["enforce_https"] = False
+
+
+class _ThrottlingPolicy(HTTPPolicy):
+    """Sends every try through the limiter of ARM reads or writes shared by all the clients."""
+
+    def send(self, request: PipelineRequest) -> PipelineResponse:
+        limiter = throttling.get_arm_limiter(request.http_request.method)
+        limiter.acquire()
+        status_code = headers = None
+        try:
+            response = self.next.send(request)
+            status_code, headers = response.http_response.status_code, response.http_response.headers
+            return response
+        finally:
+            limiter.release(status_code, headers)
+
+
+class _AsyncThrottlingPolicy(AsyncHTTPPolicy):
+    async def send(self, request: PipelineRequest) -> PipelineResponse:
+        limiter = throttling.get_arm_limiter(request.http_request.method)
+        await limiter.acquire_async()
+        status_code = headers = None
+        try:
+            response = await self.next.send(request)
+            status_code, headers = response.http_response.status_code, response.http_response.headers
+            return response
+        finally:
+            limiter.release(status_code, headers)
+
+
+def _get_client_kwargs(api_version: Optional[str], is_async: bool = False) -> Dict[str, Any]:
+    per_call_policies: List[Any] = [metrics.CallMetricsPolicy()]
+    if is_emulated():
+        per_call_policies.append(_AllowHttpPolicy())
+    kwargs = {
+        "per_call_policies": per_call_policies,
+        # Run on every try, so that the retries are throttled and show up as well. The throttling
+        # comes first, so that the time spent waiting for it is not measured as latency.
+        "per_retry_policies": [
+            _AsyncThrottlingPolicy() if is_async else _ThrottlingPolicy(),
+            metrics.TryMetricsPolicy(),
+            tracing.HttpTracingPolicy(),
+        ],
+    }
+    if api_version is not None:
+        kwargs["api_version"] = api_version
+    if _arm_endpoint is not None:
+        kwargs["base_url"] = _arm_endpoint
+    return kwargs
+
+
+def _on_raw_request(request: PipelineRequest):
+    metrics.on_raw_request(request)
+    tracing.on_request(request)
+
+
+def _on_raw_response(response: PipelineResponse):
+    metrics.on_response(response)
+    tracing.on_response(response)
+
+
+def get_data_plane_options() -> Dict[str, Any]:
+    """Keyword arguments for the data plane clients, which take hooks instead of policies."""
+    return {"transport": get_transport(), "raw_request_hook": _on_raw_request, "raw_response_hook": _on_raw_response}
+
+
+def instrument_msrest_client(client: Any):
+    """Hook the msrest based clients (e.g. the IoT Hub registry manager) into the instrumentation."""
+    client.config.hooks.append(metrics.record_msrest_response)
+    client.config.hooks.append(tracing.record_msrest_response)
+
+
+def _instrument_iot_hub_manager(manager: Any):
+    instrument_msrest_client(manager.protocol)
+    if is_emulated():
+        # The IoT Hub managers always talk HTTPS to the host name of the connection string.
+        manager.protocol.config.base_url = manager.protocol.config.base_url.replace("https://", "http://", 1)
+
+
+def get_registry_manager(conn_str: str) -> "IoTHubRegistryManager":
+    """Create an instrumented IoT Hub registry manager from a service connection string."""
+    from azure.iot.hub import IoTHubRegistryManager
+
+    registry_manager = IoTHubRegistryManager(conn_str)
+    _instrument_iot_hub_manager(registry_manager)
+    return registry_manager
+
+
+def get_job_manager(conn_str: str) -> "IoTHubJobManager":
+    """Same as `get_registry_manager`, for the manager of the IoT Hub jobs: import, export and scheduled ones."""
+    from azure.iot.hub import IoTHubJobManager
+
+    job_manager = IoTHubJobManager(conn_str)
+    _instrument_iot_hub_manager(job_manager)
+    return job_manager
+
+
+def get_client(
+    client_type: Type[T],
+    credential: Any,
+    azure_subscription_id: str,
+    api_version: Optional[str] = None,
+) -> T:
+    """Get the management client of the given type, creating it on first use.
+
+    Clients are shared for the whole run and all of them send their requests over the same
+    connection pool, so that the TCP and TLS handshakes to the management endpoint are paid
+    once instead of once per step.
+    """
+    key = (client_type, azure_subscription_id, api_version)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = client_type(
+                credential,
+                azure_subscription_id,
+                transport=RequestsTransport(session=_get_session(), session_owner=False),
+                **_get_client_kwargs(api_version),
+            )
+            _clients[key] = client
+    return client
+
+
+def get_legacy_client(client_type: Type[T], credentials: Any, azure_subscription_id: str) -> T:
+    """Same as `get_client`, for the msrest based clients that have no azure-core transport.
+
+    These keep their own `requests` session, which is opened once so that at least their own
+    connections are reused between calls.
+    """
+    key = (client_type, azure_subscription_id, None)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            kwargs = {} if _arm_endpoint is None else {"base_url": _arm_endpoint}
+            client = client_type(credentials, azure_subscription_id, **kwargs)
+            instrument_msrest_client(client)
+            client.__enter__()
+            _clients[key] = client
+    return client
+
+
+async def _on_connection_create_end(session, trace_config_ctx, params):
+    _async_stats["opened"] += 1
+
+
+async def _on_connection_reuseconn(session, trace_config_ctx, params):
+    _async_stats["reused"] += 1
+
+
+def _get_async_session() -> "aiohttp.ClientSession":
+    import aiohttp
+
+    global _async_session
+    if _async_session is None:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(_on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+        _async_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=POOL_MAXSIZE), trace_configs=[trace_config]
+        )
+    return _async_session
+
+
+def get_async_client(
+    client_type: Type[T],
+    credential: Any,
+    azure_subscription_id: str,
+    api_version: Optional[str] = None,
+) -> T:
+    """Async counterpart of `get_client`, must be called from within the running event loop.
+
+    The clients are closed by `close_async_clients`, not by the code using them.
+    """
+    from azure.core.pipeline.transport import AioHttpTransport
+
+    key = (client_type, azure_subscription_id, api_version)
+    client = _async_clients.get(key)
+    if client is None:
+        client = client_type(
+            credential,
+            azure_subscription_id,
+            transport=AioHttpTransport(session=_get_async_session(), session_owner=False),
+            **_get_client_kwargs(api_version, is_async=True),
+        )
+        _async_clients[key] = client
+    return client
+
+
+async def close_async_clients():
+    global _async_session
+    for client in _async_clients.values():
+        await client.close()
+    _async_clients.clear()
+    if _async_session is not None:
+        await _async_session.close()
+        _async_session = None
+
+
+def get_connection_stats() -> ConnectionStats:
+    opened = requests_sent = 0
+    if _session is not None:
+        for adapter in {id(adapter): adapter for adapter in _session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools[pool_key]
+                opened += pool.num_connections
+                requests_sent += pool.num_requests
+    return ConnectionStats(
+        opened + _async_stats["opened"],
+        max(requests_sent - opened, 0) + _async_stats["reused"],
+    )
+
+
+def log_connection_stats(logger: logging.Logger):
+    stats = get_connection_stats()
+    logger.info(f"HTTP connections to Azure: {stats.opened} opened, {stats.reused} reused")
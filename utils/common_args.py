@@ -1,5 +1,9 @@
 import argparse
 
+from parsers.arg_defaults import CREDENTIAL_KINDS, DEFAULT_CREDENTIAL, DEFAULT_TOKEN_CACHE_PATH
+
+from . import throttling
+
 
 def add_to_parser(parser: argparse.ArgumentParser):
     parser.add_argument(
@@ -15,3 +19,74 @@ def add_to_parser(parser: argparse.ArgumentParser):
         action="store_true",
         help="The flag for whether there should be logging messages.",
     )
+    parser.add_argument(
+        "--trace-out",
+        type=str,
+        default=None,
+        help="Path of a Chrome trace JSON file (chrome://tracing, Perfetto) to write the timings of the "
+        "steps, long-running operations and Azure requests of the run to.",
+    )
+    parser.add_argument(
+        "--trace-otlp-out",
+        type=str,
+        default=None,
+        help="Path of a JSON file to write the same trace to, in the OpenTelemetry (OTLP) file exporter format.",
+    )
+    parser.add_argument(
+        "--metrics-out",
+        type=str,
+        default=None,
+        help="Path of a JSON file to write the request counts, retries, throttling events, latency histograms "
+        "and transferred bytes of the Azure requests of the run to, per endpoint.",
+    )
+    parser.add_argument(
+        "--arm-endpoint",
+        type=str,
+        default=None,
+        help="Base URL of the Azure Resource Manager endpoint to use instead of the public cloud one. A plain "
+        "'http://' endpoint is taken to be the local emulator of the benchmarks, which accepts any token and "
+        "also serves the IoT Hub and Cosmos DB data planes over plain HTTP.",
+    )
+    parser.add_argument(
+        "--arm-read-rate",
+        type=float,
+        default=throttling.DEFAULT_RATES[throttling.ARM_READS],
+        help="Maximum Azure Resource Manager read requests per second of the run, shared by all its clients "
+        "(0 for no limit).",
+    )
+    parser.add_argument(
+        "--arm-write-rate",
+        type=float,
+        default=throttling.DEFAULT_RATES[throttling.ARM_WRITES],
+        help="Maximum Azure Resource Manager write requests per second of the run (0 for no limit).",
+    )
+    parser.add_argument(
+        "--iot-hub-rate",
+        type=float,
+        default=None,
+        help="Maximum IoT Hub registry operations per second of the run (0 for no limit). The default is the "
+        "quota of the SKU and units of the IoT Hub.",
+    )
+    parser.add_argument(
+        "--iot-hub-query-rate",
+        type=float,
+        default=None,
+        help="Maximum IoT Hub query pages per second of the run (0 for no limit). The default is the quota of the "
+        "SKU and units of the IoT Hub.",
+    )
+    parser.add_argument(
+        "--credential",
+        type=str,
+        choices=CREDENTIAL_KINDS,
+        default=DEFAULT_CREDENTIAL,
+        help="How to authenticate to Azure: with the Azure CLI login, with a service principal from the "
+        "AZURE_TENANT_ID, AZURE_CLIENT_ID and AZURE_CLIENT_SECRET environment variables, or with the managed "
+        "identity of the machine.",
+    )
+    parser.add_argument(
+        "--token-cache-path",
+        type=str,
+        default=DEFAULT_TOKEN_CACHE_PATH,
+        help="Path of the encrypted file caching the access tokens across runs, an empty string to only cache "
+        "them in memory.",
+    )
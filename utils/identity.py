@@ -7,12 +7,25 @@
 # Need msrest >= 0.6.0
 # See also https://pypi.org/project/azure-identity/
 
-from azure.core.pipeline import PipelineContext, PipelineRequest
-from azure.core.pipeline.policies import BearerTokenCredentialPolicy
-from azure.core.pipeline.transport import HttpRequest
-from azure.identity import DefaultAzureCredential
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from azure.core.credentials import AccessToken
+from azure.identity import AzureCliCredential, DefaultAzureCredential, EnvironmentCredential, ManagedIdentityCredential
+from cryptography.fernet import Fernet, InvalidToken
 from msrest.authentication import BasicTokenAuthentication
 
+# The choices of '--credential', see `parsers.arg_defaults.CREDENTIAL_KINDS`.
+CLI_CREDENTIAL = "cli"
+ENVIRONMENT_CREDENTIAL = "environment"
+MANAGED_IDENTITY_CREDENTIAL = "managed-identity"
+# Tokens are refreshed this many seconds before they expire.
+REFRESH_MARGIN = 300
+
 
 class AzureIdentityCredentialAdapter(BasicTokenAuthentication):
     def __init__(self, credential=None, resource_id="https://management.azure.com/.default", **kwargs):
@@ -24,26 +37,194 @@ class AzureIdentityCredentialAdapter(BasicTokenAuthentication):
         super(AzureIdentityCredentialAdapter, self).__init__(None)
         if credential is None:
             credential = DefaultAzureCredential()
-        self._policy = BearerTokenCredentialPolicy(credential, resource_id, **kwargs)
-
-    def _make_request(self):
-        return PipelineRequest(
-            HttpRequest("AzureIdentityCredentialAdapter", "https://fakeurl"),
-            PipelineContext(None),
-        )
+        self._credential = credential
+        self._resource_id = resource_id
+        self._expires_on = 0
 
     def set_token(self):
-        """Ask the azure-core BearerTokenCredentialPolicy policy to get a token.
-        Using the policy gives us for free the caching system of azure-core.
-        We could make this code simpler by using private method, but by definition
-        I can't assure they will be there forever, so mocking a fake call to the policy
-        to extract the token, using 100% public API."""
-        request = self._make_request()
-        self._policy.on_request(request)
-        # Read Authorization, and get the second part after Bearer
-        token = request.http_request.headers["Authorization"].split(" ", 1)[1]
-        self.token = {"access_token": token}
+        """Get a token from the credential, unless the current one is still valid for a while."""
+        if self.token and self._expires_on - time.time() > REFRESH_MARGIN:
+            return
+        access_token = self._credential.get_token(self._resource_id)
+        self.token = {"access_token": access_token.token}
+        self._expires_on = access_token.expires_on
 
     def signed_session(self, session=None):
         self.set_token()
         return super(AzureIdentityCredentialAdapter, self).signed_session(session)
+
+
+class StaticTokenCredential:
+    """A credential handing out a fixed token, for the local emulator which accepts any token."""
+
+    TOKEN = "emulator"
+
+    def get_token(self, *scopes, **kwargs):
+        return AccessToken(self.TOKEN, int(time.time()) + 3600)
+
+
+class AsyncStaticTokenCredential:
+    """Async counterpart of `StaticTokenCredential`."""
+
+    async def get_token(self, *scopes, **kwargs):
+        return AccessToken(StaticTokenCredential.TOKEN, int(time.time()) + 3600)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+def _get_identity(kind: str) -> str:
+    """What the tokens of a credential kind depend on besides the scopes, e.g. the logged in Azure CLI account."""
+    if kind == CLI_CREDENTIAL:
+        config_dir = os.environ.get("AZURE_CONFIG_DIR") or os.path.join(os.path.expanduser("~"), ".azure")
+        profile_path = os.path.join(config_dir, "azureProfile.json")
+        if not os.path.isfile(profile_path):
+            return ""
+        with open(profile_path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    if kind == ENVIRONMENT_CREDENTIAL:
+        return f"{os.environ.get('AZURE_TENANT_ID', '')}/{os.environ.get('AZURE_CLIENT_ID', '')}"
+    return os.environ.get("AZURE_CLIENT_ID", "system-assigned")
+
+
+class TokenCache:
+    """Access tokens per credential and scopes, in memory and in an encrypted file shared by the runs.
+
+    The file is encrypted with a key of its own, kept next to it and readable by its owner only.
+    Without a path, the tokens are only cached in memory.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self._path = path
+        self._lock = threading.Lock()
+        self._tokens: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _get_fernet(self) -> Fernet:
+        key_path = f"{self._path}.key"
+        if not os.path.isfile(key_path):
+            os.makedirs(os.path.dirname(key_path) or ".", exist_ok=True)
+            fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(Fernet.generate_key())
+        with open(key_path, "rb") as f:
+            return Fernet(f.read())
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self._path or not os.path.isfile(self._path):
+            return {}
+        with open(self._path, "rb") as f:
+            data = f.read()
+        try:
+            return json.loads(self._get_fernet().decrypt(data))
+        except (InvalidToken, ValueError):
+            # A cache written with another key or a corrupt one, it is simply overwritten.
+            return {}
+
+    def _save(self, tokens: Dict[str, Dict[str, Any]]):
+        data = self._get_fernet().encrypt(json.dumps(tokens).encode("utf-8"))
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path)
+
+    def get(self, key: str) -> Optional[AccessToken]:
+        with self._lock:
+            if self._tokens is None:
+                self._tokens = self._load()
+            token = self._tokens.get(key)
+        if token is None or token["expires_on"] - time.time() <= REFRESH_MARGIN:
+            return None
+        return AccessToken(token["token"], token["expires_on"])
+
+    def set(self, key: str, access_token: AccessToken):
+        token = {"token": access_token.token, "expires_on": access_token.expires_on}
+        with self._lock:
+            if self._tokens is None:
+                self._tokens = {}
+            self._tokens[key] = token
+            if not self._path:
+                return
+            # Merge with the tokens other runs may have written in the meantime, dropping the expired ones.
+            tokens = self._load()
+            tokens[key] = token
+            now = time.time()
+            self._save({key: token for key, token in tokens.items() if token["expires_on"] > now})
+
+
+def _get_cache_key(kind: str, scopes: Any) -> str:
+    return f"{kind}|{_get_identity(kind)}|{' '.join(sorted(scopes))}"
+
+
+class CachingCredential:
+    """Wraps a credential, getting its tokens from the token cache while they are valid for a while."""
+
+    def __init__(self, credential: Any, kind: str, cache: TokenCache):
+        self._credential = credential
+        self._kind = kind
+        self._cache = cache
+
+    def get_token(self, *scopes, **kwargs):
+        key = _get_cache_key(self._kind, scopes)
+        access_token = self._cache.get(key)
+        if access_token is None:
+            access_token = self._credential.get_token(*scopes, **kwargs)
+            self._cache.set(key, access_token)
+        return access_token
+
+    def close(self):
+        close = getattr(self._credential, "close", None)
+        if close is not None:
+            close()
+
+
+class AsyncCachingCredential:
+    """Async counterpart of `CachingCredential`, sharing its token cache."""
+
+    def __init__(self, credential: Any, kind: str, cache: TokenCache):
+        self._credential = credential
+        self._kind = kind
+        self._cache = cache
+
+    async def get_token(self, *scopes, **kwargs):
+        key = _get_cache_key(self._kind, scopes)
+        access_token = self._cache.get(key)
+        if access_token is None:
+            access_token = await self._credential.get_token(*scopes, **kwargs)
+            self._cache.set(key, access_token)
+        return access_token
+
+    async def close(self):
+        await self._credential.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+def create_credential(kind: str) -> Any:
+    """A credential of the given kind: the Azure CLI login, a service principal from the
+    AZURE_TENANT_ID/AZURE_CLIENT_ID/AZURE_CLIENT_SECRET environment variables or a managed identity."""
+    if kind == ENVIRONMENT_CREDENTIAL:
+        return EnvironmentCredential()
+    if kind == MANAGED_IDENTITY_CREDENTIAL:
+        return ManagedIdentityCredential()
+    return AzureCliCredential()
+
+
+def create_async_credential(kind: str) -> Any:
+    from azure.identity import aio as identity_aio
+
+    if kind == ENVIRONMENT_CREDENTIAL:
+        return identity_aio.EnvironmentCredential()
+    if kind == MANAGED_IDENTITY_CREDENTIAL:
+        return identity_aio.ManagedIdentityCredential()
+    return identity_aio.AzureCliCredential()
@@ -0,0 +1,207 @@
+import abc
+import json
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+SQLITE_KEY_STORE = "sqlite"
+JSONL_KEY_STORE = "jsonl"
+JSON_KEY_STORE = "json"
+KEY_STORE_KINDS = (SQLITE_KEY_STORE, JSONL_KEY_STORE, JSON_KEY_STORE)
+# Extension of the store file, appended to the path of the device IDs file.
+KEY_STORE_EXTENSIONS = {SQLITE_KEY_STORE: ".keys.db", JSONL_KEY_STORE: ".keys.jsonl", JSON_KEY_STORE: ".keys"}
+# Device ID, primary key and secondary key.
+DeviceKeys = Tuple[str, str, str]
+_EXPORT_BATCH_SIZE = 1000
+
+
+def get_key_store_path(device_ids_file_path: str, kind: str) -> str:
+    return f"{device_ids_file_path}{KEY_STORE_EXTENSIONS[kind]}"
+
+
+def write_legacy_json(keys: Iterable[DeviceKeys], path: str):
+    """Write `{device ID: [primary key, secondary key]}` as `json.dump(..., indent=2)` would, one device at a time."""
+    tmp_path = f"{path}.tmp"
+    is_empty = True
+    with open(tmp_path, "w") as f:
+        f.write("{")
+        for device_id, primary_key, secondary_key in keys:
+            f.write("" if is_empty else ",")
+            f.write(json.dumps({device_id: [primary_key, secondary_key]}, indent=2)[1:-2])
+            is_empty = False
+        f.write("}" if is_empty else "\n}")
+    os.replace(tmp_path, path)
+
+
+def _iter_legacy_json(path: str) -> Iterator[DeviceKeys]:
+    with open(path, "r") as f:
+        id_to_keys: Dict[str, Tuple[str, str]] = json.load(f)
+    for device_id, (primary_key, secondary_key) in id_to_keys.items():
+        yield device_id, primary_key, secondary_key
+
+
+class KeyStore(abc.ABC):
+    """Persistent record of the keys of the onboarded devices, written batch by batch as they are registered.
+
+    The keys put last for a device replace the ones put before.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @abc.abstractmethod
+    def put_many(self, keys: Iterable[DeviceKeys]):
+        """Add the keys of a batch of devices, durably once it returns."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, device_id: str) -> Optional[Tuple[str, str]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def __iter__(self) -> Iterator[DeviceKeys]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> "KeyStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SqliteKeyStore(KeyStore):
+    """Keys in a SQLite table indexed by device ID, the default."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS keys (device_id TEXT PRIMARY KEY, primary_key TEXT, secondary_key TEXT)"
+            )
+
+    def put_many(self, keys: Iterable[DeviceKeys]):
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO keys VALUES (?, ?, ?)", keys)
+
+    def get(self, device_id: str) -> Optional[Tuple[str, str]]:
+        row = self._db.execute(
+            "SELECT primary_key, secondary_key FROM keys WHERE device_id = ?", (device_id,)
+        ).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def __iter__(self) -> Iterator[DeviceKeys]:
+        cursor = self._db.execute("SELECT device_id, primary_key, secondary_key FROM keys ORDER BY device_id")
+        for rows in iter(lambda: cursor.fetchmany(_EXPORT_BATCH_SIZE), []):
+            yield from rows
+
+    def close(self):
+        self._db.close()
+
+
+class JsonlKeyStore(KeyStore):
+    """Keys appended as JSON lines, readable and recoverable with any text tool.
+
+    Lookups and exports index the file by device ID, in memory, on first use.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._file = open(path, "a+")
+        self._index: Optional[Dict[str, int]] = None
+
+    def put_many(self, keys: Iterable[DeviceKeys]):
+        self._file.seek(0, os.SEEK_END)
+        for device_id, primary_key, secondary_key in keys:
+            offset = self._file.tell()
+            self._file.write(
+                json.dumps({"deviceId": device_id, "primaryKey": primary_key, "secondaryKey": secondary_key}) + "\n"
+            )
+            if self._index is not None:
+                self._index[device_id] = offset
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _get_index(self) -> Dict[str, int]:
+        if self._index is None:
+            self._index = {}
+            self._file.seek(0)
+            offset = 0
+            line = self._file.readline()
+            while line:
+                # A line cut by a crash is not a complete record.
+                if line.endswith("\n"):
+                    self._index[json.loads(line)["deviceId"]] = offset
+                offset = self._file.tell()
+                line = self._file.readline()
+        return self._index
+
+    def _read(self, offset: int) -> DeviceKeys:
+        self._file.seek(offset)
+        record = json.loads(self._file.readline())
+        return record["deviceId"], record["primaryKey"], record["secondaryKey"]
+
+    def get(self, device_id: str) -> Optional[Tuple[str, str]]:
+        offset = self._get_index().get(device_id)
+        return None if offset is None else self._read(offset)[1:]
+
+    def __iter__(self) -> Iterator[DeviceKeys]:
+        for offset in sorted(self._get_index().values()):
+            yield self._read(offset)
+
+    def close(self):
+        self._file.close()
+
+
+class JsonKeyStore(KeyStore):
+    """The legacy `{device ID: [primary key, secondary key]}` JSON file, rewritten whole on close."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._id_to_keys: Dict[str, Tuple[str, str]] = {}
+        if os.path.isfile(path):
+            self._id_to_keys = {
+                device_id: (primary, secondary) for device_id, primary, secondary in _iter_legacy_json(path)
+            }
+        self._changed = False
+
+    def put_many(self, keys: Iterable[DeviceKeys]):
+        for device_id, primary_key, secondary_key in keys:
+            self._id_to_keys[device_id] = (primary_key, secondary_key)
+            self._changed = True
+
+    def get(self, device_id: str) -> Optional[Tuple[str, str]]:
+        return self._id_to_keys.get(device_id)
+
+    def __iter__(self) -> Iterator[DeviceKeys]:
+        for device_id, (primary_key, secondary_key) in self._id_to_keys.items():
+            yield device_id, primary_key, secondary_key
+
+    def close(self):
+        if self._changed:
+            write_legacy_json(self, self.path)
+            self._changed = False
+
+
+_KEY_STORE_TYPES = {SQLITE_KEY_STORE: SqliteKeyStore, JSONL_KEY_STORE: JsonlKeyStore, JSON_KEY_STORE: JsonKeyStore}
+
+
+def open_key_store(device_ids_file_path: str, kind: str, logger: logging.Logger) -> KeyStore:
+    """Open the key store of a device IDs file, next to it.
+
+    A new SQLite or JSONL store starts with the keys of the legacy `<device IDs file>.keys` JSON
+    file, if there is one, so that exporting it gives back all the keys onboarded so far.
+    """
+    path = get_key_store_path(device_ids_file_path, kind)
+    legacy_path = get_key_store_path(device_ids_file_path, JSON_KEY_STORE)
+    is_new = not os.path.exists(path)
+    key_store = _KEY_STORE_TYPES[kind](path)
+    if is_new and kind != JSON_KEY_STORE and os.path.isfile(legacy_path):
+        key_store.put_many(_iter_legacy_json(legacy_path))
+        logger.info(f"Imported the device keys of '{legacy_path}' into '{path}'")
+    return key_store
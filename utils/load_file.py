@@ -1,10 +1,83 @@
-from typing import List
+import contextlib
+import csv
+import gzip
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+from typing import IO, Iterator
 
+# https://docs.microsoft.com/en-us/azure/iot-hub/iot-hub-devguide-identity-registry#device-identity-properties
+DEVICE_ID_PATTERN = re.compile(r"[A-Za-z0-9\-.+%_#*?!(),:=@$']{1,128}")
+# First cells of a CSV header row, compared in lower case.
+CSV_HEADERS = {"deviceid", "device_id", "device id", "id"}
+_GZIP_MAGIC = b"\x1f\x8b"
+_COUNT_CHUNK_SIZE = 1 << 20
 
-def load_device_ids(device_ids_file_path: str) -> List[str]:
-    device_ids = []
+
+def _open(device_ids_file_path: str, mode: str) -> IO:
+    # Gzipped files are recognized by their content, whatever their extension.
+    with open(device_ids_file_path, "rb") as f:
+        is_gzip = f.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC
+    if is_gzip:
+        return gzip.open(device_ids_file_path, mode)
+    return open(device_ids_file_path, mode)
+
+
+def _is_csv(device_ids_file_path: str) -> bool:
+    name = device_ids_file_path.lower()
+    return name.endswith(".csv") or name.endswith(".csv.gz")
+
+
+def _iter_lines(device_ids_file_path: str) -> Iterator[str]:
+    with _open(device_ids_file_path, "rt") as f:
+        if not _is_csv(device_ids_file_path):
+            for line in f:
+                yield line.strip()
+            return
+        # The device IDs are the first column, below an optional header row.
+        for row_number, row in enumerate(csv.reader(f)):
+            device_id = row[0].strip() if row else ""
+            if row_number == 0 and device_id.lower() in CSV_HEADERS:
+                continue
+            yield device_id
+
+
+def count_lines(device_ids_file_path: str) -> int:
+    """Number of lines of the file, an upper bound of its device IDs read without decoding them."""
+    if not device_ids_file_path:
+        return 0
+    count = 0
+    with _open(device_ids_file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_COUNT_CHUNK_SIZE), b""):
+            count += chunk.count(b"\n")
+    return count
+
+
+def iter_device_ids(device_ids_file_path: str, logger: logging.Logger) -> Iterator[str]:
+    """Yield the device IDs of a text file with one ID per line, or of the first column of a CSV file.
+
+    Both can be gzipped. Blank lines, IDs that IoT Hub would reject and repeated IDs are skipped.
+    The IDs already seen are kept in a temporary SQLite database rather than in memory, so that
+    the memory in use does not grow with the size of the file.
+    """
     if not device_ids_file_path:
-        return device_ids
-    with open(device_ids_file_path, "r") as f:
-        device_ids = [line.strip() for line in f if line]
-    return device_ids
+        return
+    with tempfile.TemporaryDirectory() as tmp_dir, contextlib.closing(
+        sqlite3.connect(os.path.join(tmp_dir, "device-ids.db"))
+    ) as seen:
+        # Thrown away at the end, there is nothing to recover after a crash.
+        seen.execute("PRAGMA journal_mode = OFF")
+        seen.execute("PRAGMA synchronous = OFF")
+        seen.execute("CREATE TABLE seen (id TEXT PRIMARY KEY) WITHOUT ROWID")
+        for device_id in _iter_lines(device_ids_file_path):
+            if not device_id:
+                continue
+            if not DEVICE_ID_PATTERN.fullmatch(device_id):
+                logger.warning(f"Skipping invalid device ID '{device_id}'")
+                continue
+            if seen.execute("INSERT OR IGNORE INTO seen VALUES (?)", (device_id,)).rowcount == 0:
+                logger.debug(f"Skipping repeated device ID '{device_id}'")
+                continue
+            yield device_id
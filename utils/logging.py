@@ -16,7 +16,7 @@ def configure_app_logger(args: argparse.Namespace) -> Logger:
     # Configure all loggers.
     logging.basicConfig(
         format="%(asctime)s | %(levelname)s | %(module)s: %(message)s",
-        datefmt="%d-%m-%Y %H:%M",
+        datefmt="%d-%m-%Y %H:%M:%S",
     )
     # Disable global logger.
     logging.getLogger().disabled = True
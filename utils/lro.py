@@ -0,0 +1,136 @@
+import datetime
+import functools
+import importlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from azure.core.polling import AsyncLROPoller, LROPoller
+
+from . import clients, tracing
+from .scheduler import StepDetached
+
+
+class Operation(NamedTuple):
+    """What is needed to rehydrate the poller of a long-running operation in another process."""
+
+    resource_type: str
+    resource_name: str
+    # The management client class the operation was started with, sync or async.
+    client_type: type
+    api_version: Optional[str]
+    # Path of the `begin_*` method on the client, e.g. "storage_accounts.begin_create".
+    method: str
+    # Positional arguments of the `begin_*` method. The request body is not needed to resume
+    # polling and is stored as None.
+    args: Tuple[Any, ...]
+
+
+def get_pending_path(state_dir: str, azure_subscription_id: str, resource_group_name: str) -> str:
+    return os.path.join(state_dir, azure_subscription_id, f"{resource_group_name.lower()}.pending.json")
+
+
+def _get_client_path(client_type: type) -> str:
+    # Operations started with an async client are resumed with the sync one of the same package.
+    return f"{client_type.__module__.replace('.aio.', '.')}.{client_type.__qualname__}"
+
+
+def import_client_type(client_path: str) -> type:
+    module_name, _, type_name = client_path.rpartition(".")
+    return getattr(importlib.import_module(module_name), type_name)
+
+
+def resume(operation: Dict[str, Any], credential: Any, azure_subscription_id: str) -> LROPoller:
+    """Rehydrate the poller of a pending operation from its continuation token."""
+    client_type = import_client_type(operation["client"])
+    client = clients.get_client(client_type, credential, azure_subscription_id, operation["api_version"])
+    begin = functools.reduce(getattr, operation["method"].split("."), client)
+    return begin(*operation["args"], continuation_token=operation["continuation_token"])
+
+
+class PendingOperations:
+    """The long-running operations submitted with `--no-wait` and not waited for yet.
+
+    They are stored in a JSON file next to the deployment state, keyed by their resource.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.isfile(self._path):
+            return {}
+        with open(self._path, "r") as f:
+            return json.load(f)
+
+    def _save(self, operations: Dict[str, Dict[str, Any]]):
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(operations, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._path)
+
+    def get_all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._load().values())
+
+    def add(self, operation: Operation, continuation_token: str):
+        with self._lock:
+            operations = self._load()
+            operations[f"{operation.resource_type}/{operation.resource_name}".lower()] = {
+                "resource_type": operation.resource_type,
+                "resource_name": operation.resource_name,
+                "client": _get_client_path(operation.client_type),
+                "api_version": operation.api_version,
+                "method": operation.method,
+                "args": list(operation.args),
+                "continuation_token": continuation_token,
+                "submitted_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }
+            self._save(operations)
+
+    def remove(self, resource_type: str, resource_name: str):
+        with self._lock:
+            operations = self._load()
+            if operations.pop(f"{resource_type}/{resource_name}".lower(), None) is not None:
+                self._save(operations)
+
+
+_pending: Optional[PendingOperations] = None
+
+
+def detach_to(pending: Optional[PendingOperations]):
+    """Switch `--no-wait` mode on, persisting the operations into `pending`, or off with None."""
+    global _pending
+    _pending = pending
+
+
+def _detach(operation: Operation, continuation_token: str):
+    assert _pending is not None
+    _pending.add(operation, continuation_token)
+    raise StepDetached(f"{operation.resource_type} '{operation.resource_name}'")
+
+
+def _span(operation: Operation):
+    return tracing.span(
+        f"lro {operation.method}",
+        resource_type=operation.resource_type,
+        resource_name=operation.resource_name,
+    )
+
+
+def result(poller: LROPoller, operation: Operation) -> Any:
+    """Wait for the result of the operation, or detach from it in `--no-wait` mode."""
+    if _pending is not None:
+        _detach(operation, poller.continuation_token())
+    with _span(operation):
+        return poller.result()
+
+
+async def result_async(poller: AsyncLROPoller, operation: Operation) -> Any:
+    if _pending is not None:
+        _detach(operation, poller.continuation_token())
+    with _span(operation):
+        return await poller.result()
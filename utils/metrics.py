@@ -0,0 +1,239 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from azure.core.pipeline import PipelineRequest, PipelineResponse
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+
+# Upper bounds of the latency histogram buckets, in milliseconds. The last bucket is unbounded.
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_TRY_START_KEY = "metrics_try_start"
+# ARM reports how many requests of the hourly subscription budget are left in these headers.
+RATE_LIMIT_HEADERS = (
+    "x-ms-ratelimit-remaining-subscription-reads",
+    "x-ms-ratelimit-remaining-subscription-writes",
+)
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.tries = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_ms_total = 0.0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    @property
+    def retries(self) -> int:
+        return max(self.tries - self.calls, 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "tries": self.tries,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "server_errors": self.server_errors,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "latency_ms_total": round(self.latency_ms_total, 3),
+            "latency_ms_histogram": {
+                **{f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.latency_histogram)},
+                "inf": self.latency_histogram[-1],
+            },
+        }
+
+
+_lock = threading.Lock()
+_endpoints: Dict[str, EndpointMetrics] = {}
+# Lowest remaining ARM request budget seen during the run, per rate limit header.
+_rate_limit_remaining: Dict[str, int] = {}
+
+
+def get_endpoint(method: str, url: str) -> str:
+    """Group the requests by host, method and path, with the resource names left out.
+
+    Management, IoT Hub and Cosmos DB paths alternate collection and resource names (e.g.
+    '/resourceGroups/{}/providers/Microsoft.Devices/IotHubs/{}'), except for the resource
+    provider namespace following 'providers'.
+    """
+    parsed = urlparse(url)
+    segments = []
+    expect_name = keep_next = False
+    for segment in (segment for segment in parsed.path.split("/") if segment):
+        if keep_next:
+            segments.append(segment)
+            keep_next = False
+        elif expect_name:
+            segments.append("{}")
+            expect_name = False
+        else:
+            segments.append(segment)
+            keep_next = segment.lower() == "providers"
+            expect_name = not keep_next
+    return f"{method} {parsed.netloc}/{'/'.join(segments)}"
+
+
+def _get(endpoint: str) -> EndpointMetrics:
+    endpoint_metrics = _endpoints.get(endpoint)
+    if endpoint_metrics is None:
+        endpoint_metrics = _endpoints[endpoint] = EndpointMetrics()
+    return endpoint_metrics
+
+
+def _content_length(headers: Any) -> int:
+    try:
+        return int(headers.get("Content-Length") or 0)
+    except ValueError:
+        return 0
+
+
+def record_call(method: str, url: str):
+    with _lock:
+        _get(get_endpoint(method, url)).calls += 1
+
+
+def record_try(
+    method: str,
+    url: str,
+    status_code: Optional[int],
+    latency_ms: float,
+    bytes_sent: int,
+    bytes_received: int,
+):
+    with _lock:
+        endpoint_metrics = _get(get_endpoint(method, url))
+        endpoint_metrics.tries += 1
+        if status_code == 429:
+            endpoint_metrics.throttled += 1
+        elif status_code is not None and status_code >= 500:
+            endpoint_metrics.server_errors += 1
+        endpoint_metrics.bytes_sent += bytes_sent
+        endpoint_metrics.bytes_received += bytes_received
+        endpoint_metrics.latency_ms_total += latency_ms
+        endpoint_metrics.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+
+def record_rate_limits(headers: Any):
+    for header in RATE_LIMIT_HEADERS:
+        value = headers.get(header)
+        if value is None or not value.isdigit():
+            continue
+        with _lock:
+            _rate_limit_remaining[header] = min(int(value), _rate_limit_remaining.get(header, int(value)))
+
+
+def on_request(request: PipelineRequest):
+    request.context[_TRY_START_KEY] = time.perf_counter()
+
+
+def on_response(response: PipelineResponse):
+    start = response.context.get(_TRY_START_KEY)
+    if start is None:
+        return
+    http_request = response.http_request
+    record_try(
+        http_request.method,
+        http_request.url,
+        response.http_response.status_code,
+        (time.perf_counter() - start) * 1000,
+        _content_length(http_request.headers),
+        _content_length(response.http_response.headers),
+    )
+    record_rate_limits(response.http_response.headers)
+
+
+class CallMetricsPolicy(SansIOHTTPPolicy):
+    """Counts the calls of an Azure SDK client, runs once per call before the retry policy."""
+
+    def on_request(self, request: PipelineRequest):
+        http_request = request.http_request
+        record_call(http_request.method, http_request.url)
+
+
+class TryMetricsPolicy(SansIOHTTPPolicy):
+    """Measures every try of a call, runs after the retry policy."""
+
+    def on_request(self, request: PipelineRequest):
+        on_request(request)
+
+    def on_response(self, request: PipelineRequest, response: PipelineResponse):
+        on_response(response)
+
+
+def on_raw_request(request: PipelineRequest):
+    # The data plane clients only take raw hooks, which run on every try: their calls
+    # are counted as tries, so their retries do not show up.
+    http_request = request.http_request
+    record_call(http_request.method, http_request.url)
+    on_request(request)
+
+
+def record_msrest_response(response: Any, *args: Any, **kwargs: Any):
+    """A `requests` response hook measuring the requests of the msrest based clients."""
+    request = response.request
+    record_call(request.method, response.url)
+    record_try(
+        request.method,
+        response.url,
+        response.status_code,
+        response.elapsed.total_seconds() * 1000,
+        _content_length(request.headers),
+        _content_length(response.headers),
+    )
+    record_rate_limits(response.headers)
+
+
+def get_metrics() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        return {endpoint: endpoint_metrics.to_dict() for endpoint, endpoint_metrics in sorted(_endpoints.items())}
+
+
+def log_summary(logger: logging.Logger):
+    metrics = get_metrics()
+    if not metrics:
+        return
+    rows: List[List[str]] = [["Endpoint", "Calls", "Retries", "429", "5xx", "Avg ms", "Sent", "Received"]]
+    for endpoint, endpoint_metrics in metrics.items():
+        avg_ms = endpoint_metrics["latency_ms_total"] / max(endpoint_metrics["tries"], 1)
+        rows.append(
+            [
+                endpoint,
+                str(endpoint_metrics["calls"]),
+                str(endpoint_metrics["retries"]),
+                str(endpoint_metrics["throttled"]),
+                str(endpoint_metrics["server_errors"]),
+                f"{avg_ms:.0f}",
+                str(endpoint_metrics["bytes_sent"]),
+                str(endpoint_metrics["bytes_received"]),
+            ]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows]
+    logger.info("Azure requests of the run:\n" + "\n".join(lines))
+    with _lock:
+        rate_limits = dict(_rate_limit_remaining)
+    for header, remaining in sorted(rate_limits.items()):
+        logger.info(f"Lowest '{header}' of the run: {remaining}")
+
+
+def export(path: str):
+    with _lock:
+        rate_limits = dict(_rate_limit_remaining)
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "latency_buckets_ms": list(LATENCY_BUCKETS_MS),
+                "endpoints": get_metrics(),
+                "rate_limit_remaining_min": rate_limits,
+            },
+            f,
+            indent=2,
+        )
@@ -0,0 +1,108 @@
+import datetime
+import json
+import logging
+import os
+from typing import Any, Dict, List, Set
+
+from .state import fingerprint_path
+
+JOURNAL_FILE_VERSION = 1
+# Extension of the journal file, appended to the path of the device IDs file.
+JOURNAL_EXTENSION = ".journal"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def get_journal_path(device_ids_file_path: str) -> str:
+    return f"{device_ids_file_path}{JOURNAL_EXTENSION}"
+
+
+def get_run(
+    iot_hub_name: str, device_ids_file_path: str, is_edge_device: bool, is_iiot_device: bool, batch_size: int
+) -> Dict[str, Any]:
+    """What the batches of an onboarding run depend on, to tell whether a journal can be resumed."""
+    return {
+        "iot_hub_name": iot_hub_name,
+        "device_ids": fingerprint_path(device_ids_file_path),
+        "is_edge_device": is_edge_device,
+        "is_iiot_device": is_iiot_device,
+        "batch_size": batch_size,
+    }
+
+
+class OnboardJournal:
+    """Append-only JSON lines record of the batches of devices an onboarding run has finished.
+
+    The first line describes the run: the IoT Hub, the options and the fingerprint of the device
+    IDs file, so that the batches, numbered in the order of the file, are only skipped by a run
+    that would form the very same ones. Each next line is a batch, written once its devices are
+    registered, tagged and their keys durably in the key store, with the range of device IDs it
+    covers and its outcome.
+    """
+
+    def __init__(self, path: str, run: Dict[str, Any], resume: bool, logger: logging.Logger):
+        self.path = path
+        self._logger = logger
+        self._header = {"version": JOURNAL_FILE_VERSION, "run": run}
+        # Indexes of the batches completed by the previous runs, without any failed device.
+        self.completed: Set[int] = set()
+        if resume:
+            self._load()
+        mode = "a" if self.completed else "w"
+        self._file = open(path, mode)
+        if mode == "w":
+            self._append(self._header)
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            self._logger.info(f"There is no onboarding journal '{self.path}' to resume from")
+            return
+        with open(self.path, "r") as f:
+            header = f.readline()
+            if not header.endswith("\n") or json.loads(header) != self._header:
+                self._logger.warning(
+                    f"Ignoring onboarding journal '{self.path}', written by a run of other devices or options"
+                )
+                return
+            for line in f:
+                # A line cut by a crash is not a complete record.
+                if line.endswith("\n"):
+                    batch = json.loads(line)
+                    if batch["outcome"] == COMPLETED:
+                        self.completed.add(batch["batch"])
+        self._logger.info(f"Resuming after the {len(self.completed)} batches completed in '{self.path}'")
+
+    def _append(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def record(
+        self,
+        index: int,
+        device_ids: List[str],
+        registered: int,
+        already_registered: int,
+        failed: int,
+        keys_written: int,
+        tag_failed: int = 0,
+    ):
+        self._append(
+            {
+                "batch": index,
+                "first_device_id": device_ids[0],
+                "last_device_id": device_ids[-1],
+                "devices": len(device_ids),
+                "outcome": FAILED if failed or tag_failed else COMPLETED,
+                "registered": registered,
+                "already_registered": already_registered,
+                "failed": failed,
+                "tag_failed": tag_failed,
+                "keys_written": keys_written,
+                "completed_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }
+        )
+
+    def close(self):
+        self._file.close()
+
@@ -0,0 +1,232 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from . import tracing
+from .state import DeploymentState
+
+
+class Node(NamedTuple):
+    name: str
+    # A plain callable for `run`, a callable returning an awaitable for `run_async`.
+    func: Callable[[], Any]
+    # Names of the nodes that must complete before this one starts. Dependencies that are
+    # not part of the graph being run are considered to be already satisfied (e.g. the
+    # resource group when only `deploy iiot` runs).
+    deps: Tuple[str, ...] = ()
+
+
+def in_thread(func: Callable[..., Any], *args: Any) -> Callable[[], Awaitable[Any]]:
+    """Wrap a blocking function into a node function for `run_async`."""
+
+    def _node_func() -> Awaitable[Any]:
+        # The executor does not propagate the context (e.g. the current trace span) by itself.
+        return asyncio.get_running_loop().run_in_executor(
+            None, contextvars.copy_context().run, functools.partial(func, *args)
+        )
+
+    return _node_func
+
+
+class StepDetached(Exception):
+    """Raised by a step that submitted its long-running operation without waiting for it.
+
+    The step is neither completed nor failed: the steps depending on it are not started,
+    the others run as usual.
+    """
+
+
+class _StepExit(Exception):
+    # asyncio lets SystemExit escape from the event loop, which would bypass the failure
+    # policy of `run_async`, so it is carried through the task as a regular exception.
+    def __init__(self, exit_exc: SystemExit):
+        super().__init__(exit_exc)
+        self.exit_exc = exit_exc
+
+
+def _run_node(name: str, func: Callable[[], Any]) -> Any:
+    with tracing.span(f"step {name}", step=name):
+        return func()
+
+
+async def _run_node_async(name: str, func: Callable[[], Awaitable[Any]]) -> Any:
+    try:
+        with tracing.span(f"step {name}", step=name):
+            return await func()
+    except SystemExit as e:
+        raise _StepExit(e)
+
+
+def _check_acyclic(waiting: Dict[str, Set[str]]):
+    # Kahn's algorithm: repeatedly remove nodes without unresolved dependencies.
+    resolved: Set[str] = set()
+    remaining = dict(waiting)
+    while remaining:
+        ready = [name for name, deps in remaining.items() if deps <= resolved]
+        if not ready:
+            raise ValueError("Dependency cycle between steps: {}".format(", ".join(sorted(remaining))))
+        for name in ready:
+            del remaining[name]
+            resolved.add(name)
+
+
+def _build_graph(nodes: Iterable[Node]) -> Tuple[Dict[str, Node], Dict[str, Set[str]]]:
+    nodes_by_name: Dict[str, Node] = {}
+    for node in nodes:
+        if node.name in nodes_by_name:
+            raise ValueError(f"Duplicate step name '{node.name}'")
+        nodes_by_name[node.name] = node
+    waiting = {name: {dep for dep in node.deps if dep in nodes_by_name} for name, node in nodes_by_name.items()}
+    _check_acyclic(waiting)
+    return nodes_by_name, waiting
+
+
+def _pop_ready(waiting: Dict[str, Set[str]], completed: Set[str]) -> List[str]:
+    ready = [name for name, deps in waiting.items() if deps <= completed]
+    for name in ready:
+        del waiting[name]
+    return ready
+
+
+def _pop_ready_to_run(
+    nodes_by_name: Dict[str, Node],
+    waiting: Dict[str, Set[str]],
+    completed: Set[str],
+    state: Optional[DeploymentState],
+    logger: logging.Logger,
+) -> List[str]:
+    # Steps that are up to date according to the deployment state complete right away,
+    # which can make further steps ready.
+    to_run: List[str] = []
+    ready = _pop_ready(waiting, completed)
+    while ready:
+        for name in ready:
+            if state is not None and state.is_current(name, nodes_by_name[name].deps):
+                logger.info(f"Step '{name}' is up to date, skipping it")
+                completed.add(name)
+            else:
+                to_run.append(name)
+        ready = _pop_ready(waiting, completed)
+    return to_run
+
+
+def _raise_failures(
+    failures: Dict[str, BaseException],
+    cancelled: List[str],
+    detached: List[str],
+    logger: logging.Logger,
+    not_started: Iterable[str] = (),
+):
+    if detached:
+        logger.info("Steps detached from their operations: {}".format(", ".join(sorted(detached))))
+    if not failures and not_started:
+        # Nothing failed, yet steps whose dependencies completed were left, e.g. with no room to run any step.
+        raise RuntimeError("Steps ready but never started: {}".format(", ".join(sorted(not_started))))
+    if not failures:
+        if cancelled:
+            logger.info("Steps waiting for the detached operations: {}".format(", ".join(sorted(cancelled))))
+        return
+    if cancelled:
+        logger.error("Steps not run because of the failure: {}".format(", ".join(sorted(cancelled))))
+    raise next(iter(failures.values()))
+
+
+def run(
+    nodes: Iterable[Node],
+    max_parallel: int,
+    logger: logging.Logger,
+    state: Optional[DeploymentState] = None,
+):
+    """Run the nodes of a dependency graph, at most `max_parallel` of them at a time.
+
+    A node is started as soon as all of its dependencies have completed. When a node fails,
+    no further nodes are started and the ones queued but not yet running are cancelled. The
+    nodes already running are let to finish, since their Azure operations cannot be aborted
+    half-way. The exception of the first failed node is then re-raised.
+
+    With a deployment `state`, the nodes it reports as up to date are skipped and the ones
+    that complete are recorded in it. The nodes depending on a node that raised
+    `StepDetached` are not started.
+    """
+    nodes_by_name, waiting = _build_graph(nodes)
+    completed: Set[str] = set()
+    cancelled: List[str] = []
+    failures: Dict[str, BaseException] = {}
+    detached: List[str] = []
+    running: Dict[Future, str] = {}
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="step") as executor:
+        while True:
+            if not failures:
+                for name in _pop_ready_to_run(nodes_by_name, waiting, completed, state, logger):
+                    logger.debug(f"Starting step '{name}'")
+                    future = executor.submit(contextvars.copy_context().run, _run_node, name, nodes_by_name[name].func)
+                    running[future] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.cancelled():
+                    cancelled.append(name)
+                elif isinstance(future.exception(), StepDetached):
+                    detached.append(name)
+                    logger.info(f"Step '{name}' detached from {future.exception()}")
+                elif future.exception() is not None:
+                    failures[name] = future.exception()
+                    logger.error(f"Step '{name}' failed: {future.exception()!r}")
+                    # Cancel everything that has not started yet.
+                    for other in running:
+                        other.cancel()
+                else:
+                    completed.add(name)
+                    if state is not None:
+                        state.record(name, nodes_by_name[name].deps, future.result())
+                    logger.debug(f"Finished step '{name}'")
+    _raise_failures(failures, cancelled + list(waiting), detached, logger)
+
+
+async def run_async(
+    nodes: Iterable[Node],
+    max_parallel: int,
+    logger: logging.Logger,
+    state: Optional[DeploymentState] = None,
+):
+    """Same as `run`, but for nodes whose functions return awaitables.
+
+    All nodes share the running event loop, `max_parallel` only bounds how many of them are
+    in flight at the same time.
+    """
+    nodes_by_name, waiting = _build_graph(nodes)
+    completed: Set[str] = set()
+    ready: List[str] = []
+    failures: Dict[str, BaseException] = {}
+    detached: List[str] = []
+    running: Dict[asyncio.Future, str] = {}
+    while True:
+        if not failures:
+            ready.extend(_pop_ready_to_run(nodes_by_name, waiting, completed, state, logger))
+            while ready and len(running) < max_parallel:
+                name = ready.pop(0)
+                logger.debug(f"Starting step '{name}'")
+                running[asyncio.ensure_future(_run_node_async(name, nodes_by_name[name].func))] = name
+        if not running:
+            break
+        finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for future in finished:
+            name = running.pop(future)
+            exc = future.exception()
+            if isinstance(exc, StepDetached):
+                detached.append(name)
+                logger.info(f"Step '{name}' detached from {exc}")
+            elif exc is not None:
+                failures[name] = exc.exit_exc if isinstance(exc, _StepExit) else exc
+                logger.error(f"Step '{name}' failed: {failures[name]!r}")
+            else:
+                completed.add(name)
+                if state is not None:
+                    state.record(name, nodes_by_name[name].deps, future.result())
+                logger.debug(f"Finished step '{name}'")
+    _raise_failures(failures, ready + list(waiting), detached, logger, ready)
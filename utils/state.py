@@ -0,0 +1,134 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+STATE_FILE_VERSION = 1
+
+
+class StepSpec(NamedTuple):
+    # Everything the outcome of the step depends on, besides the outputs of its dependencies.
+    inputs: Dict[str, Any]
+    # (resource type, name) of the Azure resources provisioned by the step, re-checked by `verify`.
+    resources: Tuple[Tuple[str, str], ...] = ()
+
+
+def fingerprint(value: Any) -> str:
+    serialized = json.dumps(value, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def fingerprint_path(path: Optional[str]) -> str:
+    """Fingerprint of the contents of a file, or of all files under a folder.
+
+    The '.git' folders are ignored, since the function app deployment recreates the one in
+    the functions code folder on each run.
+    """
+    if not path or not os.path.exists(path):
+        return ""
+    digest = hashlib.sha256()
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = []
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names[:] = sorted(dir_name for dir_name in dir_names if dir_name != ".git")
+            files.extend(os.path.join(dir_path, file_name) for file_name in sorted(file_names))
+    for file_path in files:
+        digest.update(os.path.relpath(file_path, path).encode("utf-8"))
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_state_path(state_dir: str, azure_subscription_id: str, resource_group_name: str) -> str:
+    return os.path.join(state_dir, azure_subscription_id, f"{resource_group_name.lower()}.json")
+
+
+class DeploymentState:
+    """Persistent record of the deployment steps completed for one resource group.
+
+    For each step it stores the fingerprint of its inputs, the fingerprint of its outputs and
+    when it completed. The inputs fingerprint of a step also covers the outputs of its
+    dependencies, so a step is run again whenever one of its dependencies actually ran. Steps
+    without a `StepSpec` are not tracked and always run.
+    """
+
+    def __init__(self, path: str, specs: Dict[str, StepSpec], logger: logging.Logger):
+        self._path = path
+        self._specs = specs
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._steps: Dict[str, Dict[str, str]] = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self._path):
+            return
+        try:
+            with open(self._path, "r") as f:
+                content = json.load(f)
+        except (OSError, ValueError) as e:
+            self._logger.warning(f"Ignoring unreadable deployment state file '{self._path}': {e}")
+            return
+        if content.get("version") != STATE_FILE_VERSION:
+            self._logger.warning(f"Ignoring deployment state file '{self._path}' of an unknown version")
+            return
+        self._steps = content.get("steps", {})
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": STATE_FILE_VERSION, "steps": self._steps}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._path)
+
+    def _inputs_fingerprint(self, name: str, deps: Iterable[str]) -> str:
+        dep_outputs = {dep: self._steps.get(dep, {}).get("outputs") for dep in deps}
+        return fingerprint({"inputs": self._specs[name].inputs, "deps": dep_outputs})
+
+    def is_current(self, name: str, deps: Iterable[str]) -> bool:
+        with self._lock:
+            if name not in self._specs or name not in self._steps:
+                return False
+            return self._steps[name].get("inputs") == self._inputs_fingerprint(name, deps)
+
+    def record(self, name: str, deps: Iterable[str], result: Any):
+        with self._lock:
+            if name not in self._specs:
+                return
+            completed_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            self._steps[name] = {
+                "inputs": self._inputs_fingerprint(name, deps),
+                # A step that ran is considered to have new outputs, even if its result is the
+                # same, so that its dependents are brought up to date as well.
+                "outputs": fingerprint({"result": result, "completed_at": completed_at}),
+                "completed_at": completed_at,
+            }
+            self._save()
+
+    def invalidate(self, name: str):
+        with self._lock:
+            if self._steps.pop(name, None) is not None:
+                self._save()
+
+    def verify(self, resource_exists: Callable[[str, str], bool]):
+        """Forget the steps whose Azure resources no longer exist.
+
+        `resource_exists` is called with the type and name of each resource recorded by the
+        steps, e.g. `Inventory.contains`.
+        """
+        for name, spec in self._specs.items():
+            missing = [res_name for res_type, res_name in spec.resources if not resource_exists(res_type, res_name)]
+            if missing and name in self._steps:
+                self._logger.info(f"Step '{name}' will run again, missing resources: {', '.join(missing)}")
+                self.invalidate(name)
+
+    def clear(self):
+        with self._lock:
+            self._steps = {}
+            self._save()
@@ -0,0 +1,205 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+# Classes of endpoints, each with its own limiter shared by all the clients of the run.
+ARM_READS = "arm-reads"
+ARM_WRITES = "arm-writes"
+IOT_HUB = "iot-hub"
+IOT_HUB_QUERIES = "iot-hub-queries"
+# Requests per second and bucket size: the regional ARM token buckets refill at 25 reads and
+# 10 writes per second, an S1 IoT Hub unit allows 100 identity registry operations and 20
+# queries per minute.
+DEFAULT_RATES = {ARM_READS: 25.0, ARM_WRITES: 10.0, IOT_HUB: 100 / 60, IOT_HUB_QUERIES: 20 / 60}
+BURSTS = {ARM_READS: 250, ARM_WRITES: 200, IOT_HUB: 10, IOT_HUB_QUERIES: 5}
+REMAINING_HEADERS = {
+    ARM_READS: "x-ms-ratelimit-remaining-subscription-reads",
+    ARM_WRITES: "x-ms-ratelimit-remaining-subscription-writes",
+}
+READ_METHODS = {"GET", "HEAD"}
+THROTTLED_STATUS_CODES = {429, 503}
+# Below this many remaining requests of the ARM subscription budget, the rate goes down with it.
+LOW_REMAINING = 1000
+MIN_RATE_FACTOR = 0.05
+# Pause of a class of endpoints after a throttled response without a Retry-After header.
+DEFAULT_THROTTLE_PAUSE = 1.0
+MAX_RETRIES = 10
+_WAIT_INTERVAL = 0.01
+
+T = TypeVar("T")
+
+
+def _get_retry_after(headers: Any) -> Optional[float]:
+    import email.utils
+
+    if headers is None:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("x-ms-retry-after-ms", 0.001), ("Retry-After", 1.0)):
+        value = headers.get(header)
+        if not value:
+            continue
+        try:
+            return float(value) * scale
+        except ValueError:
+            pass
+        try:
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+class Limiter:
+    """Token bucket of a class of endpoints, with an adaptive limit of the requests in flight.
+
+    The limit of the requests in flight is halved on every throttled response and grows by one
+    after as many successful responses as the limit, i.e. additive increase, multiplicative
+    decrease. A Retry-After header pauses the whole class of endpoints until it passes.
+    """
+
+    def __init__(self, rate: float, burst: int, max_concurrency: int, remaining_header: Optional[str] = None):
+        # A rate of 0 means no rate limit.
+        self.base_rate = rate
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = max_concurrency
+        self.throttled = 0
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._successes = 0
+        self._remaining_header = remaining_header
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token and a slot if possible, returning 0, otherwise the seconds to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._in_flight >= self.concurrency_limit:
+                return _WAIT_INTERVAL
+            if self.rate > 0:
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens < 1:
+                    return (1 - self._tokens) / self.rate
+                self._tokens -= 1
+            self._in_flight += 1
+            return 0.0
+
+    def acquire(self):
+        wait = self.try_acquire()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+    async def acquire_async(self):
+        # Not imported at the top: this module is loaded by the argument parsers, before any subcommand runs.
+        import asyncio
+
+        wait = self.try_acquire()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.try_acquire()
+
+    def release(self, status_code: Optional[int], headers: Any = None):
+        """Give the slot back, adapting the limits to the response (None if there was none)."""
+        with self._lock:
+            self._in_flight -= 1
+            if status_code in THROTTLED_STATUS_CODES:
+                self.throttled += 1
+                self.concurrency_limit = max(1, self.concurrency_limit // 2)
+                self._successes = 0
+                pause = _get_retry_after(headers) or DEFAULT_THROTTLE_PAUSE
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            elif status_code is not None and status_code < 500:
+                self._successes += 1
+                if self._successes >= self.concurrency_limit and self.concurrency_limit < self.max_concurrency:
+                    self.concurrency_limit += 1
+                    self._successes = 0
+            if self._remaining_header and headers is not None and self.base_rate > 0:
+                remaining = headers.get(self._remaining_header)
+                if remaining is not None and remaining.isdigit():
+                    self.rate = self.base_rate * min(1.0, max(int(remaining) / LOW_REMAINING, MIN_RATE_FACTOR))
+
+
+_lock = threading.Lock()
+_limiters: Dict[str, Limiter] = {}
+_rates = dict(DEFAULT_RATES)
+# As many as the connections of the pools, see `clients.POOL_MAXSIZE`.
+_max_concurrency = 64
+
+
+def configure(rates: Dict[str, Optional[float]], max_concurrency: int):
+    """Set the rates (requests per second, 0 for no limit, None for the default) of the classes of endpoints.
+
+    Must be called before any request.
+    """
+    global _max_concurrency
+    with _lock:
+        _rates.update((kind, rate) for kind, rate in rates.items() if rate is not None)
+        _max_concurrency = max_concurrency
+        _limiters.clear()
+
+
+def set_rate(kind: str, rate: float):
+    """Change the rate of a class of endpoints, e.g. once the quota of the IoT Hub is known."""
+    with _lock:
+        _rates[kind] = rate
+        limiter = _limiters.get(kind)
+    if limiter is not None:
+        with limiter._lock:
+            limiter.base_rate = limiter.rate = rate
+
+
+def get_limiter(kind: str) -> Limiter:
+    with _lock:
+        limiter = _limiters.get(kind)
+        if limiter is None:
+            limiter = _limiters[kind] = Limiter(
+                _rates[kind], BURSTS[kind], _max_concurrency, REMAINING_HEADERS.get(kind)
+            )
+    return limiter
+
+
+def get_arm_limiter(method: str) -> Limiter:
+    return get_limiter(ARM_READS if method in READ_METHODS else ARM_WRITES)
+
+
+def call(kind: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Call an msrest based client (e.g. the IoT Hub registry manager) through the limiter of `kind`.
+
+    These clients do not retry throttled requests, so they are retried here, once the limiter
+    is not paused anymore.
+    """
+    limiter = get_limiter(kind)
+    for attempt in itertools.count():
+        limiter.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            # The msrest `HttpOperationError`s carry the `requests` response.
+            response = getattr(e, "response", None)
+            status_code = getattr(response, "status_code", None)
+            limiter.release(status_code, getattr(response, "headers", None))
+            if status_code not in THROTTLED_STATUS_CODES or attempt >= MAX_RETRIES:
+                raise e
+            continue
+        limiter.release(200)
+        return result
+
+
+def log_summary(logger: logging.Logger):
+    with _lock:
+        limiters = dict(_limiters)
+    for kind, limiter in sorted(limiters.items()):
+        if limiter.throttled:
+            logger.info(
+                f"'{kind}' requests were throttled {limiter.throttled} times, ending with at most "
+                f"{limiter.concurrency_limit} in flight and {limiter.rate:.2f} per second"
+            )
@@ -0,0 +1,206 @@
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+from azure.core.pipeline import PipelineRequest, PipelineResponse
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+
+SERVICE_NAME = "iot-deployment"
+_HTTP_START_KEY = "tracing_start_ns"
+_lanes = itertools.count(1)
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent = parent
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        # Chrome trace lanes: every child of the root span (i.e. every step) and everything under
+        # it gets its own lane, so that the concurrent steps of the asyncio run, which share a
+        # single thread, do not overlap.
+        if parent is None:
+            self.lane = 0
+        elif parent.parent is None:
+            self.lane = next(_lanes)
+        else:
+            self.lane = parent.lane
+
+
+_lock = threading.Lock()
+_enabled = False
+_trace_id = ""
+_spans: List[Span] = []
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def enable():
+    global _enabled, _trace_id
+    _enabled = True
+    _trace_id = f"{random.getrandbits(128):032x}"
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _start_span(name: str, attributes: Dict[str, Any], parent: Optional[Span]) -> Span:
+    span = Span(name, _trace_id, parent, attributes)
+    with _lock:
+        _spans.append(span)
+    return span
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Record the enclosed block as a span, child of the current span of the context."""
+    if not _enabled:
+        yield None
+        return
+    current = _start_span(name, attributes, _current_span.get())
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = repr(e)
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+def annotate(**attributes: Any):
+    """Add attributes to the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def on_request(request: PipelineRequest):
+    if _enabled:
+        request.context[_HTTP_START_KEY] = (time.time_ns(), _current_span.get())
+
+
+def on_response(response: PipelineResponse):
+    start = response.context.get(_HTTP_START_KEY)
+    if start is None:
+        return
+    start_ns, parent = start
+    http_request = response.http_request
+    url = urlparse(http_request.url)
+    http_span = _start_span(
+        f"{http_request.method} {url.path}",
+        {
+            "http.method": http_request.method,
+            "http.host": url.netloc,
+            "http.status_code": response.http_response.status_code,
+        },
+        parent,
+    )
+    http_span.start_ns = start_ns
+    http_span.end_ns = time.time_ns()
+
+
+class HttpTracingPolicy(SansIOHTTPPolicy):
+    """Records every HTTP request (each retry included) of an Azure SDK client as a span."""
+
+    def on_request(self, request: PipelineRequest):
+        on_request(request)
+
+    def on_response(self, request: PipelineRequest, response: PipelineResponse):
+        on_response(response)
+
+
+def record_msrest_response(response: Any, *args: Any, **kwargs: Any):
+    """A `requests` response hook recording the requests of the msrest based clients."""
+    if not _enabled:
+        return
+    end_ns = time.time_ns()
+    url = urlparse(response.url)
+    http_span = _start_span(
+        f"{response.request.method} {url.path}",
+        {"http.method": response.request.method, "http.host": url.netloc, "http.status_code": response.status_code},
+        _current_span.get(),
+    )
+    http_span.start_ns = end_ns - int(response.elapsed.total_seconds() * 1e9)
+    http_span.end_ns = end_ns
+
+
+def _finished_spans() -> List[Span]:
+    with _lock:
+        return [span for span in _spans if span.end_ns is not None]
+
+
+def _to_chrome_trace(spans: List[Span]) -> Dict[str, Any]:
+    events = []
+    for span in spans:
+        events.append(
+            {
+                "name": span.name,
+                "cat": span.name.split(" ", 1)[0],
+                "ph": "X",
+                "ts": span.start_ns / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "pid": os.getpid(),
+                "tid": span.lane,
+                "args": span.attributes,
+            }
+        )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def _to_otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp(spans: List[Span]) -> Dict[str, Any]:
+    # The JSON encoding of an OTLP ExportTraceServiceRequest, as written by the file exporters.
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _to_otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": 2 if "error" in span.attributes else 1},
+        }
+        if span.parent is not None:
+            otlp_span["parentSpanId"] = span.parent.span_id
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": otlp_spans}],
+            }
+        ]
+    }
+
+
+def export(chrome_trace_path: Optional[str], otlp_path: Optional[str]):
+    spans = _finished_spans()
+    if chrome_trace_path:
+        with open(chrome_trace_path, "w") as f:
+            json.dump(_to_chrome_trace(spans), f, default=str)
+    if otlp_path:
+        with open(otlp_path, "w") as f:
+            json.dump(_to_otlp(spans), f, default=str)